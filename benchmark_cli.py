@@ -0,0 +1,559 @@
+#!/usr/bin/env python3
+"""
+Qube Admin CLI - Benchmark
+Sobe uma API Qube simulada localmente e mede inicialização, latência por
+operação e vazão dos fluxos em lote da CLI. O resultado é emitido em JSON
+para comparação entre versões.
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional, Dict, Any, Callable, List
+from urllib.parse import urlparse, parse_qs
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+COMPANY_ID = "bench-company"
+
+
+class MockQubeHandler(BaseHTTPRequestHandler):
+    """Implementa os endpoints da API Qube usados pela CLI"""
+    protocol_version = "HTTP/1.1"
+    # Cabeçalhos e corpo saem em segmentos separados; sem isso o delayed ACK soma ~40ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _enviar(self, status: int, corpo: Any = None, headers: Optional[Dict[str, str]] = None):
+        dados = json.dumps(corpo).encode("utf-8") if corpo is not None else b""
+        self.send_response(status)
+        if corpo is not None:
+            self.send_header("Content-Type", "application/json")
+        for nome, valor in (headers or {}).items():
+            self.send_header(nome, valor)
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _corpo(self) -> Dict[str, Any]:
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        if not tamanho:
+            return {}
+        try:
+            return json.loads(self.rfile.read(tamanho))
+        except ValueError:
+            return {}
+
+    def _rota(self):
+        url = urlparse(self.path)
+        endpoint = url.path.split("/api/v1/", 1)[-1]
+        return endpoint, {k: v[0] for k, v in parse_qs(url.query).items()}
+
+    def _simular_rede(self) -> bool:
+        """Aplica a latência configurada; retorna False se a requisição deve falhar"""
+        api = self.server.api
+        atraso = api.latencia + random.uniform(0, api.jitter)
+        if atraso > 0:
+            time.sleep(atraso)
+        if api.taxa_erro and random.random() < api.taxa_erro:
+            api.contar("erro_injetado")
+            self._enviar(503, {"detail": "Erro simulado"}, {"Retry-After": "0"})
+            return False
+        if not api.permitir():
+            api.contar("limitado_429")
+            self._enviar(429, {"detail": "Too Many Requests"}, {"Retry-After": "1"})
+            return False
+        return True
+
+    def do_GET(self):
+        endpoint, params = self._rota()
+        api = self.server.api
+        api.contar(f"GET {endpoint.split('/')[0]}")
+        if not self._simular_rede():
+            return
+
+        if endpoint == "users/me":
+            return self._enviar(200, api.admin)
+
+        if endpoint == "admin/users":
+            with api.lock:
+                usuarios = list(api.usuarios)
+            busca = (params.get("search") or "").lower()
+            if busca:
+                usuarios = [u for u in usuarios if busca in u["email"].lower() or busca in u["name"].lower()]
+            if "limit" in params:
+                limite = int(params["limit"])
+                inicio = int(params["skip"]) if "skip" in params else (int(params.get("page", 1)) - 1) * limite
+                usuarios = usuarios[inicio:inicio + limite]
+            return self._enviar(200, usuarios)
+
+        if endpoint == "agents/":
+            etag = f'"{api.versao_agents}"'
+            if self.headers.get("If-None-Match") == etag:
+                return self._enviar(304, headers={"ETag": etag})
+            with api.lock:
+                agents = [dict(a, assigned_users=list(a["assigned_users"])) for a in api.agents.values()]
+            return self._enviar(200, agents, {"ETag": etag})
+
+        if endpoint.startswith("agents/"):
+            agent = api.agents.get(endpoint.split("/")[1])
+            return self._enviar(200, agent) if agent else self._enviar(404, {"detail": "Agent não encontrado"})
+
+        self._enviar(404, {"detail": "Not Found"})
+
+    def do_POST(self):
+        endpoint, _ = self._rota()
+        api = self.server.api
+        api.contar(f"POST {endpoint.split('/')[0]}")
+        # O corpo é consumido antes da falha simulada para não contaminar a conexão keep-alive
+        dados = self._corpo()
+        if not self._simular_rede():
+            return
+
+        if endpoint == "auth/login":
+            return self._enviar(200, {"access_token": "bench-token", "token_type": "bearer"})
+
+        if endpoint == "auth/change-password":
+            return self._enviar(200, {"success": True})
+
+        if endpoint == "users/":
+            with api.lock:
+                if dados.get("email") in api.emails:
+                    return self._enviar(409, {"detail": "Email já cadastrado"})
+                usuario = {
+                    "id": f"u{len(api.usuarios)}",
+                    "name": dados.get("name"),
+                    "email": dados.get("email"),
+                    "status": "active",
+                    "company_id": dados.get("company_id"),
+                }
+                api.usuarios.append(usuario)
+                api.emails.add(usuario["email"])
+            return self._enviar(201, usuario)
+
+        if endpoint.startswith("agents/") and endpoint.endswith("/assign"):
+            with api.lock:
+                agent = api.agents.get(endpoint.split("/")[1])
+                if not agent:
+                    return self._enviar(404, {"detail": "Agent não encontrado"})
+                if dados.get("user_id") in agent["assigned_users"]:
+                    return self._enviar(409, {"detail": "Usuário já associado"})
+                agent["assigned_users"].append(dados.get("user_id"))
+                api.versao_agents += 1
+            return self._enviar(200, {"success": True})
+
+        self._enviar(404, {"detail": "Not Found"})
+
+
+class MockQubeAPI:
+    """API Qube simulada em memória, servida em uma thread local"""
+
+    def __init__(self, usuarios: int = 1000, agents: int = 20, latencia: float = 0.0,
+                 jitter: float = 0.0, taxa_erro: float = 0.0, porta: int = 0, limite_taxa: float = 0.0):
+        self.latencia = latencia
+        self.jitter = jitter
+        self.taxa_erro = taxa_erro
+        # Limite de requisições/s da API (token bucket de 1s); acima dele responde 429
+        self.limite_taxa = limite_taxa
+        self._tokens = limite_taxa
+        self._ultimo = time.monotonic()
+        self.lock = threading.Lock()
+        self.contadores: Dict[str, int] = {}
+        self.admin = {
+            "id": "bench-admin",
+            "name": "Benchmark Admin",
+            "email": "admin@bench.local",
+            "role": "COMPANY_ADMIN",
+            "company_id": COMPANY_ID,
+        }
+        self.usuarios = [
+            {"id": f"u{i}", "name": f"Usuário {i}", "email": f"usuario{i}@bench.local",
+             "status": "active", "company_id": COMPANY_ID}
+            for i in range(usuarios)
+        ]
+        self.emails = {u["email"] for u in self.usuarios}
+        self.agents = {
+            f"a{i}": {"id": f"a{i}", "name": f"Worker {i}", "status": "running", "assigned_users": []}
+            for i in range(agents)
+        }
+        self.versao_agents = 1
+        self._server = ThreadingHTTPServer(("127.0.0.1", porta), MockQubeHandler)
+        self._server.daemon_threads = True
+        self._server.api = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, porta = self._server.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    def permitir(self) -> bool:
+        if not self.limite_taxa:
+            return True
+        with self.lock:
+            agora = time.monotonic()
+            self._tokens = min(self.limite_taxa, self._tokens + (agora - self._ultimo) * self.limite_taxa)
+            self._ultimo = agora
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def contar(self, chave: str):
+        with self.lock:
+            self.contadores[chave] = self.contadores.get(chave, 0) + 1
+
+    def start(self) -> "MockQubeAPI":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil por interpolação linear (valores já ordenados)"""
+    if not valores:
+        return 0.0
+    posicao = (len(valores) - 1) * p / 100
+    inferior = int(posicao)
+    superior = min(inferior + 1, len(valores) - 1)
+    return valores[inferior] + (valores[superior] - valores[inferior]) * (posicao - inferior)
+
+
+def resumir(amostras: List[float], erros: int = 0) -> Dict[str, Any]:
+    """Estatísticas de latência em milissegundos"""
+    ordenadas = sorted(s * 1000 for s in amostras)
+    return {
+        "n": len(ordenadas),
+        "erros": erros,
+        "min_ms": round(ordenadas[0], 3) if ordenadas else 0.0,
+        "media_ms": round(sum(ordenadas) / len(ordenadas), 3) if ordenadas else 0.0,
+        "p50_ms": round(percentil(ordenadas, 50), 3),
+        "p90_ms": round(percentil(ordenadas, 90), 3),
+        "p99_ms": round(percentil(ordenadas, 99), 3),
+        "max_ms": round(ordenadas[-1], 3) if ordenadas else 0.0,
+    }
+
+
+def medir(operacao: Callable[[int], Any], iteracoes: int,
+          preparar: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    """Executa a operação N vezes e resume a latência; retornos None contam como erro"""
+    amostras = []
+    erros = 0
+    for i in range(iteracoes):
+        if preparar:
+            preparar()
+        inicio = time.perf_counter()
+        resultado = operacao(i)
+        amostras.append(time.perf_counter() - inicio)
+        if resultado is None:
+            erros += 1
+    return resumir(amostras, erros)
+
+
+def medir_inicializacao(env: Dict[str, str], repeticoes: int) -> Dict[str, Any]:
+    """Tempo de processo novo até importar o módulo, instanciar a CLI e concluir um subcomando"""
+    comandos = {
+        "interpretador": ["-c", "pass"],
+        "import": ["-c", "import qube_admin_cli"],
+        "instancia": ["-c", "import qube_admin_cli; qube_admin_cli.QubeAdminCLI()"],
+        "comando_help": ["qube_admin_cli.py", "--help"],
+        "modulo_help": ["-m", "qube_admin_cli", "--help"],
+        "comando_user_list": ["qube_admin_cli.py", "-q", "user", "list", "--format", "jsonl"],
+    }
+    env = dict(env, QUBE_CLI_EMAIL="admin@bench.local", QUBE_CLI_PASSWORD="bench")
+    resultado = {}
+    for nome, argumentos in comandos.items():
+        amostras = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            subprocess.run([sys.executable] + argumentos, cwd=DIRETORIO, env=env, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            amostras.append(time.perf_counter() - inicio)
+        resultado[nome] = resumir(amostras)
+    return resultado
+
+
+def _usuario_sintetico(i: int) -> Dict[str, Any]:
+    """Usuário com os campos que admin/users devolve, não só os usados pela CLI"""
+    return {
+        "id": str(uuid.UUID(int=i)),
+        "name": f"Usuário Sintético {i}",
+        "email": f"usuario{i}@bench.local",
+        "status": "active",
+        "company_id": COMPANY_ID,
+        "role": "USER",
+        "created_at": "2025-01-01T00:00:00Z",
+        "updated_at": "2025-06-01T12:00:00Z",
+        "last_login": None,
+        "phone": f"+55 11 9{i:08d}",
+        "is_active": True,
+        "metadata": {"origem": "benchmark", "departamento": f"D{i % 50}"},
+    }
+
+
+def medir_memoria(qube: Any, usuarios: int, tamanho_pagina: int = 500) -> Dict[str, Any]:
+    """
+    Memória retida (tracemalloc) pela lista completa de usuários: dicts da API
+    x modelos compactos (User), carregando as mesmas páginas JSON.
+    """
+    paginas = [json.dumps([_usuario_sintetico(i) for i in range(inicio, min(usuarios, inicio + tamanho_pagina))])
+               for inicio in range(0, usuarios, tamanho_pagina)]
+
+    def carregar(converter: Callable[[list], list]) -> Dict[str, Any]:
+        gc.collect()
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        lista: list = []
+        for texto in paginas:
+            lista.extend(converter(json.loads(texto)))
+        segundos = time.perf_counter() - inicio
+        retido, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del lista
+        return {
+            "mb": round(retido / 2 ** 20, 1),
+            "pico_mb": round(pico / 2 ** 20, 1),
+            "bytes_por_usuario": retido // max(1, usuarios),
+            "segundos": round(segundos, 3),
+        }
+
+    dicts = carregar(lambda pagina: pagina)
+    modelos = carregar(qube.User.lista)
+    return {
+        "usuarios": usuarios,
+        "dicts": dicts,
+        "modelos": modelos,
+        "reducao": round(1 - modelos["mb"] / dicts["mb"], 3) if dicts["mb"] else 0.0,
+    }
+
+
+def executar_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    """Sobe a API simulada, configura a CLI para usá-la e coleta as métricas"""
+    with MockQubeAPI(args.usuarios, args.agents, args.latencia / 1000, args.jitter / 1000,
+                     args.taxa_erro, limite_taxa=args.limite_api) as api, tempfile.TemporaryDirectory() as tmp:
+        # A CLI lê a configuração do ambiente na importação
+        env = dict(os.environ)
+        env.update({
+            "API_HOST": api.url,
+            "QUBE_CLI_DISABLE_LOGS": "true",
+            "QUBE_CLI_DEBUG": "false",
+            "QUBE_CLI_SESSION_CACHE": "false",
+            "QUBE_CLI_CACHE_DIR": os.path.join(tmp, "cache"),
+            "QUBE_CLI_JOBS_DIR": os.path.join(tmp, "jobs"),
+            "QUBE_CLI_AUDIT_DB": os.path.join(tmp, "audit.db"),
+            "QUBE_CLI_ENGINE": args.engine,
+        })
+        os.environ.update(env)
+
+        inicializacao = medir_inicializacao(env, args.repeticoes_inicio)
+
+        sys.path.insert(0, DIRETORIO)
+        import qube_admin_cli as qube
+
+        cli = qube.QubeAdminCLI()
+        n = args.iteracoes
+        operacoes: Dict[str, Any] = {}
+
+        def login(_):
+            resposta = cli._make_request("POST", "auth/login",
+                                         {"email": api.admin["email"], "password": "bench"},
+                                         require_auth=False, quiet=True)
+            if not resposta:
+                return None
+            cli.token = resposta["access_token"]
+            cli.user_info = cli._make_request("GET", "users/me", quiet=True)
+            return cli.user_info
+
+        operacoes["login"] = medir(login, n)
+        if not cli.user_info:
+            raise RuntimeError(f"Login na API simulada falhou: {cli.last_error}")
+
+        operacoes["pagina_usuarios"] = medir(
+            lambda i: cli._buscar_pagina_usuarios(1, qube.DEFAULT_PAGE_SIZE, quiet=True), n,
+            preparar=cli.leituras.invalidar)
+        # A mesma página de novo, reaproveitada da memória da sessão (QUBE_CLI_MEMO_TTL)
+        operacoes["pagina_usuarios_repetida"] = medir(
+            lambda i: cli._buscar_pagina_usuarios(1, qube.DEFAULT_PAGE_SIZE, quiet=True), n)
+        operacoes["busca_usuarios_servidor"] = medir(
+            lambda i: cli._buscar_pagina_usuarios(1, qube.DEFAULT_PAGE_SIZE, search=f"usuario{i}", quiet=True), n)
+        operacoes["carregar_usuarios"] = medir(
+            lambda i: cli._carregar_usuarios(quiet=True), n, preparar=cli.invalidar_cache)
+        operacoes["carregar_usuarios_cache"] = medir(lambda i: cli._carregar_usuarios(quiet=True), n,
+                                                      preparar=cli.leituras.invalidar)
+        operacoes["listar_agents"] = medir(
+            lambda i: cli.listar_agents(quiet=True), n, preparar=cli.invalidar_cache)
+
+        usuarios = cli._carregar_usuarios(quiet=True) or []
+        inicio = time.perf_counter()
+        indice = qube.SearchIndex(usuarios)
+        construcao_indice = time.perf_counter() - inicio
+        operacoes["indice_construcao"] = resumir([construcao_indice])
+        operacoes["indice_busca"] = medir(lambda i: indice.buscar(f"usuario {i}") or [], n)
+
+        operacoes["criar_usuario"] = medir(
+            lambda i: cli._make_request("POST", "users/",
+                                        {"email": f"unitario{i}@bench.local", "name": f"Unitário {i}",
+                                         "password": "Bench@12345", "company_id": COMPANY_ID},
+                                        quiet=True, idempotency_key=uuid.uuid4().hex), n)
+        operacoes["associar"] = medir(
+            lambda i: cli._make_request("POST", "agents/a0/assign", {"user_id": f"u{i}"}, quiet=True), n)
+
+        # Lotes: arquivo gerado com emails novos
+        entrada = os.path.join(tmp, "lote.csv")
+        with open(entrada, "w", encoding="utf-8") as f:
+            f.write("email,name\n")
+            for i in range(args.lote):
+                f.write(f"lote{i}@bench.local,Lote {i}\n")
+
+        lote: Dict[str, Any] = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            inicio = time.perf_counter()
+            resumo = cli.criar_usuarios_lote(entrada, os.path.join(tmp, "criar.jsonl"), args.concorrencia)
+            lote["criar_usuarios"] = _vazao(args.lote, time.perf_counter() - inicio, resumo)
+
+            inicio = time.perf_counter()
+            resumo = cli.associar_lote(filtro_email="lote*@bench.local", agent="a1",
+                                       saida=os.path.join(tmp, "associar.csv"),
+                                       concorrencia=args.concorrencia, taxa=args.taxa)
+            lote["associar"] = _vazao(args.lote, time.perf_counter() - inicio, resumo)
+
+        memoria = medir_memoria(qube, args.memoria_usuarios) if args.memoria_usuarios else {}
+
+        return {
+            "gerado_em": datetime.now().isoformat(timespec="seconds"),
+            "ambiente": {
+                "python": platform.python_version(),
+                "plataforma": platform.platform(),
+                "cpus": os.cpu_count(),
+            },
+            "configuracao": {
+                "usuarios": args.usuarios,
+                "agents": args.agents,
+                "latencia_ms": args.latencia,
+                "jitter_ms": args.jitter,
+                "taxa_erro": args.taxa_erro,
+                "limite_api": args.limite_api,
+                "iteracoes": args.iteracoes,
+                "lote": args.lote,
+                "concorrencia": args.concorrencia,
+                "taxa": args.taxa,
+                "engine": args.engine,
+                "memoria_usuarios": args.memoria_usuarios,
+            },
+            "inicializacao": inicializacao,
+            "operacoes": operacoes,
+            "lote": lote,
+            "memoria": memoria,
+            "requisicoes": dict(sorted(api.contadores.items())),
+        }
+
+
+def _vazao(itens: int, segundos: float, resumo: Optional[Dict[str, int]]) -> Dict[str, Any]:
+    return {
+        "itens": itens,
+        "segundos": round(segundos, 3),
+        "itens_por_segundo": round(itens / segundos, 2) if segundos else 0.0,
+        "resumo": resumo,
+    }
+
+
+def comparar(atual: Dict[str, Any], base: Dict[str, Any], tolerancia: float) -> List[str]:
+    """Lista as métricas que pioraram além da tolerância em relação à execução base"""
+    regressoes = []
+
+    def verificar(nome: str, valor: Optional[float], referencia: Optional[float], maior_melhor: bool = False):
+        if not valor or not referencia:
+            return
+        variacao = (referencia - valor) / referencia if maior_melhor else (valor - referencia) / referencia
+        if variacao > tolerancia:
+            regressoes.append(f"{nome}: {referencia} -> {valor} ({variacao:+.0%})")
+
+    for grupo in ("inicializacao", "operacoes"):
+        for nome, atual_stats in atual.get(grupo, {}).items():
+            base_stats = base.get(grupo, {}).get(nome) or {}
+            for metrica in ("p50_ms", "p90_ms"):
+                verificar(f"{grupo}.{nome}.{metrica}", atual_stats.get(metrica), base_stats.get(metrica))
+    for nome, atual_stats in atual.get("lote", {}).items():
+        base_stats = base.get("lote", {}).get(nome) or {}
+        verificar(f"lote.{nome}.itens_por_segundo", atual_stats.get("itens_por_segundo"),
+                  base_stats.get("itens_por_segundo"), maior_melhor=True)
+    if atual.get("memoria") and base.get("memoria"):
+        verificar("memoria.modelos.mb", atual["memoria"]["modelos"]["mb"], base["memoria"]["modelos"]["mb"])
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da Qube Admin CLI contra uma API simulada local")
+    parser.add_argument("--usuarios", type=int, default=1000, help="Usuários pré-cadastrados na API simulada (padrão: 1000)")
+    parser.add_argument("--agents", type=int, default=20, help="Workers na API simulada (padrão: 20)")
+    parser.add_argument("--latencia", type=float, default=5.0, help="Latência fixa por requisição em ms (padrão: 5)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latência aleatória adicional em ms (padrão: 0)")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração de respostas 503 simuladas, 0 a 1 (padrão: 0)")
+    parser.add_argument("--limite-api", type=float, default=0,
+                        help="Requisições/s aceitas pela API simulada antes de responder 429, 0 = sem limite (padrão: 0)")
+    parser.add_argument("--iteracoes", type=int, default=30, help="Repetições de cada operação (padrão: 30)")
+    parser.add_argument("--repeticoes-inicio", type=int, default=5, help="Processos iniciados para medir a inicialização (padrão: 5)")
+    parser.add_argument("--lote", type=int, default=200, help="Registros nos lotes de criação e associação (padrão: 200)")
+    parser.add_argument("--concorrencia", type=int, default=None, help="Concorrência dos lotes (padrão: QUBE_CLI_CONCURRENCY)")
+    parser.add_argument("--taxa", type=float, default=0, help="Teto de req/s na associação em lote, 0 = automático (padrão: 0)")
+    parser.add_argument("--memoria-usuarios", type=int, default=100000,
+                        help="Usuários sintéticos na medição de memória, 0 = não mede (padrão: 100000)")
+    parser.add_argument("--engine", choices=("sync", "async"), default=os.getenv("QUBE_CLI_ENGINE", "sync"),
+                        help="Motor das operações em lote (padrão: QUBE_CLI_ENGINE ou sync)")
+    parser.add_argument("--saida", help="Arquivo JSON de resultado (padrão: stdout)")
+    parser.add_argument("--comparar", help="Resultado JSON anterior para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Piora relativa aceita na comparação (padrão: 0.2)")
+    args = parser.parse_args()
+
+    if args.concorrencia is None:
+        args.concorrencia = max(1, int(os.getenv("QUBE_CLI_CONCURRENCY", "8")))
+
+    resultado = executar_benchmark(args)
+
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+        print(f"📄 Resultado: {args.saida}", file=sys.stderr)
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+        regressoes = comparar(resultado, base, args.tolerancia)
+        if regressoes:
+            print(f"❌ {len(regressoes)} regressão(ões) acima de {args.tolerancia:.0%}:", file=sys.stderr)
+            for linha in regressoes:
+                print(f"   {linha}", file=sys.stderr)
+            sys.exit(1)
+        print(f"✅ Nenhuma regressão acima de {args.tolerancia:.0%}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,9 @@ pip3 install requests --user
 # Tornar executável
 chmod +x qube_admin_cli.py
 
+# Pré-compilar (python3 -m qube_admin_cli reaproveita o bytecode e inicia mais rápido)
+python3 -m py_compile qube_admin_cli.py
+
 echo ""
 echo "✅ Instalação concluída!"
 echo ""
@@ -36,3 +39,7 @@ echo "ou"
 echo ""
 echo "  ./qube_admin_cli.py"
 echo ""
+echo "ou (inicialização mais rápida, usa o bytecode pré-compilado)"
+echo ""
+echo "  python3 -m qube_admin_cli"
+echo ""
@@ -4,20 +4,200 @@ Qube Admin CLI - Ferramenta de administração para o BMG
 Permite criar usuários, alterar senhas e associar workers
 """
 
-import requests
+import argparse
+import atexit
+import base64
+import bisect
+import collections
+import contextlib
+import csv
+import fnmatch
+import functools
+import importlib
+import itertools
 import json
 import sys
 import os
+import queue
+import random
 import logging
 import re
-from datetime import datetime
-from getpass import getpass
-from typing import Optional, Dict, Any
+import shlex
+import threading
+import time
+import types
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
+from getpass import getpass, getuser
+from typing import Optional, Dict, Any, Callable, Iterable, Iterator, Tuple
+
+
+class _ImportacaoTardia:
+    """
+    Módulo importado no primeiro acesso a um atributo.
+    
+    `requests` e `asyncio` sozinhos somam mais de 100ms na inicialização; assim
+    `--help`, o menu e a importação do módulo só pagam pelo que usam.
+    """
+    
+    def __init__(self, nome: str):
+        self._nome = nome
+        self._modulo = None
+    
+    def __getattr__(self, atributo: str):
+        if self._modulo is None:
+            self._modulo = importlib.import_module(self._nome)
+        return getattr(self._modulo, atributo)
+
+
+requests = _ImportacaoTardia("requests")
+asyncio = _ImportacaoTardia("asyncio")
+uuid = _ImportacaoTardia("uuid")
+hashlib = _ImportacaoTardia("hashlib")
+email_utils = _ImportacaoTardia("email.utils")
+sqlite3 = _ImportacaoTardia("sqlite3")
+
+# Variáveis numéricas com valor inválido: registradas no log assim que ele for configurado
+_avisos_configuracao: list = []
+
+
+def _env_numero(nome: str, padrao, tipo: Callable = int):
+    """
+    Lê uma variável de ambiente numérica; vazia ou inválida, usa o padrão.
+    
+    Um valor como QUBE_CLI_CONCURRENCY=abc não deve impedir a CLI (nem o
+    `--help`) de iniciar: o aviso vai para stderr e depois para o log.
+    """
+    valor = os.getenv(nome, "").strip()
+    if not valor:
+        return padrao
+    try:
+        return tipo(valor)
+    except ValueError:
+        _avisos_configuracao.append((nome, valor, padrao))
+        print(f"⚠️  {nome}={valor!r} inválido; usando o padrão {padrao}", file=sys.stderr)
+        return padrao
 
 # Configurações da API
 # Prioridade: API_HOST > QUBE_API_URL > default
 API_BASE_URL = os.getenv("API_HOST", os.getenv("QUBE_API_URL", "https://api.qube.aicube.ca"))
 API_VERSION = "v1"
+# Perfis (host e credenciais de cada ambiente) para o modo comando, ex.: `--profile qube,qilbee`
+# - QUBE_CLI_PROFILES: Arquivo JSON dos perfis (padrão: ~/.qube_cli/profiles.json)
+# - QUBE_CLI_PROFILE: Perfil(is) usado(s) quando --profile não é informado
+# - QUBE_CLI_EMAIL_<PERFIL> / QUBE_CLI_PASSWORD_<PERFIL>: Credenciais de um perfil fora do arquivo
+PROFILES_FILE = os.path.expanduser(os.getenv("QUBE_CLI_PROFILES", "~/.qube_cli/profiles.json"))
+
+# Configurações de operações em lote
+# - QUBE_CLI_CONCURRENCY: Número máximo de requisições simultâneas; com o agendador adaptativo,
+#   só o ponto de partida do limite (padrão: 8)
+# - QUBE_CLI_RATE_LIMIT: Teto fixo de requisições por segundo nos lotes, 0 = automático (padrão: 0)
+DEFAULT_CONCURRENCY = max(1, _env_numero("QUBE_CLI_CONCURRENCY", 8))
+DEFAULT_RATE_LIMIT = max(0.0, _env_numero("QUBE_CLI_RATE_LIMIT", 0.0, float))
+# - QUBE_CLI_CHECK_EXISTING: Define como "false" para não buscar os emails já cadastrados antes
+#   de um lote de criação (a API continua rejeitando os repetidos com 409)
+CHECK_EXISTING = os.getenv("QUBE_CLI_CHECK_EXISTING", "true").lower() != "false"
+# Tamanho mínimo de senha aceito pela API (troca de senha e lotes)
+MIN_PASSWORD_LENGTH = 8
+
+# Agendador adaptativo (por onde passam todas as requisições)
+# - QUBE_CLI_ADAPTIVE: Define como "false" para desativar o controle adaptativo de vazão (padrão: true)
+# - QUBE_CLI_INFLIGHT_INITIAL / QUBE_CLI_INFLIGHT_MAX: Requisições simultâneas por classe de
+#   endpoint no início e no máximo (padrão: concorrência / 64)
+# - QUBE_CLI_LATENCY_TOLERANCE: Quantas vezes a latência de referência indica sobrecarga (padrão: 2.5)
+ADAPTIVE_SCHEDULER = os.getenv("QUBE_CLI_ADAPTIVE", "true").lower() != "false"
+INFLIGHT_INITIAL = max(1, _env_numero("QUBE_CLI_INFLIGHT_INITIAL", DEFAULT_CONCURRENCY))
+INFLIGHT_MAX = max(INFLIGHT_INITIAL, _env_numero("QUBE_CLI_INFLIGHT_MAX", 64))
+LATENCY_TOLERANCE = max(1.0, _env_numero("QUBE_CLI_LATENCY_TOLERANCE", 2.5, float))
+
+# Configurações de timeout, retentativas e circuit breaker
+# - QUBE_CLI_CONNECT_TIMEOUT / QUBE_CLI_READ_TIMEOUT: Timeouts em segundos (padrão: 5 / 30)
+# - QUBE_CLI_MAX_RETRIES: Retentativas para falhas transitórias, 0 desativa (padrão: 3)
+# - QUBE_CLI_BACKOFF_BASE / QUBE_CLI_BACKOFF_MAX: Backoff exponencial em segundos (padrão: 0.5 / 10)
+# - QUBE_CLI_CIRCUIT_THRESHOLD: Falhas seguidas para abrir o circuito (padrão: 5)
+# - QUBE_CLI_CIRCUIT_COOLDOWN: Segundos com o circuito aberto antes de testar a API (padrão: 30)
+CONNECT_TIMEOUT = _env_numero("QUBE_CLI_CONNECT_TIMEOUT", 5.0, float)
+READ_TIMEOUT = _env_numero("QUBE_CLI_READ_TIMEOUT", 30.0, float)
+MAX_RETRIES = max(0, _env_numero("QUBE_CLI_MAX_RETRIES", 3))
+BACKOFF_BASE = _env_numero("QUBE_CLI_BACKOFF_BASE", 0.5, float)
+BACKOFF_MAX = _env_numero("QUBE_CLI_BACKOFF_MAX", 10.0, float)
+CIRCUIT_THRESHOLD = max(1, _env_numero("QUBE_CLI_CIRCUIT_THRESHOLD", 5))
+CIRCUIT_COOLDOWN = _env_numero("QUBE_CLI_CIRCUIT_COOLDOWN", 30.0, float)
+# - QUBE_CLI_IDEMPOTENCY_KEYS: Define como "true" se a API respeita o cabeçalho Idempotency-Key; só então
+#   a criação de usuários (POST users/) é repetida após timeout de leitura ou 5xx (padrão: false)
+IDEMPOTENCY_KEYS = os.getenv("QUBE_CLI_IDEMPOTENCY_KEYS", "false").lower() == "true"
+# Status HTTP considerados transitórios
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Configurações de conexão HTTP
+# - QUBE_CLI_POOL_SIZE: Conexões mantidas abertas por host (padrão: máximo de requisições
+#   simultâneas + 4, mínimo 10; com o agendador ativo, QUBE_CLI_INFLIGHT_MAX + 4)
+# - QUBE_CLI_HTTP2: Define como "true" para usar HTTP/2 (requer `pip install httpx[http2]`)
+POOL_SIZE = max(1, _env_numero("QUBE_CLI_POOL_SIZE",
+                               max(10, (INFLIGHT_MAX if ADAPTIVE_SCHEDULER else DEFAULT_CONCURRENCY) + 4)))
+USE_HTTP2 = os.getenv("QUBE_CLI_HTTP2", "false").lower() == "true"
+# - QUBE_CLI_ENGINE: Motor das operações em lote: "sync" (threads) ou "async" (asyncio) (padrão: sync)
+ENGINE = "async" if os.getenv("QUBE_CLI_ENGINE", "sync").lower() == "async" else "sync"
+
+# Configurações de listagem
+# - QUBE_CLI_PAGE_SIZE: Usuários exibidos por página na seleção interativa (padrão: 20)
+# - QUBE_CLI_FETCH_PAGE_SIZE: Usuários por requisição ao percorrer a lista completa (padrão: 500)
+DEFAULT_PAGE_SIZE = max(1, _env_numero("QUBE_CLI_PAGE_SIZE", 20))
+FETCH_PAGE_SIZE = max(1, _env_numero("QUBE_CLI_FETCH_PAGE_SIZE", 500))
+# - QUBE_CLI_EXTRA_FIELDS: Campos da API mantidos em memória além dos usados pela CLI (ex.: "role,created_at")
+EXTRA_FIELDS = tuple(c.strip() for c in os.getenv("QUBE_CLI_EXTRA_FIELDS", "").split(",") if c.strip())
+
+# Configurações de cache local das listas de usuários e workers
+# - QUBE_CLI_CACHE_DIR: Diretório do cache (padrão: ~/.qube_cli/cache)
+# - QUBE_CLI_CACHE_TTL: Validade do cache em segundos (padrão: 300)
+# - QUBE_CLI_DISABLE_CACHE: Define como "true" para desabilitar o cache
+CACHE_DIR = os.path.expanduser(os.getenv("QUBE_CLI_CACHE_DIR", "~/.qube_cli/cache"))
+CACHE_TTL = _env_numero("QUBE_CLI_CACHE_TTL", 300)
+DISABLE_CACHE = os.getenv("QUBE_CLI_DISABLE_CACHE", "false").lower() == "true"
+# Leituras (GET) repetidas na mesma sessão: compartilhadas enquanto em andamento e guardadas em memória
+# - QUBE_CLI_MEMO_TTL: Segundos em que um resultado é reaproveitado, 0 desativa (padrão: 5)
+# - QUBE_CLI_MEMO_SIZE: Resultados mantidos, os menos usados saem primeiro (padrão: 256)
+MEMO_TTL = max(0.0, _env_numero("QUBE_CLI_MEMO_TTL", 5.0, float))
+MEMO_SIZE = max(1, _env_numero("QUBE_CLI_MEMO_SIZE", 256))
+
+# Configurações de sessão persistente (reaproveita o token entre execuções)
+# - QUBE_CLI_SESSION_CACHE: Define como "true" para salvar a sessão em disco
+# - QUBE_CLI_SESSION_FILE: Arquivo da sessão (padrão: ~/.qube_cli/session.json, permissão 0600)
+SESSION_CACHE = os.getenv("QUBE_CLI_SESSION_CACHE", "false").lower() == "true"
+SESSION_FILE = os.path.expanduser(os.getenv("QUBE_CLI_SESSION_FILE", "~/.qube_cli/session.json"))
+# Margem para considerar o token expirado antes da hora (segundos)
+TOKEN_EXPIRY_MARGIN = 60
+
+# Diário dos lotes de criação e associação, usado para retomar após uma interrupção
+# - QUBE_CLI_JOBS_DIR: Diretório dos diários (padrão: ~/.qube_cli/jobs, arquivos com permissão 0600)
+JOBS_DIR = os.path.expanduser(os.getenv("QUBE_CLI_JOBS_DIR", "~/.qube_cli/jobs"))
+
+# Trilha de auditoria: cada alteração (criação, troca de senha, associação) vira um evento em SQLite
+# - QUBE_CLI_AUDIT_DB: Arquivo do banco (padrão: ~/.qube_cli/audit.db, permissão 0600)
+# - QUBE_CLI_DISABLE_AUDIT: Define como "true" para não registrar eventos
+AUDIT_DB = os.path.expanduser(os.getenv("QUBE_CLI_AUDIT_DB", "~/.qube_cli/audit.db"))
+DISABLE_AUDIT = os.getenv("QUBE_CLI_DISABLE_AUDIT", "false").lower() == "true"
+
+# Métricas de latência das requisições, agregadas por endpoint durante a sessão
+# - QUBE_CLI_METRICS: Define como "true" para exibir o resumo das métricas ao final da sessão
+# - QUBE_CLI_METRICS_FILE: Arquivo no formato texto do Prometheus gravado ao final da sessão
+#   (extensão .om grava OpenMetrics), ex.: para o textfile collector do node_exporter
+SHOW_METRICS = os.getenv("QUBE_CLI_METRICS", "false").lower() == "true"
+METRICS_FILE = os.path.expanduser(os.getenv("QUBE_CLI_METRICS_FILE", "")) or None
+# Limites dos buckets dos histogramas de latência (segundos), os mesmos padrões do Prometheus
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Amostras mais recentes mantidas por endpoint para os percentis do resumo
+METRICS_MAX_SAMPLES = 10000
+
+# Credenciais do modo comando (subcomandos sem menu interativo)
+# - QUBE_CLI_EMAIL / QUBE_CLI_PASSWORD: Login do administrador quando não há sessão salva
+# - QUBE_CLI_NEW_PASSWORD: Nova senha para `password change`
+# Códigos de saída do modo comando
+EXIT_OK = 0
+EXIT_FALHA = 1
+EXIT_USO = 2
+EXIT_AUTENTICACAO = 3
 
 # Configurações de Log
 # Variáveis de ambiente disponíveis:
@@ -26,9 +206,17 @@ API_VERSION = "v1"
 # - QUBE_CLI_LOG_LEVEL: Nível de log (DEBUG, INFO, WARNING, ERROR) (padrão: INFO)
 # - QUBE_CLI_DISABLE_LOGS: Define como "true" para desabilitar logs em arquivo
 # - QUBE_CLI_DEBUG: Define como "true" para mostrar logs no console também
+# - QUBE_CLI_LOG_FORMAT: "text" ou "json" (uma linha JSON por registro) (padrão: text)
+# - QUBE_CLI_LOG_ROTATION: "size", "daily" ou "none" (padrão: size)
+# - QUBE_CLI_LOG_MAX_BYTES: Tamanho máximo do arquivo na rotação por tamanho (padrão: 10 MB)
+# - QUBE_CLI_LOG_BACKUP_COUNT: Arquivos rotacionados mantidos (padrão: 5)
 
 DISABLE_LOGS = os.getenv("QUBE_CLI_DISABLE_LOGS", "false").lower() == "true"
 LOG_LEVEL = os.getenv("QUBE_CLI_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = "json" if os.getenv("QUBE_CLI_LOG_FORMAT", "text").lower() == "json" else "text"
+LOG_ROTATION = os.getenv("QUBE_CLI_LOG_ROTATION", "size").lower()
+LOG_MAX_BYTES = max(0, _env_numero("QUBE_CLI_LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = max(0, _env_numero("QUBE_CLI_LOG_BACKUP_COUNT", 5))
 
 # Determinar arquivo de log
 if os.getenv("QUBE_CLI_LOG_FILE"):
@@ -36,176 +224,2878 @@ if os.getenv("QUBE_CLI_LOG_FILE"):
     LOG_DIR = os.path.dirname(LOG_FILE)
 else:
     LOG_DIR = os.getenv("QUBE_CLI_LOG_DIR", os.path.expanduser("~/.qube_cli/logs"))
-    LOG_FILE = os.path.join(LOG_DIR, f"qube_cli_{datetime.now().strftime('%Y%m%d')}.log")
+    LOG_FILE = os.path.join(LOG_DIR, "qube_cli.log")
+
+logger = logging.getLogger("QubeCLI")
+# Sem configurar_logs() (ex.: importado por testes), nada é escrito nem exibido
+logger.addHandler(logging.NullHandler())
+_logs_configurados = False
+
+
+class JsonLogFormatter(logging.Formatter):
+    """Formata cada registro como uma linha JSON, com os campos estruturados da requisição"""
+    
+    CAMPOS = ("request_id", "method", "endpoint", "status", "latency_ms", "retries")
+    
+    def format(self, record: logging.LogRecord) -> str:
+        dados = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for campo in self.CAMPOS:
+            valor = getattr(record, campo, None)
+            if valor is not None:
+                dados[campo] = valor
+        if record.exc_info:
+            dados["exc"] = self.formatException(record.exc_info)
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+def _handler_arquivo() -> logging.Handler:
+    """Handler do arquivo de log conforme QUBE_CLI_LOG_ROTATION"""
+    import logging.handlers
+    if LOG_ROTATION == "daily":
+        return logging.handlers.TimedRotatingFileHandler(
+            LOG_FILE, when="midnight", backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    if LOG_ROTATION == "size" and LOG_MAX_BYTES:
+        return logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    return logging.FileHandler(LOG_FILE, encoding="utf-8")
+
+
+def _preparar_para_fila(record: logging.LogRecord) -> logging.LogRecord:
+    """
+    Substitui QueueHandler.prepare: interpola só a mensagem e mantém exc_info.
+    
+    O prepare padrão junta o traceback à mensagem e apaga exc_info, e o
+    JsonLogFormatter (na thread do arquivo) deixaria de gravar o campo "exc".
+    """
+    registro = logging.makeLogRecord(record.__dict__)
+    registro.msg = registro.message = record.getMessage()
+    registro.args = None
+    return registro
+
+
+def configurar_logs():
+    """
+    Cria o diretório e os handlers de log; chamado só quando um comando vai executar.
+    
+    O arquivo é escrito por uma thread própria (QueueHandler/QueueListener): a
+    thread que faz as requisições só enfileira o registro. O console (debug)
+    continua síncrono para não embaralhar as mensagens com os prints.
+    """
+    global _logs_configurados
+    if _logs_configurados:
+        return
+    _logs_configurados = True
+    import logging.handlers
+    
+    formato = JsonLogFormatter() if LOG_FORMAT == "json" else \
+        logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handlers = []
+    
+    if not DISABLE_LOGS:
+        # Criar diretório de logs se não existir
+        os.makedirs(LOG_DIR, exist_ok=True)
+        arquivo = _handler_arquivo()
+        arquivo.setFormatter(formato)
+        fila: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+        listener = logging.handlers.QueueListener(fila, arquivo, respect_handler_level=True)
+        listener.start()
+        # Esvazia a fila antes de o processo terminar (inclusive via sys.exit)
+        atexit.register(listener.stop)
+        enfileirador = logging.handlers.QueueHandler(fila)
+        # Só interpola a mensagem; o formato final é aplicado na thread do arquivo
+        enfileirador.prepare = _preparar_para_fila
+        handlers.append(enfileirador)
+    
+    # Adicionar handler de console se debug estiver habilitado
+    if os.getenv("QUBE_CLI_DEBUG", "false").lower() == "true":
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(formato)
+        handlers.append(console)
+    
+    # Se não houver handlers, adicionar NullHandler para evitar warnings
+    if not handlers:
+        handlers.append(logging.NullHandler())
+    
+    logging.basicConfig(level=getattr(logging, LOG_LEVEL, logging.INFO), handlers=handlers)
+    for nome, valor, padrao in _avisos_configuracao:
+        logger.warning("Invalid value for %s: %r (using default %s)", nome, valor, padrao)
+
+
+# Separadores usados para quebrar emails e nomes em palavras no índice de busca
+_TOKEN_SPLIT = re.compile(r"[\s@._\-+]+")
+
+# Retorno de _make_request quando a API responde 304 (cache ainda válido)
+NOT_MODIFIED: Dict[str, Any] = {"not_modified": True}
+
+
+def _silent(*args, **kwargs):
+    """Substitui print() quando a saída no console deve ser suprimida"""
+
+
+# Sequências ESC (ANSI escape codes) e outros caracteres de controle removidos dos inputs
+_ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;?]*[a-zA-Z]|\x1b\?[0-9;]*[a-zA-Z]')
+_CONTROL_CHARS = re.compile(r'[\x00-\x1f\x7f]')
+
+# Sintaxe de email conferida antes de enviar um lote: parte local e domínio com ao menos um ponto
+_EMAIL_SYNTAX = re.compile(r"[A-Za-z0-9.!#$%&'*+/=?^_`{|}~-]+@[A-Za-z0-9](?:[A-Za-z0-9-]*[A-Za-z0-9])?"
+                           r"(?:\.[A-Za-z0-9](?:[A-Za-z0-9-]*[A-Za-z0-9])?)+")
+
+
+# Função para limpar sequências de escape ANSI dos inputs
+def sanitize_input(text: str) -> str:
+    """Remove sequências de escape ANSI e caracteres de controle do input"""
+    # Texto só com caracteres imprimíveis (o caso comum nos lotes) não tem o que remover
+    if text.isprintable():
+        return text.strip()
+    cleaned = _ANSI_ESCAPE.sub('', text)
+    return _CONTROL_CHARS.sub('', cleaned).strip()
+
+
+def parse_bool(value: Any, default: bool = False) -> bool:
+    """Interpreta valores como 's', 'sim', 'true', '1' vindos de arquivos de lote"""
+    if value is None or value == "":
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("s", "sim", "y", "yes", "true", "1")
+
+
+def ler_registros(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Lê registros de um arquivo CSV ou JSONL sob demanda (um por vez).
+    
+    `path` igual a "-" lê da entrada padrão; o formato é JSONL se a primeira
+    linha não vazia começar com "{", senão CSV.
+    """
+    if path == "-":
+        linhas = iter(sys.stdin)
+        primeira = next((linha for linha in linhas if linha.strip()), "")
+        yield from _registros_de(itertools.chain([primeira], linhas), primeira.lstrip().startswith("{"))
+        return
+    is_jsonl = os.path.splitext(path)[1].lower() in (".jsonl", ".ndjson")
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        yield from _registros_de(f, is_jsonl)
+
+
+def _registros_de(linhas: Iterable[str], is_jsonl: bool) -> Iterator[Dict[str, Any]]:
+    if is_jsonl:
+        for line_no, line in enumerate(linhas, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                record = {"_erro": f"JSON inválido na linha {line_no}: {e}"}
+            if not isinstance(record, dict):
+                record = {"_erro": f"Linha {line_no} não é um objeto JSON"}
+            yield record
+    else:
+        for row in csv.DictReader(linhas):
+            yield {k.strip(): (v.strip() if isinstance(v, str) else v)
+                   for k, v in row.items() if k}
+
+
+class BatchValidator:
+    """
+    Validação local das linhas de um lote de criação, antes de qualquer requisição.
+    
+    Sanitiza email e nome, confere a sintaxe do email e o tamanho mínimo da
+    senha, descarta emails repetidos no arquivo e os que já existem na empresa
+    (`existentes`, buscados uma única vez). Linhas reprovadas recebem `_erro` e
+    saem do lote sem chegar à API, como as linhas ilegíveis do arquivo.
+    
+    Com `existentes_concluidos` (job retomado), um email já cadastrado pode ter
+    sido criado pela própria execução anterior: a linha recebe `_ignorado` e
+    conta como concluída em vez de reprovada.
+    """
+    
+    # Linhas lidas e validadas de uma vez, à frente das requisições
+    BLOCO = 1000
+    
+    def __init__(self, existentes: Iterable[str] = (), existentes_concluidos: bool = False):
+        self.existentes = frozenset(existentes)
+        self.existentes_concluidos = existentes_concluidos
+        self.vistos: Dict[str, int] = {}
+        self.reprovados: Dict[str, int] = collections.Counter()
+        self.ja_cadastrados = 0
+    
+    @staticmethod
+    def verificar(email: str, registro: Dict[str, Any]) -> Optional[str]:
+        """Erro de sintaxe do email ou da senha de um registro já sanitizado (None se válido)"""
+        if not email:
+            return "Email não pode ser vazio"
+        if not _EMAIL_SYNTAX.fullmatch(email):
+            return f"Email inválido: {email}"
+        password = registro.get("password") or registro.get("senha")
+        if password and len(str(password)) < MIN_PASSWORD_LENGTH:
+            return f"A senha deve ter no mínimo {MIN_PASSWORD_LENGTH} caracteres"
+        return None
+    
+    def validar(self, linha: int, registro: Dict[str, Any]) -> Optional[str]:
+        """Sanitiza o registro (no lugar) e devolve o motivo da reprovação, ou None"""
+        if registro.get("_erro"):
+            return registro["_erro"]
+        email = registro["email"] = sanitize_input(str(registro.get("email") or ""))
+        for campo in ("name", "nome"):
+            if registro.get(campo):
+                registro[campo] = sanitize_input(str(registro[campo]))
+        erro = self.verificar(email, registro)
+        if erro:
+            self.reprovados["invalido"] += 1
+            return erro
+        chave = email.lower()
+        primeira = self.vistos.setdefault(chave, linha)
+        if primeira != linha:
+            self.reprovados["repetido"] += 1
+            return f"Email repetido no arquivo (linha {primeira})"
+        if chave in self.existentes:
+            if self.existentes_concluidos:
+                self.ja_cadastrados += 1
+                registro["_ignorado"] = "Email já cadastrado"
+                return None
+            self.reprovados["existente"] += 1
+            return "Email já cadastrado"
+        return None
+    
+    def filtrar(self, itens: Iterable[Tuple[int, Dict[str, Any]]]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Valida (linha, registro) em blocos de BLOCO e marca os reprovados com `_erro`"""
+        itens = iter(itens)
+        while True:
+            bloco = list(itertools.islice(itens, self.BLOCO))
+            if not bloco:
+                return
+            for linha, registro in bloco:
+                erro = self.validar(linha, registro)
+                if erro:
+                    registro["_erro"] = erro
+            yield from bloco
+
+
+def executar_em_lote(itens: Iterable[Any], funcao: Callable[[Any], Any],
+                     concorrencia: int = DEFAULT_CONCURRENCY) -> Iterator[Tuple[Any, Any]]:
+    """
+    Executa `funcao` para cada item com no máximo `concorrencia` chamadas em paralelo.
+
+    Os itens são consumidos sob demanda (a fila nunca passa de 2x a concorrência),
+    então arquivos grandes não são carregados inteiros em memória. Os resultados
+    são produzidos na ordem em que terminam, como tuplas (item, resultado).
+    """
+    concorrencia = max(1, concorrencia)
+    pool = ThreadPoolExecutor(max_workers=concorrencia, thread_name_prefix="qube-lote")
+    pendentes: Dict[Any, Any] = {}
+    try:
+        for item in itens:
+            while len(pendentes) >= concorrencia * 2:
+                feitos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+                for fut in feitos:
+                    yield pendentes.pop(fut), fut.result()
+            pendentes[pool.submit(funcao, item)] = item
+        while pendentes:
+            feitos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+            for fut in feitos:
+                yield pendentes.pop(fut), fut.result()
+    finally:
+        # Em caso de Ctrl+C ou erro, descarta o que ainda não começou
+        for fut in pendentes:
+            fut.cancel()
+        pool.shutdown(wait=True)
+
+
+def executar_em_lote_async(itens: Iterable[Any], corrotina: Callable[[Any, Any], Any],
+                           concorrencia: int, criar_cliente: Callable[[], Any]) -> Iterator[Tuple[Any, Any]]:
+    """
+    Versão asyncio de executar_em_lote.
+    
+    Um event loop em thread própria executa `corrotina(cliente, item)` com até
+    `concorrencia` requisições em andamento, compartilhando um único cliente
+    criado por `criar_cliente()`; os resultados são entregues a quem consome o
+    gerador (a thread principal) na ordem em que terminam.
+    """
+    concorrencia = max(1, concorrencia)
+    resultados: "queue.Queue[Tuple[Any, Any]]" = queue.Queue()
+    parar = threading.Event()
+    fim = object()
+    
+    async def produzir():
+        semaforo = asyncio.Semaphore(concorrencia)
+        async with criar_cliente() as cliente:
+            async def executar(item):
+                try:
+                    resultados.put((item, await corrotina(cliente, item)))
+                except Exception as e:
+                    resultados.put((item, e))
+                finally:
+                    semaforo.release()
+            
+            tarefas = set()
+            for item in itens:
+                if parar.is_set():
+                    break
+                await semaforo.acquire()
+                tarefa = asyncio.ensure_future(executar(item))
+                tarefas.add(tarefa)
+                tarefa.add_done_callback(tarefas.discard)
+            if tarefas:
+                await asyncio.gather(*tarefas)
+    
+    def rodar():
+        try:
+            asyncio.run(produzir())
+            resultados.put((fim, None))
+        except BaseException as e:
+            resultados.put((fim, e))
+    
+    thread = threading.Thread(target=rodar, name="qube-async", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, resultado = resultados.get()
+            if item is fim:
+                if resultado is not None:
+                    raise resultado
+                return
+            if isinstance(resultado, Exception):
+                raise resultado
+            yield item, resultado
+    finally:
+        # Em caso de Ctrl+C ou erro, não inicia novas requisições
+        parar.set()
+        thread.join()
+
+
+class ResultadoWriter:
+    """
+    Grava o resultado de cada linha de um lote em CSV ou JSONL, linha a linha.
+    
+    `path` igual a "-" grava em `stream` (padrão: saída padrão). O formato vem
+    de `formato` ("csv"/"jsonl") ou da extensão; "-" sem formato é JSONL.
+    Com autoflush=False (exportações grandes) o buffer do arquivo não é
+    esvaziado a cada linha.
+    """
+
+    CAMPOS = ["linha", "email", "status", "id", "erro"]
+
+    def __init__(self, path: str, campos: Optional[list] = None, stream: Any = None,
+                 formato: Optional[str] = None, autoflush: bool = True):
+        self.path = path
+        self.campos = campos or self.CAMPOS
+        self.autoflush = autoflush
+        if formato is None:
+            jsonl = path == "-" or os.path.splitext(path)[1].lower() in (".jsonl", ".ndjson")
+            formato = "jsonl" if jsonl else "csv"
+        self.is_jsonl = formato == "jsonl"
+        if path == "-":
+            self._file = stream or sys.stdout
+            self._fechar = False
+        else:
+            self._file = open(path, "w", encoding="utf-8", newline="")
+            self._fechar = True
+        self._csv = None
+        if not self.is_jsonl:
+            self._csv = csv.DictWriter(self._file, fieldnames=self.campos, extrasaction="ignore")
+            self._csv.writeheader()
+
+    def write(self, resultado: Dict[str, Any]):
+        if self._csv:
+            self._csv.writerow({k: ("" if resultado.get(k) is None else resultado.get(k))
+                                for k in self.campos})
+        else:
+            self._file.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+        if self.autoflush:
+            self._file.flush()
+
+    def close(self):
+        if self._fechar:
+            self._file.close()
+        else:
+            self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JobJournal:
+    """
+    Diário de um lote em JSONL só de acréscimo (`<JOBS_DIR>/<id>.jsonl`).
+    
+    A primeira linha descreve o job (operação e parâmetros para retomar); cada
+    item acrescenta uma linha com sua chave e status assim que termina, nas
+    próprias threads do lote. Ao retomar, itens com status final de sucesso são
+    pulados e os que falharam ou não chegaram a rodar são executados de novo.
+    Uma última linha truncada (processo morto no meio da gravação) é ignorada.
+    """
+    
+    CONCLUIDOS = ("criado", "associado", "ignorado")
+    
+    def __init__(self, path: str, cabecalho: Dict[str, Any], estados: Optional[Dict[str, str]] = None):
+        self.path = path
+        self.cabecalho = cabecalho
+        self.id = cabecalho["id"]
+        self._estados = estados or {}
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+    
+    @classmethod
+    def criar(cls, operacao: str, parametros: Dict[str, Any], diretorio: str = JOBS_DIR) -> "JobJournal":
+        os.makedirs(diretorio, mode=0o700, exist_ok=True)
+        job_id = f"{operacao}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.urandom(2).hex()}"
+        path = os.path.join(diretorio, f"{job_id}.jsonl")
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+        cabecalho = {"tipo": "job", "id": job_id, "operacao": operacao, "parametros": parametros,
+                     "criado_em": datetime.now().isoformat(timespec="seconds")}
+        diario = cls(path, cabecalho)
+        diario._gravar(cabecalho)
+        return diario
+    
+    @staticmethod
+    def _ler(path: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, str]]:
+        """Cabeçalho e último status de cada chave"""
+        cabecalho = None
+        estados: Dict[str, str] = {}
+        with open(path, encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    registro = json.loads(linha)
+                except json.JSONDecodeError:
+                    continue
+                if registro.get("tipo") == "job":
+                    cabecalho = registro
+                elif "chave" in registro:
+                    estados[registro["chave"]] = registro.get("status")
+        return cabecalho, estados
+    
+    @classmethod
+    def abrir(cls, job_id: str, diretorio: str = JOBS_DIR) -> "JobJournal":
+        """Reabre um job para retomada; levanta ValueError se ele não existir"""
+        path = os.path.join(diretorio, f"{os.path.basename(job_id)}.jsonl")
+        if not os.path.isfile(path):
+            raise ValueError(f"Job não encontrado: {job_id} (veja `job list`)")
+        cabecalho, estados = cls._ler(path)
+        if not cabecalho:
+            raise ValueError(f"Diário sem cabeçalho: {path}")
+        return cls(path, cabecalho, estados)
+    
+    @classmethod
+    def listar(cls, diretorio: str = JOBS_DIR) -> list:
+        """Resumo dos jobs do diretório, do mais antigo para o mais recente"""
+        if not os.path.isdir(diretorio):
+            return []
+        jobs = []
+        for nome in sorted(os.listdir(diretorio)):
+            if not nome.endswith(".jsonl"):
+                continue
+            path = os.path.join(diretorio, nome)
+            try:
+                cabecalho, estados = cls._ler(path)
+                atualizado = datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="seconds")
+            except OSError as e:
+                logger.warning("Could not read job journal %s: %s", path, e)
+                continue
+            if not cabecalho:
+                continue
+            concluidos = sum(1 for status in estados.values() if status in cls.CONCLUIDOS)
+            parametros = cabecalho.get("parametros") or {}
+            jobs.append({"id": cabecalho["id"], "operacao": cabecalho.get("operacao"),
+                         "criado_em": cabecalho.get("criado_em"), "atualizado_em": atualizado,
+                         "concluidos": concluidos, "erros": len(estados) - concluidos,
+                         "entrada": parametros.get("arquivo") or parametros.get("filtro_email")})
+        return jobs
+    
+    @property
+    def concluidos(self) -> int:
+        return sum(1 for status in self._estados.values() if status in self.CONCLUIDOS)
+    
+    def concluido(self, chave: str) -> bool:
+        return self._estados.get(chave) in self.CONCLUIDOS
+    
+    def chave_idempotencia(self, chave: str) -> str:
+        """Mesma Idempotency-Key para o item em todas as execuções do job"""
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"qube-cli-job:{self.id}:{chave}"))
+    
+    def registrar(self, chave: str, resultado: Dict[str, Any]):
+        """Acrescenta o status final de um item"""
+        registro = {"chave": chave, "linha": resultado.get("linha"), "status": resultado.get("status"),
+                    "id": resultado.get("id"), "erro": resultado.get("erro")}
+        with self._lock:
+            self._estados[chave] = registro["status"]
+            self._gravar(registro)
+    
+    def _gravar(self, registro: Dict[str, Any]):
+        self._file.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+    
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                os.fsync(self._file.fileno())
+                self._file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ParquetWriter:
+    """
+    Grava registros em Parquet (requer `pip install pyarrow`), com a mesma
+    interface de ResultadoWriter.
+    
+    As linhas são acumuladas e gravadas em row groups de `LOTE` linhas, então a
+    memória usada não depende do tamanho da exportação. Colunas são texto.
+    """
+    
+    LOTE = 10000
+    
+    def __init__(self, path: str, campos: list):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError("o formato parquet requer o pacote pyarrow (pip install pyarrow)")
+        if path == "-":
+            raise ValueError("o formato parquet requer um arquivo em --output")
+        self._pa = pyarrow
+        self.campos = campos
+        self._schema = pyarrow.schema([(campo, pyarrow.string()) for campo in campos])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema, compression="zstd")
+        self._buffer: Dict[str, list] = {campo: [] for campo in campos}
+        self._linhas = 0
+    
+    def write(self, resultado: Dict[str, Any]):
+        for campo in self.campos:
+            valor = resultado.get(campo)
+            self._buffer[campo].append(None if valor is None else str(valor))
+        self._linhas += 1
+        if self._linhas >= self.LOTE:
+            self._gravar_lote()
+    
+    def _gravar_lote(self):
+        if self._linhas:
+            self._writer.write_table(self._pa.table(self._buffer, schema=self._schema))
+            self._buffer = {campo: [] for campo in self.campos}
+            self._linhas = 0
+    
+    def close(self):
+        self._gravar_lote()
+        self._writer.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+def formato_por_extensao(path: str) -> str:
+    """csv, jsonl ou parquet conforme a extensão do arquivo ("-" é JSONL)"""
+    extensao = os.path.splitext(path)[1].lower()
+    if extensao == ".parquet":
+        return "parquet"
+    return "jsonl" if path == "-" or extensao in (".jsonl", ".ndjson") else "csv"
+
+
+def abrir_exportacao(path: str, campos: list, formato: Optional[str] = None, stream: Any = None) -> Any:
+    """Writer de exportação conforme `formato` ou a extensão: csv, jsonl ou parquet"""
+    formato = formato or formato_por_extensao(path)
+    if formato == "parquet":
+        return ParquetWriter(path, campos)
+    return ResultadoWriter(path, campos, stream=stream, formato=formato, autoflush=False)
+
+
+def _accept_encoding() -> str:
+    """Codificações de compressão suportadas pelo ambiente (brotli é opcional)"""
+    codificacoes = ["gzip", "deflate"]
+    try:
+        import brotli  # noqa: F401
+        codificacoes.append("br")
+    except ImportError:
+        try:
+            import brotlicffi  # noqa: F401
+            codificacoes.append("br")
+        except ImportError:
+            pass
+    return ", ".join(codificacoes)
+
+
+class Http2Session:
+    """
+    Transporte HTTP/2 opcional baseado em httpx, com a mesma interface usada de
+    requests.Session (get/post/put/delete e headers). Exceções do httpx são
+    convertidas nas equivalentes do requests para reaproveitar o tratamento
+    de erros de _make_request.
+    """
+    
+    def __init__(self, pool_size: int = POOL_SIZE):
+        import httpx
+        self._httpx = httpx
+        self._client = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        self.headers = self._client.headers
+    
+    def _request(self, method: str, url: str, timeout=None, **kwargs):
+        httpx = self._httpx
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        fases: Dict[str, float] = {}
+        try:
+            resposta = self._client.request(method, url, timeout=timeout,
+                                            extensions={"trace": _rastreador_httpx(fases)}, **kwargs)
+            resposta.fases = fases
+            return resposta
+        except httpx.ConnectTimeout as e:
+            raise requests.exceptions.ConnectTimeout(str(e))
+        except httpx.ConnectError as e:
+            raise requests.exceptions.ConnectionError(str(e))
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.ReadTimeout(str(e))
+        except httpx.HTTPError as e:
+            raise requests.exceptions.RequestException(str(e))
+    
+    def get(self, url: str, params=None, stream: bool = False, **kwargs):
+        # Respostas do httpx chegam lidas por completo; RespostaStream as decodifica de uma vez
+        return self._request("GET", url, params=params, **kwargs)
+    
+    def post(self, url: str, json=None, **kwargs):
+        return self._request("POST", url, json=json, **kwargs)
+    
+    def put(self, url: str, json=None, **kwargs):
+        return self._request("PUT", url, json=json, **kwargs)
+    
+    def delete(self, url: str, **kwargs):
+        return self._request("DELETE", url, **kwargs)
+    
+    def close(self):
+        self._client.close()
+
+
+def criar_sessao_http(pool_size: int = POOL_SIZE, http2: bool = USE_HTTP2):
+    """
+    Cria a sessão HTTP compartilhada pela CLI.
+    
+    O pool de conexões acompanha a concorrência dos lotes (evita descartar
+    conexões e refazer o handshake TLS), as conexões são mantidas com keep-alive
+    e respostas grandes são pedidas comprimidas. Com `http2=True` e httpx
+    instalado, usa HTTP/2; sem httpx, volta para requests.
+    """
+    if http2:
+        try:
+            sessao = Http2Session(pool_size)
+            logger.info("HTTP transport: httpx (HTTP/2)")
+        except ImportError:
+            logger.warning("QUBE_CLI_HTTP2=true but httpx[http2] is not installed; using requests")
+            sessao = None
+        if sessao is not None:
+            sessao.headers.update({
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+                "Accept-Encoding": _accept_encoding(),
+            })
+            return sessao
+    
+    sessao = requests.Session()
+    # Retentativas ficam a cargo da RetryPolicy, não do urllib3
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+    sessao.mount("https://", adapter)
+    sessao.mount("http://", adapter)
+    sessao.headers.update({
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+        "Accept-Encoding": _accept_encoding(),
+        "Connection": "keep-alive",
+    })
+    logger.info("HTTP transport: requests (pool size: %s)", pool_size)
+    return sessao
+
+
+def _segundos_retry_after(valor: Optional[str]) -> Optional[float]:
+    """Segundos pedidos por um cabeçalho Retry-After (número ou data HTTP), limitados a 60s"""
+    if not valor:
+        return None
+    try:
+        return min(60.0, max(0.0, float(valor)))
+    except ValueError:
+        try:
+            data = email_utils.parsedate_to_datetime(valor)
+            return min(60.0, max(0.0, data.timestamp() - time.time()))
+        except (TypeError, ValueError):
+            return None
 
-# Criar diretório de logs se não existir e se logs estiverem habilitados
-if not DISABLE_LOGS:
-    os.makedirs(LOG_DIR, exist_ok=True)
 
-# Configurar logging
-handlers = []
-if not DISABLE_LOGS:
-    handlers.append(logging.FileHandler(LOG_FILE, encoding='utf-8'))
+class RetryPolicy:
+    """
+    Política de retentativas: quais requisições podem ser repetidas e quanto esperar.
+    
+    GET/PUT/DELETE e `agents/{id}/assign` são idempotentes; demais POSTs só com
+    Idempotency-Key e quando a API a respeita (`idempotencia`, QUBE_CLI_IDEMPOTENCY_KEYS).
+    Falha ao conectar (a requisição nem saiu) sempre pode ser repetida. A espera usa backoff exponencial com jitter completo e respeita
+    Retry-After em 429/503.
+    """
+    
+    METODOS_IDEMPOTENTES = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+    POSTS_IDEMPOTENTES = re.compile(r"^agents/[^/]+/assign$")
+    
+    def __init__(self, max_retries: int = MAX_RETRIES, backoff_base: float = BACKOFF_BASE,
+                 backoff_max: float = BACKOFF_MAX, connect_timeout: float = CONNECT_TIMEOUT,
+                 read_timeout: float = READ_TIMEOUT, idempotencia: bool = IDEMPOTENCY_KEYS):
+        self.max_retries = max_retries
+        self.idempotencia = idempotencia
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+    
+    def pode_repetir(self, method: str, endpoint: str, idempotency_key: Optional[str] = None,
+                     erro: Optional[Exception] = None) -> bool:
+        if isinstance(erro, requests.exceptions.ConnectTimeout):
+            return True
+        if method.upper() in self.METODOS_IDEMPOTENTES or (idempotency_key and self.idempotencia):
+            return True
+        return method.upper() == "POST" and bool(self.POSTS_IDEMPOTENTES.match(endpoint))
+    
+    def espera(self, tentativa: int, retry_after: Optional[str] = None) -> float:
+        """Segundos até a próxima tentativa (Retry-After tem prioridade, limitado a 60s)"""
+        segundos = _segundos_retry_after(retry_after)
+        if segundos is not None:
+            return segundos
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** (tentativa - 1))))
+    
+    def decidir(self, tentativa: int, method: str, endpoint: str, idempotency_key: Optional[str] = None,
+                erro: Optional[Exception] = None, response: Any = None) -> Optional[float]:
+        """Segundos de espera antes de repetir a tentativa atual, ou None se não deve repetir"""
+        if tentativa >= self.max_retries:
+            return None
+        if erro is not None:
+            if not isinstance(erro, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+                return None
+            if not self.pode_repetir(method, endpoint, idempotency_key, erro):
+                return None
+            return self.espera(tentativa + 1)
+        if response is None or response.status_code not in RETRY_STATUS_CODES:
+            return None
+        if not self.pode_repetir(method, endpoint, idempotency_key):
+            return None
+        return self.espera(tentativa + 1, response.headers.get("Retry-After"))
 
-# Adicionar handler de console se debug estiver habilitado
-if os.getenv("QUBE_CLI_DEBUG", "false").lower() == "true":
-    handlers.append(logging.StreamHandler(sys.stdout))
 
-# Se não houver handlers, adicionar NullHandler para evitar warnings
-if not handlers:
-    handlers.append(logging.NullHandler())
+class CircuitBreaker:
+    """
+    Abre após `limite` falhas seguidas e rejeita requisições por `cooldown` segundos.
+    
+    Depois do cooldown, deixa uma requisição passar (meio-aberto): qualquer resposta
+    abaixo de 500 (inclusive 429) fecha o circuito, falha o reabre.
+    """
+    
+    def __init__(self, limite: int = CIRCUIT_THRESHOLD, cooldown: float = CIRCUIT_COOLDOWN):
+        self.limite = limite
+        self.cooldown = cooldown
+        self._falhas = 0
+        self._aberto_em: Optional[float] = None
+        self._teste_em_andamento = False
+        self._lock = threading.Lock()
+    
+    @property
+    def aberto(self) -> bool:
+        return self._aberto_em is not None
+    
+    def permitir(self) -> bool:
+        with self._lock:
+            if self._aberto_em is None:
+                return True
+            if time.monotonic() - self._aberto_em >= self.cooldown and not self._teste_em_andamento:
+                self._teste_em_andamento = True
+                return True
+            return False
+    
+    def registrar_sucesso(self):
+        with self._lock:
+            if self._aberto_em is not None:
+                logger.info("Circuit closed: API responding again")
+            self._falhas = 0
+            self._aberto_em = None
+            self._teste_em_andamento = False
+    
+    def registrar_falha(self):
+        with self._lock:
+            self._falhas += 1
+            if self._teste_em_andamento or (self._aberto_em is None and self._falhas >= self.limite):
+                logger.error("Circuit opened after %s consecutive failures", self._falhas)
+                self._aberto_em = time.monotonic()
+            self._teste_em_andamento = False
+    
+    def liberar_teste(self):
+        """Tentativa encerrada sem resultado (exceção inesperada): a próxima pode testar a API"""
+        with self._lock:
+            self._teste_em_andamento = False
+
+
+class CircuitOpenError(Exception):
+    """Requisição rejeitada sem contato com a API porque o circuit breaker está aberto"""
+
+
+class _LimiteAdaptativo:
+    """
+    Estado de uma classe de endpoint no RequestScheduler: requisições simultâneas,
+    taxa (token bucket, só depois do primeiro 429 ou com um teto fixo como
+    `--rate`) e pausa pedida por Retry-After. Acessado sempre com o lock do agendador.
+    """
+    
+    STATUS_SOBRECARGA = (429, 503)
+    
+    def __init__(self, nome: str, inicial: int, maximo: int):
+        self.nome = nome
+        self.limite = float(inicial)
+        self.maximo = maximo
+        self.em_andamento = 0
+        self.taxa: Optional[float] = None
+        self.teto: Optional[float] = None
+        self.tokens = 1.0
+        self.ultimo = time.monotonic()
+        self.pausa_ate = 0.0
+        self.latencia_media: Optional[float] = None
+        self.latencia_base: Optional[float] = None
+        self.ultima_reducao = 0.0
+        self.saturado = False
+        self.inicios: "collections.deque[float]" = collections.deque(maxlen=64)
+    
+    def taxa_efetiva(self) -> Optional[float]:
+        """Menor entre a taxa adaptativa e o teto fixo (None = sem limite de taxa)"""
+        taxas = [t for t in (self.taxa, self.teto) if t]
+        return min(taxas) if taxas else None
+    
+    def reservar(self, agora: float, adaptativo: bool = True) -> Optional[float]:
+        """
+        0 se a requisição pode sair agora; senão segundos até tentar de novo (None = até uma vaga liberar).
+        Com `adaptativo=False` (agendador desativado), só o teto fixo de taxa vale.
+        """
+        if adaptativo:
+            if agora < self.pausa_ate:
+                return self.pausa_ate - agora
+            if self.em_andamento >= int(self.limite):
+                self.saturado = True
+                return None
+        taxa = self.taxa_efetiva() if adaptativo else self.teto
+        if taxa is not None:
+            self.tokens = min(max(1.0, self.limite), self.tokens + (agora - self.ultimo) * taxa)
+            self.ultimo = agora
+            if self.tokens < 1:
+                self.saturado = True
+                return (1 - self.tokens) / taxa
+            self.tokens -= 1
+        if adaptativo:
+            self.em_andamento += 1
+            self.inicios.append(agora)
+        return 0.0
+    
+    def concluir(self, agora: float, status: Optional[int], segundos: float, retry_after: Optional[float]):
+        """Ajusta os limites com o resultado de uma requisição (status None = falha de rede)"""
+        self.em_andamento -= 1
+        if status in self.STATUS_SOBRECARGA:
+            if retry_after:
+                self.pausa_ate = max(self.pausa_ate, agora + retry_after)
+            if self._reduzir(agora, 0.5, f"HTTP {status}"):
+                # A vazão que provocou a sobrecarga vira referência para a taxa
+                taxa = self._taxa_observada(agora)
+                if self.taxa is not None:
+                    taxa = min(taxa, self.taxa) if taxa else self.taxa
+                self.taxa = max(0.5, (taxa or self.limite) * 0.75)
+                self.tokens = 0.0
+                self.ultimo = agora
+            return
+        if status is None:
+            self._reduzir(agora, 0.5, "falha de rede")
+            return
+        
+        self.latencia_media = segundos if self.latencia_media is None else self.latencia_media * 0.8 + segundos * 0.2
+        if self.latencia_base is None:
+            self.latencia_base = self.latencia_media
+        else:
+            # Referência acompanha a menor latência e sobe devagar quando a API muda de patamar
+            self.latencia_base = min(self.latencia_media,
+                                     self.latencia_base + (self.latencia_media - self.latencia_base) * 0.01)
+        if self.latencia_media > self.latencia_base * LATENCY_TOLERANCE and self.latencia_media > 0.05:
+            self._reduzir(agora, 0.8, f"latência {self.latencia_media * 1000:.0f}ms")
+        elif self.saturado:
+            self.saturado = False
+            # Dobra a cada ida e volta até a primeira sobrecarga; depois cresce +1 por janela
+            self.limite = min(float(self.maximo), self.limite + (1 if not self.ultima_reducao else 1 / self.limite))
+            if self.taxa is not None:
+                self.taxa += max(1.0, self.taxa * 0.1) / self.taxa
+    
+    def _reduzir(self, agora: float, fator: float, motivo: str) -> bool:
+        """Reduz o limite no máximo uma vez por janela (~latência média); retorna se reduziu"""
+        if self.ultima_reducao and agora - self.ultima_reducao < max(0.1, self.latencia_media or 0):
+            return False
+        self.ultima_reducao = agora
+        anterior = self.limite
+        self.limite = max(1.0, self.limite * fator)
+        logger.info("Scheduler %s: %s, concurrency %.0f -> %.0f", self.nome, motivo, anterior, self.limite)
+        return True
+    
+    def _taxa_observada(self, agora: float) -> Optional[float]:
+        """Requisições/s iniciadas no último segundo (None sem amostras suficientes)"""
+        recentes = [t for t in self.inicios if agora - t <= 1.0]
+        if len(recentes) < 2:
+            return None
+        return len(recentes) / max(agora - recentes[0], 0.001)
+
+
+class RequestScheduler:
+    """
+    Agendador por onde passam todas as requisições à API (cada tentativa).
+    
+    Cada classe de endpoint (auth, leitura, escrita) tem um limite adaptativo de
+    requisições simultâneas (AIMD): cai pela metade com 429/503 ou falhas de
+    rede, cai 20% quando a latência passa de LATENCY_TOLERANCE vezes a
+    referência e sobe enquanto a API responde bem e o limite está em uso. O
+    primeiro 429 também ativa uma taxa em token bucket, a partir da vazão que o
+    provocou, e Retry-After pausa a classe inteira, não só a thread que o recebeu.
+    Um teto fixo de taxa (`--rate`) vale durante um lote, com o agendador ativo ou não.
+    """
+    
+    def __init__(self, inicial: int = INFLIGHT_INITIAL, maximo: int = INFLIGHT_MAX,
+                 ativo: bool = ADAPTIVE_SCHEDULER):
+        self.inicial = inicial
+        self.maximo = maximo
+        self.ativo = ativo
+        self._cond = threading.Condition()
+        self._classes: Dict[str, _LimiteAdaptativo] = {}
+    
+    def workers(self, concorrencia: int) -> int:
+        """
+        Threads (ou tarefas asyncio) de um lote: com o agendador ativo, o bastante
+        para ele chegar ao limite máximo, já que é ele quem decide quantas
+        requisições saem ao mesmo tempo; desativado, a `concorrencia` pedida.
+        """
+        return max(1, self.maximo if self.ativo else concorrencia)
+    
+    @contextlib.contextmanager
+    def teto_taxa(self, classe: str, taxa: float):
+        """Limita a classe de endpoint a `taxa` requisições/s enquanto o bloco executa (0 = sem teto)"""
+        if taxa <= 0:
+            yield
+            return
+        with self._cond:
+            limite = self._classes.get(classe)
+            if limite is None:
+                limite = self._classes[classe] = _LimiteAdaptativo(classe, self.inicial, self.maximo)
+            anterior = limite.teto
+            limite.teto = taxa
+            limite.tokens, limite.ultimo = min(limite.tokens, max(1.0, taxa)), time.monotonic()
+        try:
+            yield
+        finally:
+            with self._cond:
+                limite.teto = anterior
+                if not self.ativo and anterior is None:
+                    del self._classes[classe]
+                self._cond.notify_all()
+    
+    @staticmethod
+    def classe(method: str, endpoint: str) -> str:
+        if endpoint.startswith("auth/"):
+            return "auth"
+        return "leitura" if method.upper() == "GET" else "escrita"
+    
+    def _limite(self, method: str, endpoint: str) -> Optional[_LimiteAdaptativo]:
+        nome = self.classe(method, endpoint)
+        limite = self._classes.get(nome)
+        if limite is None and self.ativo:
+            limite = self._classes[nome] = _LimiteAdaptativo(nome, self.inicial, self.maximo)
+        return limite
+    
+    def adquirir(self, method: str, endpoint: str) -> Optional[_LimiteAdaptativo]:
+        """Bloqueia até a requisição poder sair; o retorno deve ser entregue a liberar()"""
+        if not self.ativo and not self._classes:
+            return None
+        with self._cond:
+            limite = self._limite(method, endpoint)
+            if limite is None:
+                return None
+            while True:
+                espera = limite.reservar(time.monotonic(), self.ativo)
+                if espera == 0:
+                    return limite if self.ativo else None
+                self._cond.wait(espera)
+    
+    async def adquirir_async(self, method: str, endpoint: str) -> Optional[_LimiteAdaptativo]:
+        """Versão asyncio de adquirir(), que não bloqueia o event loop"""
+        if not self.ativo and not self._classes:
+            return None
+        while True:
+            with self._cond:
+                limite = self._limite(method, endpoint)
+                if limite is None:
+                    return None
+                espera = limite.reservar(time.monotonic(), self.ativo)
+            if espera == 0:
+                return limite if self.ativo else None
+            await asyncio.sleep(espera if espera is not None else 0.005)
+    
+    def liberar(self, limite: Optional[_LimiteAdaptativo], response: Any, segundos: float):
+        """Devolve a vaga e ajusta os limites da classe (response None = a requisição falhou)"""
+        if limite is None:
+            return
+        status = response.status_code if response is not None else None
+        retry_after = _segundos_retry_after(response.headers.get("Retry-After")) if response is not None else None
+        with self._cond:
+            limite.concluir(time.monotonic(), status, segundos, retry_after)
+            self._cond.notify_all()
+    
+    def estado(self) -> Dict[str, Dict[str, Any]]:
+        """Limites atuais por classe de endpoint (para logs e métricas)"""
+        with self._cond:
+            return {nome: {"simultaneas": int(l.limite), "taxa": l.taxa_efetiva() and round(l.taxa_efetiva(), 1),
+                           "latencia_ms": round((l.latencia_media or 0) * 1000, 1)}
+                    for nome, l in self._classes.items()}
+
+
+def _converter_erro_httpx(httpx, erro: Exception) -> Exception:
+    """Converte exceções do httpx nas equivalentes do requests"""
+    if isinstance(erro, httpx.ConnectTimeout):
+        return requests.exceptions.ConnectTimeout(str(erro))
+    if isinstance(erro, httpx.ConnectError):
+        return requests.exceptions.ConnectionError(str(erro))
+    if isinstance(erro, httpx.TimeoutException):
+        return requests.exceptions.ReadTimeout(str(erro))
+    return requests.exceptions.RequestException(str(erro))
+
+
+def _rastreador_httpx(fases: Dict[str, float], assincrono: bool = False) -> Callable[..., Any]:
+    """
+    Callback de trace do httpx (extensions={"trace": ...}) que preenche `fases`:
+    "connect" (DNS + TCP + TLS, só quando abre conexão) e "ttfb" (até os cabeçalhos da resposta).
+    """
+    inicio = time.perf_counter()
+    marcas: Dict[str, float] = {}
+    
+    def registrar(evento: str, info: Any):
+        agora = time.perf_counter()
+        etapa, _, fase = evento.rpartition(".")
+        if fase == "started":
+            marcas[etapa] = agora
+        elif fase == "complete":
+            if etapa in ("connection.connect_tcp", "connection.start_tls"):
+                fases["connect"] = fases.get("connect", 0.0) + agora - marcas.get(etapa, agora)
+            elif etapa.endswith("receive_response_headers"):
+                fases["ttfb"] = agora - inicio
+    
+    if not assincrono:
+        return registrar
+    
+    async def registrar_async(evento: str, info: Any):
+        registrar(evento, info)
+    return registrar_async
+
+
+def _fases_resposta(response: Any) -> Dict[str, float]:
+    """Fases informadas pelo transporte; no requests, `elapsed` vai do envio até os cabeçalhos (TTFB)"""
+    fases = getattr(response, "fases", None)
+    if fases is not None:
+        return fases
+    elapsed = getattr(response, "elapsed", None)
+    return {"ttfb": elapsed.total_seconds()} if elapsed is not None else {}
+
+
+_ORJSON: Any = None
+
+
+def _json_loads(dados: Any) -> Any:
+    """Decodifica JSON direto dos bytes da resposta: orjson quando instalado, senão json"""
+    global _ORJSON
+    if _ORJSON is None:
+        try:
+            _ORJSON = importlib.import_module("orjson")
+        except ImportError:
+            _ORJSON = False
+    if _ORJSON:
+        return _ORJSON.loads(dados)
+    return json.loads(dados)
+
+
+class RespostaStream:
+    """
+    Corpo JSON de uma resposta GET lido conforme chega da rede.
+    
+    Iterar gera os registros da lista principal (a própria resposta ou o campo
+    users/data/agents); os demais campos de topo (has_more, next_cursor, total)
+    ficam em `meta` ao final. Com ijson instalado o corpo é analisado de forma
+    incremental; sem ele, é lido de uma vez e decodificado por _json_loads.
+    Uma falha no meio do corpo encerra a iteração e fica em `erro`.
+    """
+    
+    CHAVES = ("users", "data", "agents")
+    ESCALARES = ("string", "number", "boolean", "null")
+    
+    def __init__(self, response: Any):
+        self.response = response
+        self.meta: Dict[str, Any] = {}
+        self.quantidade = 0
+        self.erro: Optional[str] = None
+    
+    def __iter__(self) -> Iterator[Any]:
+        try:
+            for item in self._itens():
+                self.quantidade += 1
+                yield item
+        except Exception as e:
+            logger.error("Streamed response failed after %s items: %s", self.quantidade, e)
+            self.erro = f"Resposta interrompida: {type(e).__name__}: {e}"
+        finally:
+            self.response.close()
+    
+    def _itens(self) -> Iterator[Any]:
+        # Só respostas do requests expõem o corpo ainda não lido (raw)
+        fonte = getattr(self.response, "raw", None)
+        try:
+            ijson = importlib.import_module("ijson") if fonte is not None else None
+        except ImportError:
+            ijson = None
+        if ijson is None:
+            yield from self._itens_completo()
+            return
+        
+        fonte.decode_content = True  # gzip/deflate descomprimidos pelo urllib3
+        # read1 (urllib3 2) devolve o que já chegou, sem esperar o buffer do ijson encher
+        arquivo = types.SimpleNamespace(read=fonte.read1) if hasattr(fonte, "read1") else fonte
+        alvos = {"item"} | {f"{chave}.item" for chave in self.CHAVES}
+        construtor = None
+        for prefixo, evento, valor in ijson.parse(arquivo, use_float=True):
+            if construtor is not None:
+                construtor.event(evento, valor)
+                if prefixo in alvos and evento in ("end_map", "end_array"):
+                    yield construtor.value
+                    construtor = None
+            elif prefixo in alvos:
+                if evento in ("start_map", "start_array"):
+                    construtor = ijson.ObjectBuilder()
+                    construtor.event(evento, valor)
+                else:
+                    yield valor
+            elif prefixo and "." not in prefixo and evento in self.ESCALARES:
+                self.meta[prefixo] = valor
+    
+    def _itens_completo(self) -> Iterator[Any]:
+        conteudo = self.response.content
+        dados = _json_loads(conteudo) if conteudo else []
+        if isinstance(dados, dict):
+            chave = next((c for c in self.CHAVES if isinstance(dados.get(c), list)), None)
+            self.meta = {k: v for k, v in dados.items() if k != chave}
+            dados = dados[chave] if chave else []
+        yield from dados
+
+
+def _registrar_retentativa(tentativa: int, maximo: int, espera: float, method: str,
+                           endpoint: str, motivo: str, on_retry: Optional[Callable[..., None]]):
+    logger.warning("Retry %s/%s in %.1fs: %s %s - %s", tentativa, maximo, espera, method, endpoint, motivo)
+    if on_retry:
+        on_retry(tentativa, espera, motivo)
+
+
+class SyncApiClient:
+    """
+    Cliente HTTP síncrono da API Qube.
+    
+    Concentra a sessão HTTP, os timeouts, as retentativas e o circuit breaker;
+    devolve a resposta bruta e deixa a interpretação para QubeAdminCLI.
+    """
+    
+    def __init__(self, base_url: str = API_BASE_URL, session: Any = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 scheduler: Optional[RequestScheduler] = None):
+        self.base_url = base_url
+        self._session = session
+        self._lock_sessao = threading.Lock()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.scheduler = scheduler or RequestScheduler()
+    
+    @property
+    def session(self) -> Any:
+        """Sessão HTTP, criada na primeira requisição (adia a importação do requests)"""
+        if self._session is None:
+            with self._lock_sessao:
+                if self._session is None:
+                    self._session = criar_sessao_http()
+        return self._session
+    
+    def make_url(self, endpoint: str) -> str:
+        return f"{self.base_url}/api/{API_VERSION}/{endpoint}"
+    
+    def _enviar(self, method: str, url: str, data: Optional[Dict], params: Optional[Dict],
+                headers: Optional[Dict[str, str]], stream: bool = False):
+        """Executa uma única tentativa HTTP com os timeouts de conexão e leitura configurados"""
+        timeout = (self.retry_policy.connect_timeout, self.retry_policy.read_timeout)
+        if method.upper() == "GET":
+            return self.session.get(url, params=params or data, headers=headers, timeout=timeout, stream=stream)
+        elif method.upper() == "POST":
+            return self.session.post(url, json=data, headers=headers, timeout=timeout)
+        elif method.upper() == "PUT":
+            return self.session.put(url, json=data, headers=headers, timeout=timeout)
+        elif method.upper() == "DELETE":
+            return self.session.delete(url, headers=headers, timeout=timeout)
+        raise ValueError(f"Método HTTP inválido: {method}")
+    
+    def _enviar_agendado(self, method: str, url: str, endpoint: str, data: Optional[Dict],
+                         params: Optional[Dict], headers: Optional[Dict[str, str]], stream: bool):
+        """Uma tentativa passando pelo RequestScheduler (espera a vez e informa o resultado)"""
+        vaga = self.scheduler.adquirir(method, endpoint)
+        inicio = time.monotonic()
+        response = None
+        try:
+            response = self._enviar(method, url, data, params, headers, stream)
+            return response
+        finally:
+            self.scheduler.liberar(vaga, response, time.monotonic() - inicio)
+    
+    def request(self, method: str, endpoint: str, data: Optional[Dict] = None,
+                params: Optional[Dict] = None, headers: Optional[Dict[str, str]] = None,
+                idempotency_key: Optional[str] = None,
+                on_retry: Optional[Callable[..., None]] = None, stream: bool = False):
+        """
+        Envia a requisição repetindo falhas transitórias; levanta CircuitOpenError ou exceções do requests.
+        
+        Com `stream=True` (GET) retorna assim que os cabeçalhos chegam e o corpo é lido sob demanda.
+        """
+        url = self.make_url(endpoint)
+        tentativa = 0
+        while True:
+            # Também antes de cada retentativa: o circuito pode ter aberto no meio delas
+            if not self.circuit_breaker.permitir():
+                raise CircuitOpenError(self.base_url)
+            try:
+                response = self._enviar_agendado(method, url, endpoint, data, params, headers, stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.circuit_breaker.registrar_falha()
+                espera = self.retry_policy.decidir(tentativa, method, endpoint, idempotency_key, erro=e)
+                if espera is None:
+                    raise
+                tentativa += 1
+                _registrar_retentativa(tentativa, self.retry_policy.max_retries, espera, method,
+                                       endpoint, type(e).__name__, on_retry)
+                time.sleep(espera)
+                continue
+            except BaseException:
+                # Sem resposta nem falha de conexão: não deixa o teste meio-aberto pendurado
+                self.circuit_breaker.liberar_teste()
+                raise
+            
+            # 429 também prova que a API responde (a vazão fica a cargo do agendador)
+            if response.status_code >= 500:
+                self.circuit_breaker.registrar_falha()
+            else:
+                self.circuit_breaker.registrar_sucesso()
+            espera = self.retry_policy.decidir(tentativa, method, endpoint, idempotency_key, response=response)
+            if espera is None:
+                return response
+            if stream:
+                response.close()  # devolve ao pool a conexão com o corpo não lido
+            tentativa += 1
+            _registrar_retentativa(tentativa, self.retry_policy.max_retries, espera, method,
+                                   endpoint, f"HTTP {response.status_code}", on_retry)
+            time.sleep(espera)
+
+
+class _RespostaAsync:
+    """Resposta já lida por completo, com a interface usada de requests.Response"""
+    
+    def __init__(self, status_code: int, headers: Any, content: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+    
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+
+class AsyncApiClient:
+    """
+    Cliente HTTP asyncio da API Qube, com a mesma política de retentativas e o
+    mesmo circuit breaker do SyncApiClient.
+    
+    Usa httpx ou aiohttp quando instalados; sem eles, executa o cliente
+    síncrono em threads para manter o mesmo comportamento.
+    """
+    
+    def __init__(self, base_url: str = API_BASE_URL, retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None, pool_size: int = POOL_SIZE,
+                 headers: Optional[Dict[str, str]] = None, scheduler: Optional[RequestScheduler] = None):
+        self.base_url = base_url
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.scheduler = scheduler or RequestScheduler()
+        self.pool_size = pool_size
+        self.headers = dict(headers or {})
+        self.backend: Optional[str] = None
+        self._client: Any = None
+        self._mod: Any = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    async def __aenter__(self) -> "AsyncApiClient":
+        try:
+            import httpx
+            self._mod = httpx
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+            self.backend = "httpx"
+        except ImportError:
+            try:
+                import aiohttp
+                self._mod = aiohttp
+                self._client = aiohttp.ClientSession(
+                    headers=self.headers, connector=aiohttp.TCPConnector(limit=self.pool_size))
+                self.backend = "aiohttp"
+            except ImportError:
+                sessao = criar_sessao_http(self.pool_size, http2=False)
+                sessao.headers.update(self.headers)
+                self._client = SyncApiClient(self.base_url, sessao, self.retry_policy, self.circuit_breaker,
+                                             self.scheduler)
+                # O executor padrão do asyncio tem poucas threads; o agendador é quem limita a concorrência
+                self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="qube-async")
+                self.backend = "threads"
+        logger.info("Async HTTP engine: %s", self.backend)
+        return self
+    
+    async def __aexit__(self, *exc):
+        if self.backend == "httpx":
+            await self._client.aclose()
+        elif self.backend == "aiohttp":
+            await self._client.close()
+        else:
+            self._executor.shutdown(wait=True)
+            self._client.session.close()
+    
+    def make_url(self, endpoint: str) -> str:
+        return f"{self.base_url}/api/{API_VERSION}/{endpoint}"
+    
+    async def _enviar(self, method: str, url: str, data: Optional[Dict], params: Optional[Dict],
+                      headers: Optional[Dict[str, str]]):
+        get = method.upper() == "GET"
+        query = (params or data) if get else None
+        corpo = None if get or method.upper() == "DELETE" else data
+        if self.backend == "httpx":
+            httpx = self._mod
+            timeout = httpx.Timeout(self.retry_policy.read_timeout, connect=self.retry_policy.connect_timeout)
+            fases: Dict[str, float] = {}
+            try:
+                resposta = await self._client.request(method, url, params=query, json=corpo, headers=headers,
+                                                      timeout=timeout,
+                                                      extensions={"trace": _rastreador_httpx(fases, True)})
+                resposta.fases = fases
+                return resposta
+            except httpx.HTTPError as e:
+                raise _converter_erro_httpx(httpx, e)
+        
+        aiohttp = self._mod
+        timeout = aiohttp.ClientTimeout(sock_connect=self.retry_policy.connect_timeout,
+                                        sock_read=self.retry_policy.read_timeout)
+        if query:
+            query = {k: str(v) for k, v in query.items()}
+        try:
+            async with self._client.request(method, url, params=query, json=corpo,
+                                            headers=headers, timeout=timeout) as resp:
+                return _RespostaAsync(resp.status, resp.headers, await resp.read())
+        except aiohttp.ClientConnectorError as e:
+            raise requests.exceptions.ConnectionError(str(e))
+        except asyncio.TimeoutError as e:
+            raise requests.exceptions.ReadTimeout(str(e))
+        except aiohttp.ClientError as e:
+            raise requests.exceptions.RequestException(str(e))
+    
+    async def _enviar_agendado(self, method: str, url: str, endpoint: str, data: Optional[Dict],
+                               params: Optional[Dict], headers: Optional[Dict[str, str]]):
+        """Equivalente assíncrono de SyncApiClient._enviar_agendado"""
+        vaga = await self.scheduler.adquirir_async(method, endpoint)
+        inicio = time.monotonic()
+        response = None
+        try:
+            response = await self._enviar(method, url, data, params, headers)
+            return response
+        finally:
+            self.scheduler.liberar(vaga, response, time.monotonic() - inicio)
+    
+    async def request(self, method: str, endpoint: str, data: Optional[Dict] = None,
+                      params: Optional[Dict] = None, headers: Optional[Dict[str, str]] = None,
+                      idempotency_key: Optional[str] = None,
+                      on_retry: Optional[Callable[..., None]] = None):
+        """Equivalente assíncrono de SyncApiClient.request"""
+        if self.backend == "threads":
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(
+                self._client.request, method, endpoint, data, params, headers, idempotency_key, on_retry))
+        
+        url = self.make_url(endpoint)
+        tentativa = 0
+        while True:
+            # Também antes de cada retentativa: o circuito pode ter aberto no meio delas
+            if not self.circuit_breaker.permitir():
+                raise CircuitOpenError(self.base_url)
+            try:
+                response = await self._enviar_agendado(method, url, endpoint, data, params, headers)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.circuit_breaker.registrar_falha()
+                espera = self.retry_policy.decidir(tentativa, method, endpoint, idempotency_key, erro=e)
+                if espera is None:
+                    raise
+                tentativa += 1
+                _registrar_retentativa(tentativa, self.retry_policy.max_retries, espera, method,
+                                       endpoint, type(e).__name__, on_retry)
+                await asyncio.sleep(espera)
+                continue
+            except BaseException:
+                # Sem resposta nem falha de conexão: não deixa o teste meio-aberto pendurado
+                self.circuit_breaker.liberar_teste()
+                raise
+            
+            # 429 também prova que a API responde (a vazão fica a cargo do agendador)
+            if response.status_code >= 500:
+                self.circuit_breaker.registrar_falha()
+            else:
+                self.circuit_breaker.registrar_sucesso()
+            espera = self.retry_policy.decidir(tentativa, method, endpoint, idempotency_key, response=response)
+            if espera is None:
+                return response
+            tentativa += 1
+            _registrar_retentativa(tentativa, self.retry_policy.max_retries, espera, method,
+                                   endpoint, f"HTTP {response.status_code}", on_retry)
+            await asyncio.sleep(espera)
+
+
+def _copiar_resposta(valor: Any) -> Any:
+    """Cópia das listas e objetos de uma resposta (até os itens das listas), para quem a recebe poder alterá-la"""
+    if isinstance(valor, list):
+        return [dict(item) if isinstance(item, dict) else item for item in valor]
+    if isinstance(valor, dict):
+        return {chave: _copiar_resposta(v) if isinstance(v, list) else v for chave, v in valor.items()}
+    return valor
+
+
+class ReadCoalescer:
+    """
+    Leituras (GET) de uma sessão sem chamadas repetidas à API.
+    
+    Chamadas idênticas em andamento compartilham uma única requisição
+    (single-flight) e os resultados de sucesso ficam em um LRU com TTL curto;
+    cada chamador recebe sua própria cópia. Uma escrita descarta as leituras do
+    recurso que ela afeta (todas, se o recurso não for conhecido) e impede que
+    leituras iniciadas antes dela sejam guardadas ou compartilhadas depois.
+    """
+    
+    # Recursos (primeiro segmento do endpoint) cujas leituras uma escrita no recurso afeta
+    AFETADOS = {"users": ("users", "admin"), "admin": ("users", "admin"), "agents": ("agents",)}
+    
+    class _Voo:
+        __slots__ = ("pronto", "resultado", "estado", "geracao")
+        
+        def __init__(self, geracao: int):
+            self.pronto = threading.Event()
+            self.resultado: Any = None
+            self.estado: Optional[Dict[str, Any]] = None
+            self.geracao = geracao
+    
+    def __init__(self, ttl: float = MEMO_TTL, tamanho: int = MEMO_SIZE):
+        self.ttl = ttl
+        self.tamanho = tamanho
+        self._itens: "collections.OrderedDict[tuple, Tuple[float, Any, Dict[str, Any]]]" = collections.OrderedDict()
+        self._voos: Dict[tuple, "ReadCoalescer._Voo"] = {}
+        self._geracao = 0
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.compartilhadas = 0
+    
+    @property
+    def ativo(self) -> bool:
+        return self.ttl > 0
+    
+    def obter(self, chave: tuple, buscar: Callable[[], Tuple[Any, Dict[str, Any]]]) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Resultado de `buscar()` para a chave, sem repetir a requisição.
+        
+        `buscar` devolve (resultado, estado da resposta); o estado (erro, status,
+        cabeçalhos) acompanha o resultado para quem o recebe da memória ou de outra thread.
+        """
+        with self._lock:
+            item = self._itens.get(chave)
+            if item and time.monotonic() - item[0] < self.ttl:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return _copiar_resposta(item[1]), item[2]
+            voo = self._voos.get(chave)
+            lider = voo is None
+            if lider:
+                voo = self._voos[chave] = self._Voo(self._geracao)
+            else:
+                self.compartilhadas += 1
+        
+        if not lider:
+            voo.pronto.wait()
+            if voo.estado is not None:
+                return _copiar_resposta(voo.resultado), voo.estado
+            return buscar()  # a requisição compartilhada terminou com exceção
+        
+        try:
+            resultado, estado = buscar()
+            voo.resultado = _copiar_resposta(resultado)
+            voo.estado = estado
+        finally:
+            with self._lock:
+                if self._voos.get(chave) is voo:
+                    del self._voos[chave]
+                if voo.estado is not None and resultado is not None and voo.geracao == self._geracao:
+                    self._itens[chave] = (time.monotonic(), voo.resultado, voo.estado)
+                    self._itens.move_to_end(chave)
+                    while len(self._itens) > self.tamanho:
+                        self._itens.popitem(last=False)
+            voo.pronto.set()
+        return resultado, estado
+    
+    def invalidar(self, endpoint: Optional[str] = None):
+        """Descarta as leituras afetadas por uma escrita em `endpoint` (sem endpoint: todas)"""
+        recurso = endpoint.strip("/").split("/", 1)[0] if endpoint else None
+        afetados = self.AFETADOS.get(recurso) if recurso else None
+        with self._lock:
+            self._geracao += 1
+            for grupo in (self._itens, self._voos):
+                for chave in [c for c in grupo if afetados is None or c[0].split("/", 1)[0] in afetados]:
+                    del grupo[chave]
+
+
+def _percentil(ordenados: list, p: float) -> float:
+    """Percentil por interpolação linear (valores já ordenados)"""
+    if not ordenados:
+        return 0.0
+    posicao = (len(ordenados) - 1) * p / 100
+    inferior = int(posicao)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicao - inferior)
+
+
+class _Histograma:
+    """Histograma cumulativo no estilo Prometheus, com as amostras recentes para os percentis"""
+    
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.soma = 0.0
+        self.amostras: "collections.deque[float]" = collections.deque(maxlen=METRICS_MAX_SAMPLES)
+    
+    def observar(self, segundos: float):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, segundos)] += 1
+        self.soma += segundos
+        self.amostras.append(segundos)
+    
+    @property
+    def contagem(self) -> int:
+        return sum(self.buckets)
+
+
+def _rotulos(**valores: Any) -> str:
+    """Rótulos de uma amostra no formato texto do Prometheus"""
+    def escapar(valor: Any) -> str:
+        return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{nome}="{escapar(valor)}"' for nome, valor in valores.items()) + "}"
+
+
+class RequestMetrics:
+    """
+    Latência, erros e retentativas das requisições, agregados por método e endpoint.
+    
+    Cada chamada de _make_request é uma observação (com o tempo das retentativas);
+    IDs no caminho viram {id} para que `agents/<id>/assign` seja uma única série.
+    """
+    
+    # Segmentos do endpoint com dígitos (IDs)
+    SEGMENTO_ID = re.compile(r"(?<=/)[^/]*\d[^/]*(?=/|$)")
+    
+    def __init__(self):
+        self._series: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._series)
+    
+    @classmethod
+    def rota(cls, endpoint: str) -> str:
+        return cls.SEGMENTO_ID.sub("{id}", endpoint.split("?", 1)[0])
+    
+    def registrar(self, method: str, endpoint: str, status: Any, segundos: float,
+                  retries: Optional[int] = 0, fases: Optional[Dict[str, float]] = None):
+        """Registra uma requisição; `status` é o código HTTP ou o nome da exceção"""
+        chave = (method.upper(), self.rota(endpoint))
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = {"status": collections.Counter(), "erros": 0, "retries": 0,
+                                               "fases": {"total": _Histograma()}}
+            serie["status"][str(status)] += 1
+            if not isinstance(status, int) or status >= 400:
+                serie["erros"] += 1
+            serie["retries"] += retries or 0
+            serie["fases"]["total"].observar(segundos)
+            for fase, valor in (fases or {}).items():
+                serie["fases"].setdefault(fase, _Histograma()).observar(valor)
+    
+    def resumo(self) -> list:
+        """Uma linha por endpoint: requisições, erros, retentativas e percentis em ms"""
+        linhas = []
+        with self._lock:
+            for (method, rota), serie in sorted(self._series.items(), key=lambda item: (item[0][1], item[0][0])):
+                total = serie["fases"]["total"]
+                ordenadas = sorted(total.amostras)
+                linha = {
+                    "method": method,
+                    "endpoint": rota,
+                    "n": total.contagem,
+                    "erros": serie["erros"],
+                    "erros_pct": round(100 * serie["erros"] / total.contagem, 1),
+                    "retentativas": serie["retries"],
+                    "p50_ms": round(_percentil(ordenadas, 50) * 1000, 1),
+                    "p95_ms": round(_percentil(ordenadas, 95) * 1000, 1),
+                    "p99_ms": round(_percentil(ordenadas, 99) * 1000, 1),
+                    "max_ms": round(ordenadas[-1] * 1000, 1),
+                }
+                for fase in ("connect", "ttfb"):
+                    if fase in serie["fases"]:
+                        amostras = sorted(serie["fases"][fase].amostras)
+                        linha[f"{fase}_p50_ms"] = round(_percentil(amostras, 50) * 1000, 1)
+                linha["status"] = dict(serie["status"])
+                linhas.append(linha)
+        return linhas
+    
+    def prometheus(self, openmetrics: bool = False) -> str:
+        """Exporta no formato texto do Prometheus (ou OpenMetrics, que termina com # EOF)"""
+        saida = []
+        
+        def familia(nome: str, tipo: str, ajuda: str):
+            # No OpenMetrics o nome da família de um counter não leva o sufixo _total
+            if openmetrics and tipo == "counter":
+                nome = nome[:-len("_total")]
+            saida.append(f"# HELP {nome} {ajuda}")
+            saida.append(f"# TYPE {nome} {tipo}")
+        
+        with self._lock:
+            series = sorted(self._series.items())
+            familia("qube_cli_requests_total", "counter", "Requisições à API Qube por endpoint e status")
+            for (method, rota), serie in series:
+                for status, n in sorted(serie["status"].items()):
+                    saida.append(f"qube_cli_requests_total{_rotulos(method=method, endpoint=rota, status=status)} {n}")
+            familia("qube_cli_request_errors_total", "counter", "Requisições com status >= 400 ou sem resposta")
+            for (method, rota), serie in series:
+                saida.append(f"qube_cli_request_errors_total{_rotulos(method=method, endpoint=rota)} {serie['erros']}")
+            familia("qube_cli_request_retries_total", "counter", "Retentativas de falhas transitórias")
+            for (method, rota), serie in series:
+                saida.append(f"qube_cli_request_retries_total{_rotulos(method=method, endpoint=rota)} {serie['retries']}")
+            familia("qube_cli_request_duration_seconds", "histogram",
+                    "Latência das requisições por fase (total, connect, ttfb)")
+            for (method, rota), serie in series:
+                for fase, histograma in sorted(serie["fases"].items()):
+                    acumulado = 0
+                    for limite, n in zip(LATENCY_BUCKETS + (float("inf"),), histograma.buckets):
+                        acumulado += n
+                        le = "+Inf" if limite == float("inf") else repr(limite)
+                        rotulos = _rotulos(method=method, endpoint=rota, phase=fase, le=le)
+                        saida.append(f"qube_cli_request_duration_seconds_bucket{rotulos} {acumulado}")
+                    rotulos = _rotulos(method=method, endpoint=rota, phase=fase)
+                    saida.append(f"qube_cli_request_duration_seconds_sum{rotulos} {histograma.soma!r}")
+                    saida.append(f"qube_cli_request_duration_seconds_count{rotulos} {acumulado}")
+        familia("qube_cli_last_run_timestamp_seconds", "gauge", "Fim da última sessão da CLI (epoch)")
+        saida.append(f"qube_cli_last_run_timestamp_seconds {time.time():.3f}")
+        if openmetrics:
+            saida.append("# EOF")
+        return "\n".join(saida) + "\n"
+    
+    def gravar(self, path: str):
+        """Grava o arquivo de forma atômica (o coletor nunca lê um arquivo pela metade)"""
+        diretorio = os.path.dirname(path)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus(openmetrics=path.endswith(".om")))
+        os.replace(tmp, path)
+
+
+# Campos em que a API pode informar os usuários associados a um worker
+CAMPOS_ASSOCIACAO = ("assigned_users", "users", "user_ids", "assigned_user_ids")
+
+
+def ids_usuarios_do_agent(agent: Dict[str, Any]) -> set:
+    """IDs dos usuários já associados a um worker, quando a API os informa"""
+    ids = set()
+    for campo in CAMPOS_ASSOCIACAO:
+        for item in agent.get(campo) or []:
+            user_id = item.get("id", item.get("user_id")) if isinstance(item, dict) else item
+            if user_id is not None:
+                ids.add(str(user_id))
+    return ids
+
+
+class _Registro:
+    """
+    Base dos modelos compactos de usuário e worker.
+    
+    Os atributos ficam em __slots__ (sem um __dict__ por instância) e só os
+    campos usados pela CLI são mantidos, mais os de QUBE_CLI_EXTRA_FIELDS. A
+    leitura é compatível com dict (get, [], in, keys) para substituir os dicts
+    da API sem mudar quem os consome.
+    """
+    
+    __slots__ = ("extra",)
+    CAMPOS: Tuple[str, ...] = ()
+    # Campos com poucos valores distintos, compartilhados entre as instâncias
+    INTERNADOS: Tuple[str, ...] = ()
+    
+    @classmethod
+    def from_dict(cls, dados: Dict[str, Any], campos_extra: Iterable[str] = EXTRA_FIELDS) -> Any:
+        obj = cls.__new__(cls)
+        for campo in cls.CAMPOS:
+            valor = dados.get(campo)
+            if campo in cls.INTERNADOS and isinstance(valor, str):
+                valor = sys.intern(valor)
+            setattr(obj, campo, valor)
+        obj.extra = {campo: dados[campo] for campo in campos_extra if campo in dados} or None
+        return obj
+    
+    @classmethod
+    def lista(cls, itens: Iterable[Any]) -> list:
+        """Converte registros da API ou do cache (os dicts de cada página podem ser descartados em seguida)"""
+        return [item if isinstance(item, cls) else cls.from_dict(item) for item in itens]
+    
+    def get(self, chave: str, padrao: Any = None) -> Any:
+        if chave in self.CAMPOS:
+            valor = getattr(self, chave)
+        else:
+            valor = self.extra.get(chave) if self.extra else None
+        return padrao if valor is None else valor
+    
+    def __getitem__(self, chave: str) -> Any:
+        if chave in self.CAMPOS:
+            return getattr(self, chave)
+        if self.extra and chave in self.extra:
+            return self.extra[chave]
+        raise KeyError(chave)
+    
+    def __contains__(self, chave: str) -> bool:
+        return chave in self.CAMPOS or bool(self.extra and chave in self.extra)
+    
+    def keys(self) -> list:
+        return list(self.CAMPOS) + list(self.extra or ())
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Campos preenchidos, no formato gravado no cache e nas saídas JSON"""
+        dados = {campo: getattr(self, campo) for campo in self.CAMPOS}
+        dados.update(self.extra or {})
+        return {chave: valor for chave, valor in dados.items() if valor is not None}
+    
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class User(_Registro):
+    """Usuário de admin/users"""
+    
+    __slots__ = ("id", "name", "email", "status", "company_id")
+    CAMPOS = __slots__
+    INTERNADOS = ("status", "company_id")
+
+
+class Agent(_Registro):
+    """Worker de agents/, com os IDs dos usuários associados normalizados em uma tupla"""
+    
+    __slots__ = ("id", "name", "status", "assigned_user_ids")
+    CAMPOS = __slots__
+    INTERNADOS = ("status",)
+    
+    @classmethod
+    def from_dict(cls, dados: Dict[str, Any], campos_extra: Iterable[str] = EXTRA_FIELDS) -> Any:
+        obj = super().from_dict(dados, campos_extra)
+        obj.assigned_user_ids = tuple(sorted(ids_usuarios_do_agent(dados)))
+        return obj
+
+
+def _para_json(obj: Any) -> Any:
+    """`default` do json.dump para os modelos compactos"""
+    if isinstance(obj, _Registro):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def normalizar_texto(texto: str) -> str:
+    """Minúsculas e sem acentos, para comparação em buscas"""
+    decomposto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in decomposto if not unicodedata.combining(c)).lower().strip()
+
+
+def _trigramas(texto: str) -> set:
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def _sem_dominio(texto: str) -> str:
+    """Parte local de um email ("maria.silva@bmg.com.br" -> "maria.silva"); outros textos ficam iguais"""
+    return texto.split("@", 1)[0] if "@" in texto else texto
+
+
+class SearchIndex:
+    """
+    Índice em memória para busca aproximada de usuários e workers.
+    
+    Combina correspondência exata (email/ID), prefixo de palavras (bisect sobre
+    os tokens ordenados), substring e, só quando nenhum prefixo casa,
+    similaridade por trigramas. Os trigramas cobrem nomes e a parte local dos
+    emails: o domínio (igual para quase todos) e IDs não indicam semelhança.
+    É construído uma vez por lista e reutilizado entre as buscas da sessão.
+    """
+    
+    CAMPOS = ("email", "name", "id")
+    CAMPOS_APROXIMADOS = ("email", "name")
+    MAX_BUSCAS_MEMORIZADAS = 64
+    SIMILARIDADE_MINIMA = 0.6
+    
+    def __init__(self, registros: list, campos: Tuple[str, ...] = CAMPOS):
+        self.registros = registros
+        self._textos: list = []
+        self._aproximados: list = []
+        self._exatos: Dict[str, int] = {}
+        self._tokens: list = []
+        self._indices_tokens: list = []
+        self._trigramas: Dict[str, list] = {}
+        self._buscas: Dict[str, list] = {}
+        tokens_registros = []
+        
+        for idx, registro in enumerate(registros):
+            valores = [normalizar_texto(str(registro.get(c) or "")) for c in campos]
+            valores = [v for v in valores if v]
+            texto = " ".join(valores)
+            self._textos.append(texto)
+            tokens = set(valores)
+            for valor in valores:
+                self._exatos.setdefault(valor, idx)
+                tokens.update(t for t in _TOKEN_SPLIT.split(valor) if t)
+                if "@" in valor:
+                    tokens.add(valor.split("@", 1)[1])
+            tokens_registros.extend((t, idx) for t in tokens)
+            aproximado = " ".join(_sem_dominio(normalizar_texto(str(registro.get(c) or "")))
+                                  for c in campos if c in self.CAMPOS_APROXIMADOS)
+            self._aproximados.append(aproximado)
+            for tri in _trigramas(aproximado):
+                self._trigramas.setdefault(tri, []).append(idx)
+        # Tokens ordenados e os registros de cada um em listas paralelas: um prefixo vira uma fatia
+        tokens_registros.sort()
+        self._tokens = [t for t, _ in tokens_registros]
+        self._indices_tokens = [idx for _, idx in tokens_registros]
+        # Posição de cada registro na ordem alfabética, para ordenar resultados sem comparar textos
+        self._posicao = [0] * len(registros)
+        for posicao, idx in enumerate(sorted(range(len(registros)), key=self._textos.__getitem__)):
+            self._posicao[idx] = posicao
+    
+    def __len__(self) -> int:
+        return len(self.registros)
+    
+    def _por_prefixo(self, termo: str) -> set:
+        inicio = bisect.bisect_left(self._tokens, termo)
+        fim = bisect.bisect_left(self._tokens, termo + "\U0010ffff", inicio)
+        return set(self._indices_tokens[inicio:fim])
+    
+    def _por_trigramas(self, termo: str) -> Dict[int, float]:
+        """Registros com ao menos SIMILARIDADE_MINIMA dos trigramas do termo (sem o domínio, se for um email)"""
+        tris = sorted(_trigramas(_sem_dominio(termo)), key=lambda t: len(self._trigramas.get(t, ())))
+        if not tris:
+            return {}
+        # Quem atinge a similaridade mínima tem no máximo `faltas` trigramas ausentes, logo tem ao
+        # menos um dos faltas + 1 mais raros: só as listas curtas geram candidatos, conferidos no texto
+        faltas = int(len(tris) * (1 - self.SIMILARIDADE_MINIMA))
+        raros, comuns = tris[:faltas + 1], tris[faltas + 1:]
+        candidatos = collections.Counter(itertools.chain.from_iterable(self._trigramas.get(t, ()) for t in raros))
+        pontos = {}
+        for idx, encontrados in candidatos.items():
+            texto = self._aproximados[idx]
+            similaridade = (encontrados + sum(1 for tri in comuns if tri in texto)) / len(tris)
+            if similaridade >= self.SIMILARIDADE_MINIMA:
+                pontos[idx] = similaridade
+        return pontos
+    
+    def buscar(self, termo: str) -> list:
+        """Retorna os registros que correspondem ao termo, do mais ao menos relevante"""
+        termo = normalizar_texto(termo)
+        if not termo:
+            return self.registros
+        if termo in self._buscas:
+            return self._buscas[termo]
+        
+        palavras = termo.split()
+        # "@bmg" procura pelo domínio dos emails
+        prefixados = self._por_prefixo(termo.lstrip("@") or termo)
+        if len(palavras) > 1:
+            # "mar san" encontra "Maria Santos": todas as palavras como prefixo
+            comuns = None
+            for palavra in sorted(palavras, key=len, reverse=True):
+                comuns = self._por_prefixo(palavra) if comuns is None else comuns & self._por_prefixo(palavra)
+                if not comuns:
+                    break
+            prefixados |= comuns
+        # Trigramas só para erros de digitação: com algum prefixo casando, não vale o custo
+        aproximados = {} if prefixados else self._por_trigramas(termo)
+        contem = [idx for idx in aproximados if termo in self._textos[idx]]
+        for idx in contem:
+            del aproximados[idx]
+        
+        # Ordem: exato, prefixo, substring e trigramas (mais semelhantes antes); empates em ordem alfabética
+        posicao = self._posicao.__getitem__
+        exato = self._exatos.get(termo)
+        prefixados.discard(exato)
+        ordem = [] if exato is None else [exato]
+        ordem += sorted(prefixados, key=posicao)
+        ordem += sorted(contem, key=posicao)
+        ordem += sorted(aproximados, key=lambda idx: (-aproximados[idx], posicao(idx)))
+        resultado = [self.registros[i] for i in ordem]
+        
+        if len(self._buscas) >= self.MAX_BUSCAS_MEMORIZADAS:
+            self._buscas.pop(next(iter(self._buscas)))
+        self._buscas[termo] = resultado
+        return resultado
+    
+    def pagina(self, pagina: int, tamanho: int, search: Optional[str] = None) -> Tuple[list, bool, Optional[str]]:
+        """Mesmo formato de _buscar_pagina_usuarios, resolvido sobre o índice"""
+        registros = self.buscar(search) if search else self.registros
+        inicio = (pagina - 1) * tamanho
+        return registros[inicio:inicio + tamanho], inicio + tamanho < len(registros), None
+
+
+def jwt_expiracao(token: str) -> Optional[float]:
+    """Lê o campo `exp` de um JWT localmente (sem validar assinatura)"""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+        return float(exp) if exp is not None else None
+    except (IndexError, ValueError, TypeError, AttributeError):
+        return None
+
+
+class Perfil:
+    """
+    Ambiente da API com as credenciais do administrador, lido de PROFILES_FILE.
+    
+    Formato: {"nome": {"host": "https://...", "email": "...", "password_env": "VAR"}}.
+    A senha vem da variável em `password_env`, de QUBE_CLI_PASSWORD_<NOME> ou,
+    em último caso, de "password" no próprio arquivo (mantenha-o com permissão 0600).
+    """
+    
+    __slots__ = ("nome", "host", "email", "password")
+    
+    def __init__(self, nome: str, host: str, email: Optional[str] = None, password: Optional[str] = None):
+        self.nome = nome
+        self.host = host.rstrip("/")
+        self.email = email
+        self.password = password
+    
+    @staticmethod
+    def _variavel(prefixo: str, nome: str) -> Optional[str]:
+        return os.getenv(f"{prefixo}_{re.sub(r'[^A-Za-z0-9]', '_', nome).upper()}")
+    
+    @classmethod
+    def carregar(cls, path: str = PROFILES_FILE) -> Dict[str, "Perfil"]:
+        """Perfis do arquivo; levanta ValueError se ele não existir ou for inválido"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+        except FileNotFoundError:
+            raise ValueError(f"Arquivo de perfis não encontrado: {path} (QUBE_CLI_PROFILES)") from None
+        except (OSError, json.JSONDecodeError) as e:
+            raise ValueError(f"Arquivo de perfis inválido ({path}): {e}") from None
+        if not isinstance(dados, dict):
+            raise ValueError(f"Arquivo de perfis inválido ({path}): esperado um objeto por nome de perfil")
+        
+        perfis = {}
+        for nome, config in dados.items():
+            if not isinstance(config, dict) or not config.get("host"):
+                raise ValueError(f"Perfil '{nome}' sem host em {path}")
+            if config.get("password") and os.stat(path).st_mode & 0o077:
+                logger.warning("Profiles file %s holds passwords and is readable by other users", path)
+            password = ((os.getenv(config["password_env"]) if config.get("password_env") else None)
+                        or cls._variavel("QUBE_CLI_PASSWORD", nome) or config.get("password"))
+            perfis[nome] = cls(nome, config["host"], config.get("email") or cls._variavel("QUBE_CLI_EMAIL", nome),
+                               password)
+        return perfis
+    
+    @classmethod
+    def selecionar(cls, nomes: Iterable[str], path: str = PROFILES_FILE) -> list:
+        """Perfis pedidos (nomes repetidos ou separados por vírgula; "all" = todos), na ordem informada"""
+        pedidos = list(dict.fromkeys(n.strip() for item in nomes for n in item.split(",") if n.strip()))
+        if not pedidos:
+            return []
+        perfis = cls.carregar(path)
+        if "all" in pedidos:
+            return list(perfis.values())
+        faltando = [nome for nome in pedidos if nome not in perfis]
+        if faltando:
+            raise ValueError(f"Perfil(is) não encontrado(s) em {path}: {', '.join(faltando)} "
+                             f"(disponíveis: {', '.join(perfis) or 'nenhum'})")
+        return [perfis[nome] for nome in pedidos]
+    
+    def arquivo(self, path: Optional[str]) -> Optional[str]:
+        """Nome de arquivo próprio do perfil (`saida.csv` -> `saida.<perfil>.csv`) nas execuções em paralelo"""
+        if not path or path == "-":
+            return path
+        base, ext = os.path.splitext(path)
+        return f"{base}.{self.nome}{ext}"
+
+
+class SessionStore:
+    """
+    Sessões salvas em disco por host da API (token, refresh token e user_info).
+    
+    O arquivo é criado com permissão 0600; nenhuma senha é gravada.
+    """
+    
+    # Sessões de vários perfis em paralelo gravam o mesmo arquivo
+    _lock = threading.Lock()
+    
+    def __init__(self, path: str = SESSION_FILE, enabled: bool = SESSION_CACHE):
+        self.path = path
+        self.enabled = enabled
+    
+    def _load_all(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+            return dados if isinstance(dados, dict) else {}
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_all(self, dados: Dict[str, Any]):
+        try:
+            diretorio = os.path.dirname(self.path)
+            if diretorio:
+                os.makedirs(diretorio, mode=0o700, exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(dados, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning("Could not write session file: %s", e)
+    
+    def get(self, host: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        entrada = self._load_all().get(host)
+        return entrada if isinstance(entrada, dict) and entrada.get("access_token") else None
+    
+    def save(self, host: str, access_token: str, user_info: Optional[Dict[str, Any]],
+             refresh_token: Optional[str] = None):
+        if not self.enabled:
+            return
+        with self._lock:
+            dados = self._load_all()
+            dados[host] = {
+                "access_token": access_token,
+                "refresh_token": refresh_token,
+                "expires_at": jwt_expiracao(access_token),
+                "user_info": user_info,
+                "saved_at": time.time(),
+            }
+            self._save_all(dados)
+    
+    def clear(self, host: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            dados = self._load_all()
+            if dados.pop(host, None) is not None:
+                self._save_all(dados)
+                logger.info("Saved session removed for %s", host)
 
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL, logging.INFO),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=handlers
-)
 
-logger = logging.getLogger("QubeCLI")
+class AuditStore:
+    """
+    Trilha de auditoria local em SQLite (modo WAL), só de acréscimo.
+    
+    Cada alteração feita pela CLI vira uma linha de `eventos`, com índices por
+    usuário, worker, operador e data; triggers impedem UPDATE e DELETE. O banco
+    só é aberto no primeiro evento ou consulta. Uma falha ao gravar é registrada
+    no log e não interrompe a operação auditada.
+    """
+    
+    CAMPOS = ["ts", "operacao", "status", "email", "user_id", "agent_id", "agent",
+              "operador", "operador_id", "usuario_so", "perfil", "host", "erro", "origem"]
+    
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS eventos (
+            id INTEGER PRIMARY KEY,
+            ts TEXT NOT NULL,
+            operacao TEXT NOT NULL,
+            status TEXT NOT NULL,
+            email TEXT, user_id TEXT, agent_id TEXT, agent TEXT,
+            operador TEXT, operador_id TEXT, usuario_so TEXT, perfil TEXT, host TEXT,
+            erro TEXT,
+            origem TEXT NOT NULL,
+            chave TEXT UNIQUE
+        );
+        CREATE INDEX IF NOT EXISTS eventos_email ON eventos (email, ts);
+        CREATE INDEX IF NOT EXISTS eventos_user_id ON eventos (user_id, ts);
+        CREATE INDEX IF NOT EXISTS eventos_agent_id ON eventos (agent_id, ts);
+        CREATE INDEX IF NOT EXISTS eventos_agent ON eventos (agent, ts);
+        CREATE INDEX IF NOT EXISTS eventos_operador ON eventos (operador, ts);
+        CREATE INDEX IF NOT EXISTS eventos_ts ON eventos (ts);
+        CREATE TRIGGER IF NOT EXISTS eventos_sem_update BEFORE UPDATE ON eventos
+            BEGIN SELECT RAISE(ABORT, 'trilha de auditoria é só de acréscimo'); END;
+        CREATE TRIGGER IF NOT EXISTS eventos_sem_delete BEFORE DELETE ON eventos
+            BEGIN SELECT RAISE(ABORT, 'trilha de auditoria é só de acréscimo'); END;
+    """
+    
+    # Mensagens do log (texto ou JSON) que viram eventos na importação
+    _LINHA_TEXTO = re.compile(r"^(\d{4}-\d{2}-\d{2}) (\d{2}:\d{2}:\d{2}),(\d{3}) - \S+ - \w+ - (.*)$")
+    _MENSAGENS = (
+        (re.compile(r"User created successfully: (?P<email>\S+) \(ID: (?P<user_id>[^)]*)\)$"),
+         "criar_usuario", "criado"),
+        (re.compile(r"Failed to create user(?: \(batch line \d+\))?: (?P<email>\S+)(?: - (?P<erro>.*))?$"),
+         "criar_usuario", "erro"),
+        (re.compile(r"User (?P<email>\S+) assigned to agent (?P<agent_id>\S+)(?: \(batch line \d+\))?$"),
+         "associar", "associado"),
+        (re.compile(r"Failed to assign (?P<email>\S+) to agent (?P<agent_id>\S+): (?P<erro>.*)$"),
+         "associar", "erro"),
+        (re.compile(r"Password changed for user: (?P<email>\S+)$"), "trocar_senha", "alterada"),
+    )
+    _LOGIN = re.compile(r"Login successful for user: (\S+)$")
+    _HOST = re.compile(r"CLI iniciada\. API: (\S+)$")
+    
+    def __init__(self, path: str = AUDIT_DB, enabled: bool = not DISABLE_AUDIT):
+        self.path = path
+        self.enabled = enabled
+        self._conexao = None
+        self._lock = threading.Lock()
+    
+    def _abrir(self):
+        if self._conexao is None:
+            diretorio = os.path.dirname(self.path)
+            if diretorio:
+                os.makedirs(diretorio, mode=0o700, exist_ok=True)
+            if not os.path.exists(self.path):
+                os.close(os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o600))
+            conexao = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("PRAGMA synchronous=NORMAL")
+            conexao.executescript(self.ESQUEMA)
+            self._conexao = conexao
+        return self._conexao
+    
+    def registrar(self, evento: Dict[str, Any]):
+        """Acrescenta um evento da sessão (chamado pelas threads dos lotes)"""
+        if not self.enabled:
+            return
+        evento = dict(evento, ts=evento.get("ts") or datetime.now().isoformat(timespec="milliseconds"),
+                      origem=evento.get("origem") or "cli")
+        if evento.get("email"):
+            evento["email"] = str(evento["email"]).lower()
+        evento["chave"] = self._chave(evento)
+        try:
+            with self._lock:
+                conexao = self._abrir()
+                with conexao:
+                    self._inserir(conexao, [evento])
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("Could not write audit event to %s: %s (audit disabled for this session)", self.path, e)
+            self.enabled = False
+    
+    @staticmethod
+    def _chave(evento: Dict[str, Any], segundo: Optional[str] = None) -> str:
+        """
+        Identidade de um evento: segundo, operação, status, usuário e worker.
+        
+        A mesma alteração gravada pela CLI e reconstruída do log gera a mesma
+        chave (o log vem antes do registro, no mesmo segundo ou no anterior).
+        """
+        return "|".join([segundo or evento["ts"][:19], evento["operacao"], evento["status"],
+                         evento.get("email") or str(evento.get("user_id") or ""),
+                         str(evento.get("agent_id") or "")])
+    
+    def _inserir(self, conexao: Any, eventos: list) -> int:
+        colunas = self.CAMPOS + ["chave"]
+        sql = (f"INSERT OR IGNORE INTO eventos ({', '.join(colunas)}) "
+               f"VALUES ({', '.join('?' for _ in colunas)})")
+        antes = conexao.total_changes
+        conexao.executemany(sql, ([e.get(c) for c in colunas] for e in eventos))
+        return conexao.total_changes - antes
+    
+    def consultar(self, usuario: Optional[str] = None, worker: Optional[str] = None,
+                  operador: Optional[str] = None, operacao: Optional[str] = None,
+                  desde: Optional[str] = None, ate: Optional[str] = None, limite: int = 100) -> list:
+        """
+        Eventos mais recentes primeiro. `usuario` é email ou ID, `worker` é ID ou
+        nome; `desde`/`ate` aceitam data (AAAA-MM-DD) ou data e hora ISO.
+        """
+        if not os.path.exists(self.path):
+            return []
+        condicoes, valores = [], []
+        if usuario:
+            condicoes.append("(email = ? OR user_id = ?)")
+            valores += [usuario.lower(), usuario]
+        if worker:
+            condicoes.append("(agent_id = ? OR agent = ?)")
+            valores += [worker, worker]
+        if operador:
+            condicoes.append("operador = ?")
+            valores.append(operador.lower())
+        if operacao:
+            condicoes.append("operacao = ?")
+            valores.append(operacao)
+        if desde:
+            condicoes.append("ts >= ?")
+            valores.append(desde.replace(" ", "T"))
+        if ate:
+            condicoes.append("ts <= ?")
+            valores.append(ate.replace(" ", "T") + ("T23:59:59.999" if len(ate) == 10 else ""))
+        sql = f"SELECT {', '.join(self.CAMPOS)} FROM eventos"
+        if condicoes:
+            sql += " WHERE " + " AND ".join(condicoes)
+        sql += " ORDER BY ts DESC, id DESC LIMIT ?"
+        with self._lock:
+            cursor = self._abrir().execute(sql, valores + [limite])
+            return [dict(zip(self.CAMPOS, linha)) for linha in cursor]
+    
+    @classmethod
+    def _eventos_do_log(cls, path: str) -> Iterator[Dict[str, Any]]:
+        """Eventos reconstruídos de um arquivo de log; o operador é o último login visto no arquivo"""
+        operador = host = None
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for linha in f:
+                linha = linha.rstrip("\n")
+                if linha.startswith("{"):
+                    try:
+                        registro = json.loads(linha)
+                    except json.JSONDecodeError:
+                        continue
+                    ts, mensagem = registro.get("ts"), registro.get("msg") or ""
+                else:
+                    partes = cls._LINHA_TEXTO.match(linha)
+                    if not partes:
+                        continue
+                    ts = f"{partes.group(1)}T{partes.group(2)}.{partes.group(3)}"
+                    mensagem = partes.group(4)
+                if not ts:
+                    continue
+                login = cls._LOGIN.search(mensagem)
+                if login:
+                    operador = login.group(1).lower()
+                    continue
+                api = cls._HOST.search(mensagem)
+                if api:
+                    host = api.group(1)
+                    continue
+                for padrao, operacao, status in cls._MENSAGENS:
+                    achado = padrao.search(mensagem)
+                    if achado:
+                        campos = achado.groupdict()
+                        yield {"ts": ts, "operacao": operacao, "status": status,
+                               "email": campos.get("email", "").lower(), "user_id": campos.get("user_id"),
+                               "agent_id": campos.get("agent_id"), "erro": campos.get("erro"),
+                               "operador": operador,
+                               "host": host, "origem": f"log:{os.path.basename(path)}"}
+                        break
+    
+    def importar_logs(self, paths: Iterable[str]) -> Dict[str, int]:
+        """
+        Importa os eventos de arquivos de log antigos (texto ou JSON).
+        
+        Cada evento é comparado pela chave (_chave) com o que já está no banco:
+        reimportar um arquivo não duplica nada, e eventos já gravados pela CLI
+        são pulados um a um. Sessões que rodaram com a auditoria desativada (ou
+        cuja gravação falhou) são recuperadas mesmo depois de eventos da CLI.
+        """
+        totais = {"arquivos": 0, "importados": 0, "repetidos": 0}
+        with self._lock:
+            conexao = self._abrir()
+            for path in paths:
+                totais["arquivos"] += 1
+                eventos = []
+                for evento in self._eventos_do_log(path):
+                    evento["chave"] = self._chave(evento)
+                    seguinte = (datetime.fromisoformat(evento["ts"][:19]) + timedelta(seconds=1)).isoformat()
+                    if conexao.execute("SELECT 1 FROM eventos WHERE chave IN (?, ?)",
+                                       (evento["chave"], self._chave(evento, seguinte))).fetchone():
+                        totais["repetidos"] += 1
+                    else:
+                        eventos.append(evento)
+                with conexao:
+                    novos = self._inserir(conexao, eventos)
+                totais["importados"] += novos
+                totais["repetidos"] += len(eventos) - novos
+                logger.info("Audit import %s: %s new events", path, novos)
+        return totais
+    
+    def close(self):
+        with self._lock:
+            if self._conexao is not None:
+                self._conexao.close()
+                self._conexao = None
 
 
-# Função para limpar sequências de escape ANSI dos inputs
-def sanitize_input(text: str) -> str:
-    """Remove sequências de escape ANSI e caracteres de controle do input"""
-    # Remove sequências ESC (ANSI escape codes)
-    ansi_escape = re.compile(r'\x1b\[[0-9;?]*[a-zA-Z]|\x1b\?[0-9;]*[a-zA-Z]')
-    cleaned = ansi_escape.sub('', text)
-    # Remove outros caracteres de controle
-    cleaned = re.sub(r'[\x00-\x1f\x7f]', '', cleaned)
-    return cleaned.strip()
+class ListCache:
+    """
+    Cache em disco (um arquivo JSON por chave) das listas de usuários e workers.
+    
+    Cada entrada guarda o momento da gravação e, quando a API informa, ETag e
+    Last-Modified para revalidação com If-None-Match / If-Modified-Since.
+    """
+    
+    def __init__(self, diretorio: str = CACHE_DIR, ttl: int = CACHE_TTL, enabled: bool = not DISABLE_CACHE):
+        self.diretorio = diretorio
+        self.ttl = ttl
+        self.enabled = enabled
+    
+    @staticmethod
+    def chave(host: str, company_id: Optional[str], recurso: str) -> str:
+        """Monta a chave do cache a partir do host da API, empresa e recurso"""
+        digest = hashlib.sha256(f"{host}|{company_id or ''}".encode("utf-8")).hexdigest()[:16]
+        return f"{recurso}_{digest}"
+    
+    def _path(self, chave: str) -> str:
+        return os.path.join(self.diretorio, f"{chave}.json")
+    
+    def get(self, chave: str) -> Optional[Dict[str, Any]]:
+        """Retorna a entrada do cache (mesmo expirada) ou None"""
+        if not self.enabled:
+            return None
+        try:
+            with open(self._path(chave), "r", encoding="utf-8") as f:
+                entrada = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entrada if isinstance(entrada, dict) and "items" in entrada else None
+    
+    def is_fresh(self, entrada: Optional[Dict[str, Any]]) -> bool:
+        return bool(entrada) and time.time() - entrada.get("saved_at", 0) < self.ttl
+    
+    @staticmethod
+    def revalidation_headers(entrada: Optional[Dict[str, Any]]) -> Optional[Dict[str, str]]:
+        """Cabeçalhos condicionais para revalidar uma entrada expirada"""
+        if not entrada:
+            return None
+        headers = {}
+        if entrada.get("etag"):
+            headers["If-None-Match"] = entrada["etag"]
+        if entrada.get("last_modified"):
+            headers["If-Modified-Since"] = entrada["last_modified"]
+        return headers or None
+    
+    def put(self, chave: str, items: list, etag: Optional[str] = None,
+            last_modified: Optional[str] = None, **extra):
+        """Grava a entrada de forma atômica e com permissão 0600 (contém emails)"""
+        if not self.enabled:
+            return
+        entrada = {"saved_at": time.time(), "etag": etag, "last_modified": last_modified,
+                   "items": items, **extra}
+        try:
+            os.makedirs(self.diretorio, mode=0o700, exist_ok=True)
+            tmp = f"{self._path(chave)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entrada, f, ensure_ascii=False, separators=(",", ":"), default=_para_json)
+            os.replace(tmp, self._path(chave))
+        except OSError as e:
+            logger.warning("Could not write cache %s: %s", chave, e)
+    
+    def touch(self, chave: str, entrada: Dict[str, Any]):
+        """Renova a validade de uma entrada revalidada pela API (304)"""
+        extra = {k: v for k, v in entrada.items()
+                 if k not in ("saved_at", "etag", "last_modified", "items")}
+        self.put(chave, entrada["items"], entrada.get("etag"), entrada.get("last_modified"), **extra)
+    
+    def invalidate(self, *chaves: str):
+        for chave in chaves:
+            try:
+                os.remove(self._path(chave))
+                logger.info("Cache invalidated: %s", chave)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning("Could not invalidate cache %s: %s", chave, e)
 
 
 class QubeAdminCLI:
-    def __init__(self):
+    def __init__(self, perfil: Optional["Perfil"] = None):
+        # Perfil (host e credenciais) desta sessão; sem perfil, a API de API_HOST/QUBE_API_URL
+        self.perfil = perfil
+        self.base_url = perfil.host if perfil else API_BASE_URL
+        # Sessão salva por host (e por perfil: dois perfis podem usar o mesmo host com outro login)
+        self._chave_sessao = f"{perfil.nome}@{self.base_url}" if perfil else self.base_url
         self.token: Optional[str] = None
         self.user_info: Optional[Dict[str, Any]] = None
-        self.session = requests.Session()
-        self.session.headers.update({"Content-Type": "application/json"})
-        logger.info(f"CLI iniciada. API: {API_BASE_URL}")
-        logger.info(f"Log file: {LOG_FILE if not DISABLE_LOGS else 'Disabled'}")
+        self.client = SyncApiClient(self.base_url)
+        # Estado por thread (último erro), usado pelas operações em lote
+        self._local = threading.local()
+        self.cache = ListCache()
+        self.sessions = SessionStore()
+        self.retry_policy = self.client.retry_policy
+        self.circuit_breaker = self.client.circuit_breaker
+        self.scheduler = self.client.scheduler
+        # GETs idênticos compartilhados e memorizados por alguns segundos (QUBE_CLI_MEMO_TTL)
+        self.leituras = ReadCoalescer()
+        # Motor das operações em lote: "sync" (threads) ou "async" (asyncio)
+        self.engine = ENGINE
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._prefetch_agents: Optional[Any] = None
+        self.refresh_token: Optional[str] = None
+        # Incrementado a cada invalidação, para descartar cargas iniciadas antes dela
+        self._cache_geracao = 0
+        # Índices de busca da sessão, reutilizados entre as iterações do menu
+        self._indice_usuarios: Optional[SearchIndex] = None
+        self._indice_agents: Optional[SearchIndex] = None
+        self._carga_indice: Optional[threading.Thread] = None
+        # Destino dos resultados gravados em "-" (no modo comando, o progresso vai para stderr)
+        self.saida_dados = sys.stdout
+        self.metricas = RequestMetrics()
+        self.auditoria = AuditStore()
+        logger.info("CLI iniciada. API: %s", self.base_url)
+        logger.info("Log file: %s", LOG_FILE if not DISABLE_LOGS else 'Disabled')
+    
+    @property
+    def session(self) -> Any:
+        """Sessão HTTP compartilhada pelas requisições síncronas"""
+        return self.client.session
     
     def _make_url(self, endpoint: str) -> str:
         """Constrói a URL completa da API"""
-        return f"{API_BASE_URL}/api/{API_VERSION}/{endpoint}"
+        return self.client.make_url(endpoint)
     
-    def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None, 
-                      require_auth: bool = True, params: Optional[Dict] = None) -> Optional[Dict]:
-        """Faz requisição HTTP para a API"""
-        url = self._make_url(endpoint)
+    def _criar_cliente_async(self, pool_size: int = POOL_SIZE) -> AsyncApiClient:
+        """Cliente asyncio com a mesma API, política de retentativas, circuit breaker e agendador da sessão"""
+        return AsyncApiClient(self.client.base_url, self.retry_policy, self.circuit_breaker,
+                              pool_size, dict(self.session.headers), self.scheduler)
+    
+    def _executar_lote(self, itens: Iterable[Any], funcao: Callable[[Any], Any],
+                       corrotina: Callable[[AsyncApiClient, Any], Any],
+                       concorrencia: int) -> Iterator[Tuple[Any, Any]]:
+        """Executa um lote no motor configurado (QUBE_CLI_ENGINE): threads ou asyncio"""
+        # Com o agendador ativo, ele limita as requisições simultâneas; o lote só não pode ser o gargalo
+        workers = self.scheduler.workers(concorrencia)
+        if self.engine == "async":
+            pool_size = max(POOL_SIZE, workers)
+            return executar_em_lote_async(itens, corrotina, workers,
+                                          lambda: self._criar_cliente_async(pool_size))
+        return executar_em_lote(itens, funcao, workers)
+    
+    def _descrever_paralelismo(self, concorrencia: int) -> str:
+        """Texto das mensagens de progresso dos lotes sobre quantas requisições saem ao mesmo tempo"""
+        if self.scheduler.ativo:
+            return f"até {self.scheduler.workers(concorrencia)} em paralelo, ajuste automático"
+        return f"{concorrencia} em paralelo"
+    
+    def _perguntar_concorrencia(self) -> int:
+        """Concorrência dos lotes no menu; com o agendador ativo ela é automática e não é perguntada"""
+        if self.scheduler.ativo:
+            return DEFAULT_CONCURRENCY
+        concorrencia_input = sanitize_input(input(f"⚙️  Requisições em paralelo [{DEFAULT_CONCURRENCY}]: "))
+        return int(concorrencia_input) if concorrencia_input else DEFAULT_CONCURRENCY
+    
+    def _em_segundo_plano(self, funcao: Callable[..., Any], *args) -> Any:
+        """Executa `funcao` em uma thread auxiliar da sessão e devolve o Future"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="qube-prefetch")
+        return self._executor.submit(funcao, *args)
+    
+    def _chave_cache(self, recurso: str) -> str:
+        """Chave do cache para o recurso, por host da API e empresa do usuário logado"""
+        company_id = self.user_info.get("company_id") if self.user_info else None
+        return ListCache.chave(self.base_url, company_id, recurso)
+    
+    def _validadores_resposta(self) -> Dict[str, Optional[str]]:
+        """ETag e Last-Modified da última resposta recebida na thread atual"""
+        headers = getattr(self._local, "response_headers", None) or {}
+        return {"etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified")}
+    
+    def _auditar(self, operacao: str, status: str, **campos):
+        """Registra uma alteração na trilha de auditoria, com o operador logado e o ambiente"""
+        operador = self.user_info or {}
+        try:
+            usuario_so = getuser()
+        except (KeyError, OSError):
+            usuario_so = None
+        self.auditoria.registrar(dict(
+            campos, operacao=operacao, status=status,
+            operador=str(operador.get("email") or "").lower() or None,
+            operador_id=operador.get("id"), usuario_so=usuario_so,
+            perfil=self.perfil.nome if self.perfil else None, host=self.base_url))
+    
+    def invalidar_cache(self):
+        """Descarta as listas em cache após operações que as alteram"""
+        self._cache_geracao += 1
+        self.leituras.invalidar()
+        self._indice_usuarios = None
+        self._indice_agents = None
+        self._prefetch_agents = None
+        self.cache.invalidate(self._chave_cache("users"), self._chave_cache("agents"))
+    
+    @property
+    def last_error(self) -> Optional[str]:
+        """Detalhe do último erro de requisição na thread atual"""
+        return getattr(self._local, "error", None)
+    
+    @property
+    def last_status_code(self) -> Optional[int]:
+        """Status HTTP da última resposta recebida na thread atual"""
+        return getattr(self._local, "status_code", None)
+    
+    @property
+    def last_retries(self) -> int:
+        """Retentativas feitas pela última requisição na thread atual"""
+        return getattr(self._local, "retries", 0) or 0
+    
+    def _preparar_requisicao(self, method: str, endpoint: str, data: Optional[Dict],
+                             params: Optional[Dict], headers: Optional[Dict[str, str]],
+                             require_auth: bool, idempotency_key: Optional[str],
+                             out: Callable[..., None]) -> Dict[str, str]:
+        """Registra a requisição em log/debug e monta os cabeçalhos (autenticação e X-Request-ID por requisição)"""
+        headers = dict(headers or {})
+        headers["X-Request-ID"] = os.urandom(8).hex()
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+        if require_auth and self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
         
         # Log da requisição (sem dados sensíveis)
-        logger.info(f"Request: {method} {endpoint}")
+        logger.info("Request: %s %s", method, endpoint,
+                    extra={"request_id": headers["X-Request-ID"], "method": method, "endpoint": endpoint})
         if data and endpoint != "auth/login":  # Não logar dados de login
-            logger.debug(f"Data: {data}")
+            logger.debug("Data: %s", data)
         if params:
-            logger.debug(f"Params: {params}")
-        
-        if require_auth and self.token:
-            self.session.headers.update({"Authorization": f"Bearer {self.token}"})
+            logger.debug("Params: %s", params)
         
         # Debug mode
+        if os.getenv("QUBE_CLI_DEBUG", "false").lower() == "true":
+            out(f"🔍 DEBUG - URL: {self._make_url(endpoint)}")
+            out(f"🔍 DEBUG - Method: {method}")
+            out(f"🔍 DEBUG - Params: {params or data}")
+            out(f"🔍 DEBUG - Has token: {bool(self.token)}")
+        return headers
+    
+    @staticmethod
+    def _campos_log(headers: Dict[str, str], method: str, endpoint: str, inicio: float) -> Dict[str, Any]:
+        """Campos estruturados dos logs de resposta (QUBE_CLI_LOG_FORMAT=json)"""
+        return {"request_id": headers.get("X-Request-ID"), "method": method, "endpoint": endpoint,
+                "latency_ms": round((time.perf_counter() - inicio) * 1000, 1)}
+    
+    def _interpretar_resposta(self, response: Any, method: str, endpoint: str,
+                              require_auth: bool, out: Callable[..., None],
+                              campos: Optional[Dict[str, Any]] = None, stream: bool = False) -> Optional[Any]:
+        """
+        Converte a resposta HTTP no retorno de _make_request, exibindo erros amigáveis.
+        
+        O corpo é decodificado uma única vez, a partir dos bytes; com `stream=True`
+        respostas de sucesso viram um RespostaStream lido conforme é consumido.
+        """
+        url = self._make_url(endpoint)
         debug_mode = os.getenv("QUBE_CLI_DEBUG", "false").lower() == "true"
-        if debug_mode:
-            print(f"🔍 DEBUG - URL: {url}")
-            print(f"🔍 DEBUG - Method: {method}")
-            print(f"🔍 DEBUG - Params: {params or data}")
-            print(f"🔍 DEBUG - Has token: {bool(self.token)}")
-        
-        try:
-            if method.upper() == "GET":
-                response = self.session.get(url, params=params or data, timeout=30)
-            elif method.upper() == "POST":
-                response = self.session.post(url, json=data, timeout=30)
-            elif method.upper() == "PUT":
-                response = self.session.put(url, json=data, timeout=30)
-            elif method.upper() == "DELETE":
-                response = self.session.delete(url, timeout=30)
-            else:
-                print(f"❌ Método HTTP inválido: {method}")
-                return None
-            
-            if response.status_code in [200, 201, 204]:
-                logger.info(f"Response: {response.status_code} {method} {endpoint} - Success")
+        self._local.error = None
+        self._local.response_headers = response.headers
+        self._local.status_code = response.status_code
+        extra = dict(campos or {}, status=response.status_code)
+        if campos:
+            self.metricas.registrar(method, endpoint, response.status_code, campos["latency_ms"] / 1000,
+                                    campos.get("retries"), _fases_resposta(response))
+        
+        if response.status_code == 304:
+            logger.info("Response: 304 %s %s - Not Modified", method, endpoint, extra=extra)
+            if stream:
+                response.close()
+            return NOT_MODIFIED
+        
+        if response.status_code in [200, 201, 204]:
+            logger.info("Response: %s %s %s - Success", response.status_code, method, endpoint, extra=extra)
+            if debug_mode:
+                out(f"🔍 DEBUG - Status Code: {response.status_code}")
+            if response.status_code == 204:
+                return {"success": True}
+            if stream:
+                return RespostaStream(response)
+            try:
+                result = _json_loads(response.content) if response.content else {"success": True}
+                logger.debug("Response data: %s", result, extra=extra)
                 if debug_mode:
-                    print(f"🔍 DEBUG - Status Code: {response.status_code}")
-                if response.status_code == 204:
-                    return {"success": True}
-                try:
-                    result = response.json() if response.text else {"success": True}
-                    logger.debug(f"Response data: {result}")
-                    if debug_mode:
-                        print(f"🔍 DEBUG - Response JSON keys: {result.keys() if isinstance(result, dict) else type(result)}")
-                    return result
-                except json.JSONDecodeError as e:
-                    logger.warning(f"JSON decode error: {e}")
-                    print(f"⚠️  Resposta da API não está em formato JSON válido")
-                    return {"success": True, "raw_response": response.text}
-            else:
-                # Tratar diferentes tipos de erro
-                try:
-                    error_data = response.json() if response.text else {}
-                except json.JSONDecodeError:
-                    error_data = {"detail": response.text or "Erro desconhecido"}
-                
-                error_detail = error_data.get('detail', error_data.get('message', str(error_data)))
-                
-                # Log do erro
-                logger.error(f"Response: {response.status_code} {method} {endpoint} - Error: {error_detail}")
-                
-                # Mensagens mais amigáveis por código de status
-                if response.status_code == 401:
-                    print(f"❌ Não autorizado: {error_detail}")
-                    print("💡 Dica: Verifique suas credenciais ou faça login novamente")
-                elif response.status_code == 403:
-                    print(f"❌ Acesso negado: {error_detail}")
-                    print("💡 Dica: Você não tem permissão para esta operação")
-                elif response.status_code == 404:
-                    print(f"❌ Não encontrado: {error_detail}")
-                    print(f"💡 Dica: Verifique se o endpoint existe: {url}")
-                elif response.status_code == 422:
-                    print(f"❌ Dados inválidos: {error_detail}")
-                    if isinstance(error_data, dict) and 'detail' in error_data:
-                        if isinstance(error_data['detail'], list):
-                            print("📋 Detalhes da validação:")
-                            for err in error_data['detail']:
-                                field = err.get('loc', ['unknown'])[-1]
-                                msg = err.get('msg', 'erro desconhecido')
-                                print(f"   • {field}: {msg}")
-                elif response.status_code == 500:
-                    print(f"❌ Erro interno do servidor: {error_detail}")
-                    print("💡 Dica: Contate o suporte ou tente novamente mais tarde")
-                else:
-                    print(f"❌ Erro {response.status_code}: {error_detail}")
-                
-                return None
-                
-        except requests.exceptions.ConnectionError as e:
-            logger.error(f"Connection error: {method} {endpoint} - {e}")
-            print(f"\n❌ Erro de conexão com a API")
-            print(f"🌐 URL: {API_BASE_URL}")
-            print(f"💡 Dica: Verifique se:")
-            print(f"   • A API está rodando")
-            print(f"   • A URL está correta (use API_HOST para mudar)")
-            print(f"   • Você tem acesso à rede")
-            return None
-        except requests.exceptions.Timeout:
-            logger.error(f"Timeout: {method} {endpoint}")
-            print(f"\n❌ Timeout na requisição (>30s)")
-            print(f"💡 Dica: A API pode estar lenta ou indisponível")
-            return None
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Request exception: {method} {endpoint} - {e}")
-            print(f"\n❌ Erro na requisição HTTP: {e}")
+                    out(f"🔍 DEBUG - Response JSON keys: {result.keys() if isinstance(result, dict) else type(result)}")
+                return result
+            except json.JSONDecodeError as e:
+                logger.warning("JSON decode error: %s", e)
+                out(f"⚠️  Resposta da API não está em formato JSON válido")
+                return {"success": True, "raw_response": response.text}
+        
+        # Tratar diferentes tipos de erro
+        try:
+            error_data = _json_loads(response.content) if response.content else {}
+        except json.JSONDecodeError:
+            error_data = {"detail": response.text or "Erro desconhecido"}
+        
+        error_detail = error_data.get('detail', error_data.get('message', str(error_data))) \
+            if isinstance(error_data, dict) else str(error_data)
+        
+        # Log do erro
+        logger.error("Response: %s %s %s - Error: %s", response.status_code, method, endpoint, error_detail,
+                     extra=extra)
+        self._local.error = f"{response.status_code}: {error_detail}"
+        
+        # Mensagens mais amigáveis por código de status
+        if response.status_code == 401:
+            # Token salvo pode ter sido revogado: não reaproveitar na próxima execução
+            if require_auth:
+                self.sessions.clear(self._chave_sessao)
+            out(f"❌ Não autorizado: {error_detail}")
+            out("💡 Dica: Verifique suas credenciais ou faça login novamente")
+        elif response.status_code == 403:
+            out(f"❌ Acesso negado: {error_detail}")
+            out("💡 Dica: Você não tem permissão para esta operação")
+        elif response.status_code == 404:
+            out(f"❌ Não encontrado: {error_detail}")
+            out(f"💡 Dica: Verifique se o endpoint existe: {url}")
+        elif response.status_code == 422:
+            out(f"❌ Dados inválidos: {error_detail}")
+            if isinstance(error_data, dict) and 'detail' in error_data:
+                if isinstance(error_data['detail'], list):
+                    out("📋 Detalhes da validação:")
+                    for err in error_data['detail']:
+                        field = err.get('loc', ['unknown'])[-1]
+                        msg = err.get('msg', 'erro desconhecido')
+                        out(f"   • {field}: {msg}")
+        elif response.status_code == 429:
+            out(f"❌ Limite de requisições da API atingido: {error_detail}")
+            out("💡 Dica: O ritmo já é reduzido automaticamente; tente novamente em instantes ou use --rate")
+        elif response.status_code == 500:
+            out(f"❌ Erro interno do servidor: {error_detail}")
+            out("💡 Dica: Contate o suporte ou tente novamente mais tarde")
+        else:
+            out(f"❌ Erro {response.status_code}: {error_detail}")
+        
+        return None
+    
+    def _tratar_excecao(self, e: Exception, method: str, endpoint: str, out: Callable[..., None],
+                        campos: Optional[Dict[str, Any]] = None) -> None:
+        """Registra e exibe falhas que impediram obter uma resposta da API"""
+        self._local.response_headers = {}
+        self._local.status_code = None
+        extra = campos or {}
+        if campos:
+            self.metricas.registrar(method, endpoint, type(e).__name__, campos["latency_ms"] / 1000,
+                                    campos.get("retries"))
+        if isinstance(e, CircuitOpenError):
+            logger.error("Circuit open, failing fast: %s %s", method, endpoint, extra=extra)
+            self._local.error = "API indisponível (circuit breaker aberto)"
+            out(f"\n❌ API indisponível: muitas falhas seguidas em {self.base_url}")
+            out(f"💡 Dica: Novas tentativas serão feitas após {self.circuit_breaker.cooldown:g}s")
+        elif isinstance(e, requests.exceptions.ConnectionError):
+            logger.error("Connection error: %s %s - %s", method, endpoint, e, extra=extra)
+            self._local.error = f"Erro de conexão: {e}"
+            out(f"\n❌ Erro de conexão com a API")
+            out(f"🌐 URL: {self.base_url}")
+            out(f"💡 Dica: Verifique se:")
+            out(f"   • A API está rodando")
+            out(f"   • A URL está correta (use API_HOST para mudar)")
+            out(f"   • Você tem acesso à rede")
+        elif isinstance(e, requests.exceptions.Timeout):
+            logger.error("Timeout: %s %s", method, endpoint, extra=extra)
+            self._local.error = "Timeout na requisição"
+            out(f"\n❌ Timeout na requisição (>{self.retry_policy.read_timeout:g}s)")
+            out(f"💡 Dica: A API pode estar lenta ou indisponível")
+        elif isinstance(e, requests.exceptions.RequestException):
+            logger.error("Request exception: %s %s - %s", method, endpoint, e, extra=extra)
+            self._local.error = f"Erro na requisição HTTP: {e}"
+            out(f"\n❌ Erro na requisição HTTP: {e}")
+        else:
+            logger.exception("Unexpected error: %s %s", method, endpoint, extra=extra)
+            self._local.error = f"{type(e).__name__}: {e}"
+            out(f"\n❌ Erro inesperado: {type(e).__name__}: {e}")
+            out(f"💡 Dica: Se o problema persistir, reporte este erro")
+        return None
+    
+    def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None, 
+                      require_auth: bool = True, params: Optional[Dict] = None,
+                      quiet: bool = False, headers: Optional[Dict[str, str]] = None,
+                      idempotency_key: Optional[str] = None, stream: bool = False) -> Optional[Any]:
+        """
+        Faz requisição HTTP para a API (quiet=True suprime as mensagens no console).
+        
+        Falhas transitórias são repetidas conforme a RetryPolicy; POSTs que não são
+        idempotentes só são repetidos com `idempotency_key` e QUBE_CLI_IDEMPOTENCY_KEYS.
+        Com `stream=True` (GET), o sucesso retorna um RespostaStream que gera os
+        registros conforme o corpo chega; a latência medida vai até os cabeçalhos.
+        GETs sem cabeçalhos extras passam pelo ReadCoalescer da sessão; as demais
+        requisições invalidam as leituras do recurso que alteram.
+        """
+        if method.upper() != "GET":
+            self.leituras.invalidar(endpoint)
+            try:
+                return self._requisitar(method, endpoint, data, require_auth, params, quiet, headers,
+                                        idempotency_key, stream)
+            finally:
+                self.leituras.invalidar(endpoint)
+        if stream or headers or not self.leituras.ativo:
+            return self._requisitar(method, endpoint, data, require_auth, params, quiet, headers,
+                                    idempotency_key, stream)
+        
+        def buscar() -> Tuple[Any, Dict[str, Any]]:
+            resultado = self._requisitar(method, endpoint, data, require_auth, params, quiet)
+            return resultado, {"error": self._local.error, "status_code": self._local.status_code,
+                               "response_headers": self._local.response_headers, "retries": self._local.retries}
+        
+        chave = (endpoint, tuple(sorted((params or {}).items())), self.token if require_auth else None)
+        resultado, estado = self.leituras.obter(chave, buscar)
+        for campo, valor in estado.items():
+            setattr(self._local, campo, valor)
+        return resultado
+    
+    def _requisitar(self, method: str, endpoint: str, data: Optional[Dict] = None,
+                    require_auth: bool = True, params: Optional[Dict] = None,
+                    quiet: bool = False, headers: Optional[Dict[str, str]] = None,
+                    idempotency_key: Optional[str] = None, stream: bool = False) -> Optional[Any]:
+        """Uma requisição de _make_request, sempre à API"""
+        self._local.error = None
+        self._local.response_headers = {}
+        self._local.status_code = None
+        self._local.retries = 0
+        out = _silent if quiet else print
+        
+        if method.upper() not in ("GET", "POST", "PUT", "DELETE"):
+            out(f"❌ Método HTTP inválido: {method}")
+            self._local.error = f"Método HTTP inválido: {method}"
             return None
+        
+        headers = self._preparar_requisicao(method, endpoint, data, params, headers,
+                                            require_auth, idempotency_key, out)
+        
+        def on_retry(tentativa: int, espera: float, motivo: str):
+            self._local.retries = tentativa
+            out(f"⏳ Falha temporária ({motivo}), tentando novamente em {espera:.1f}s...")
+        
+        # Cria a sessão (e importa o requests) antes de medir a latência
+        self.client.session
+        inicio = time.perf_counter()
+        try:
+            response = self.client.request(method, endpoint, data, params, headers,
+                                           idempotency_key, on_retry, stream)
+            campos = dict(self._campos_log(headers, method, endpoint, inicio), retries=self._local.retries)
+            return self._interpretar_resposta(response, method, endpoint, require_auth, out, campos, stream)
         except KeyboardInterrupt:
-            logger.warning(f"Operation cancelled by user: {method} {endpoint}")
-            print(f"\n\n⚠️  Operação cancelada pelo usuário")
+            logger.warning("Operation cancelled by user: %s %s", method, endpoint)
+            out(f"\n\n⚠️  Operação cancelada pelo usuário")
             raise  # Re-lança para ser tratado no nível superior
         except Exception as e:
-            logger.exception(f"Unexpected error: {method} {endpoint}")
-            print(f"\n❌ Erro inesperado: {type(e).__name__}: {e}")
-            print(f"💡 Dica: Se o problema persistir, reporte este erro")
-            return None
+            campos = dict(self._campos_log(headers, method, endpoint, inicio), retries=self._local.retries)
+            return self._tratar_excecao(e, method, endpoint, out, campos)
+    
+    async def _make_request_async(self, client: AsyncApiClient, method: str, endpoint: str,
+                                  data: Optional[Dict] = None, require_auth: bool = True,
+                                  params: Optional[Dict] = None, quiet: bool = True,
+                                  headers: Optional[Dict[str, str]] = None,
+                                  idempotency_key: Optional[str] = None) -> Optional[Dict]:
+        """
+        Equivalente assíncrono de _make_request, usando `client` (AsyncApiClient).
+        
+        O estado de last_error/last_status_code é gravado depois do último await,
+        então pode ser lido logo após o retorno, antes de qualquer outro await.
+        """
+        out = _silent if quiet else print
+        if method.upper() != "GET":
+            self.leituras.invalidar(endpoint)
+        headers = self._preparar_requisicao(method, endpoint, data, params, headers,
+                                            require_auth, idempotency_key, out)
+        retentativas = [0]
+        
+        def on_retry(tentativa: int, espera: float, motivo: str):
+            retentativas[0] = tentativa
+        
+        inicio = time.perf_counter()
+        try:
+            response = await client.request(method, endpoint, data, params, headers, idempotency_key, on_retry)
+            self._local.retries = retentativas[0]
+            campos = dict(self._campos_log(headers, method, endpoint, inicio), retries=retentativas[0])
+            return self._interpretar_resposta(response, method, endpoint, require_auth, out, campos)
+        except Exception as e:
+            self._local.retries = retentativas[0]
+            campos = dict(self._campos_log(headers, method, endpoint, inicio), retries=retentativas[0])
+            return self._tratar_excecao(e, method, endpoint, out, campos)
+        finally:
+            if method.upper() != "GET":
+                self.leituras.invalidar(endpoint)
+    
+    def _mostrar_usuario(self):
+        """Exibe os dados do usuário logado"""
+        print(f"👤 Usuário: {self.user_info.get('name', 'N/A')}")
+        print(f"📧 Email: {self.user_info.get('email', 'N/A')}")
+        print(f"🏢 Empresa: {self.user_info.get('company_name', 'N/A')}")
+        print(f"👔 Role: {self.user_info.get('role', 'N/A')}")
+    
+    def _restaurar_sessao(self) -> bool:
+        """
+        Reaproveita a sessão salva para o host atual, se ainda for válida.
+        
+        Token dentro da validade (campo `exp` do JWT): nenhuma requisição.
+        Token expirado com refresh token: uma chamada a `auth/refresh`.
+        Token sem `exp`: uma chamada a `users/me` para validá-lo.
+        """
+        entrada = self.sessions.get(self._chave_sessao)
+        if not entrada:
+            return False
+        
+        expira_em = entrada.get("expires_at")
+        agora = time.time()
+        
+        if expira_em and expira_em - TOKEN_EXPIRY_MARGIN > agora and entrada.get("user_info"):
+            self.token = entrada["access_token"]
+            self.refresh_token = entrada.get("refresh_token")
+            self.user_info = entrada["user_info"]
+            logger.info("Session restored from disk for %s", self.user_info.get('email'))
+            return True
+        
+        if expira_em and entrada.get("refresh_token"):
+            logger.info("Saved token expired, refreshing")
+            response = self._make_request("POST", "auth/refresh",
+                                          {"refresh_token": entrada["refresh_token"]},
+                                          require_auth=False, quiet=True)
+            if response and "access_token" in response:
+                self.token = response["access_token"]
+                self.refresh_token = response.get("refresh_token", entrada["refresh_token"])
+                self.user_info = entrada.get("user_info")
+                if not self.user_info:
+                    self.user_info = self._make_request("GET", "users/me", quiet=True)
+                self.sessions.save(self._chave_sessao, self.token, self.user_info, self.refresh_token)
+                logger.info("Session refreshed")
+                return self.user_info is not None
+        elif not expira_em:
+            # Sem expiração legível no token: valida com a API
+            self.token = entrada["access_token"]
+            user_response = self._make_request("GET", "users/me", quiet=True)
+            if user_response:
+                self.user_info = user_response
+                self.refresh_token = entrada.get("refresh_token")
+                self.sessions.save(self._chave_sessao, self.token, self.user_info, self.refresh_token)
+                logger.info("Saved session validated with users/me")
+                return True
+        
+        self.token = None
+        self.user_info = None
+        self.sessions.clear(self._chave_sessao)
+        return False
+    
+    def logout(self):
+        """Descarta a sessão atual e a sessão salva em disco"""
+        self.sessions.clear(self._chave_sessao)
+        self.token = None
+        self.refresh_token = None
+        self.user_info = None
     
     def login(self) -> bool:
         """Realiza login do usuário administrador"""
@@ -213,6 +3103,11 @@ class QubeAdminCLI:
         print("🔐  QUBE ADMIN CLI - LOGIN")
         print("="*60)
         
+        if self._restaurar_sessao():
+            print("✅ Sessão anterior restaurada (QUBE_CLI_SESSION_CACHE)\n")
+            self._mostrar_usuario()
+            return True
+        
         try:
             email = sanitize_input(input("📧 Email: "))
             
@@ -221,7 +3116,7 @@ class QubeAdminCLI:
                 print("❌ Email não pode ser vazio")
                 return False
             
-            logger.info(f"Login attempt for user: {email}")
+            logger.info("Login attempt for user: %s", email)
             
             password = getpass("🔑 Senha: ")
             
@@ -236,6 +3131,14 @@ class QubeAdminCLI:
             print("\n\n⚠️  Login cancelado pelo usuário")
             return False
         
+        try:
+            return self.autenticar(email, password)
+        except KeyboardInterrupt:
+            print("\n\n⚠️  Login cancelado pelo usuário")
+            return False
+    
+    def autenticar(self, email: str, password: str) -> bool:
+        """Autentica com email e senha já informados e carrega os dados do usuário"""
         data = {
             "email": email,
             "password": password
@@ -243,32 +3146,26 @@ class QubeAdminCLI:
         
         print("\n⏳ Autenticando...")
         
-        try:
-            response = self._make_request("POST", "auth/login", data, require_auth=False)
+        response = self._make_request("POST", "auth/login", data, require_auth=False)
+        
+        if response and "access_token" in response:
+            self.token = response["access_token"]
+            self.refresh_token = response.get("refresh_token")
+            logger.info("Login successful for user: %s", email)
+            print("✅ Login realizado com sucesso!\n")
             
-            if response and "access_token" in response:
-                self.token = response["access_token"]
-                logger.info(f"Login successful for user: {email}")
-                print("✅ Login realizado com sucesso!\n")
-                
-                # Buscar informações do usuário
-                user_response = self._make_request("GET", "users/me")
-                if user_response:
-                    self.user_info = user_response
-                    logger.info(f"User info loaded: {self.user_info.get('name')} - Role: {self.user_info.get('role')}")
-                    print(f"👤 Usuário: {self.user_info.get('name', 'N/A')}")
-                    print(f"📧 Email: {self.user_info.get('email', 'N/A')}")
-                    print(f"🏢 Empresa: {self.user_info.get('company_name', 'N/A')}")
-                    print(f"👔 Role: {self.user_info.get('role', 'N/A')}")
-                
-                return True
-            else:
-                logger.warning(f"Login failed for user: {email}")
-                print("❌ Falha no login. Verifique suas credenciais.\n")
-                return False
-                
-        except KeyboardInterrupt:
-            print("\n\n⚠️  Login cancelado pelo usuário")
+            # Buscar informações do usuário
+            user_response = self._make_request("GET", "users/me")
+            if user_response:
+                self.user_info = user_response
+                logger.info("User info loaded: %s - Role: %s", self.user_info.get('name'), self.user_info.get('role'))
+                self._mostrar_usuario()
+            
+            self.sessions.save(self._chave_sessao, self.token, self.user_info, self.refresh_token)
+            return True
+        else:
+            logger.warning("Login failed for user: %s", email)
+            print("❌ Falha no login. Verifique suas credenciais.\n")
             return False
     
     def criar_usuario(self):
@@ -324,11 +3221,15 @@ class QubeAdminCLI:
             data["password"] = password
         
         print("\n⏳ Criando usuário...")
-        logger.info(f"Creating user: {email} - {name}")
-        response = self._make_request("POST", "users/", data)
+        logger.info("Creating user: %s - %s", email, name)
+        response = self._make_request("POST", "users/", data, idempotency_key=self._chave_criacao_nova())
+        if response is None and self._criacao_repetida_ja_feita():
+            response = self._usuario_criado(email)
         
         if response:
-            logger.info(f"User created successfully: {email} (ID: {response.get('id')})")
+            logger.info("User created successfully: %s (ID: %s)", email, response.get('id'))
+            self._auditar("criar_usuario", "criado", email=email, user_id=response.get('id'))
+            self.invalidar_cache()
             print("\n✅ Usuário criado com sucesso!")
             print(f"   ID: {response.get('id', 'N/A')}")
             print(f"   Nome: {response.get('name', 'N/A')}")
@@ -336,9 +3237,305 @@ class QubeAdminCLI:
             if not password and send_email:
                 print("   📮 Email com senha temporária foi enviado")
         else:
-            logger.error(f"Failed to create user: {email}")
+            logger.error("Failed to create user: %s", email)
+            self._auditar("criar_usuario", "erro", email=email, erro=self.last_error)
             print("\n❌ Falha ao criar usuário")
+
+    def _emails_existentes(self) -> set:
+        """Emails (em minúsculas) já cadastrados na empresa, para a validação local dos lotes"""
+        print("\n⏳ Conferindo emails já cadastrados...")
+        emails = {str(u.get("email", "")).lower() for u in self._gerar_usuarios(quiet=True)}
+        if self.last_error:
+            logger.warning("Could not fetch existing users for batch validation: %s", self.last_error)
+            print(f"⚠️  Usuários não carregados ({self.last_error}); emails já cadastrados ficam a cargo da API")
+            return set()
+        return emails
+    
+    def _novo_diario(self, operacao: str, **parametros) -> Optional[JobJournal]:
+        """Cria o diário de um lote; sem ele o lote roda normalmente, só não pode ser retomado"""
+        if self.perfil:
+            parametros["perfil"] = self.perfil.nome
+        try:
+            diario = JobJournal.criar(operacao, parametros)
+        except OSError as e:
+            logger.warning("Could not create job journal in %s: %s", JOBS_DIR, e)
+            print(f"⚠️  Diário do lote não criado ({e}); o lote não poderá ser retomado")
+            return None
+        logger.info("Job journal: %s", diario.path)
+        print(f"🧾 Job {diario.id}")
+        return diario
+    
+    @staticmethod
+    def _chave_criacao(item: Tuple[int, Dict[str, Any]]) -> str:
+        """Chave de uma linha do lote de criação no diário: o email (ou o número da linha, sem email)"""
+        linha, registro = item
+        email = sanitize_input(str(registro.get("email") or "")).lower()
+        return email or f"linha:{linha}"
+    
+    @staticmethod
+    def _chave_associacao(item: Dict[str, Any]) -> str:
+        """Chave de uma associação no diário: o par worker/usuário (ou o número da linha, sem resolver)"""
+        if item.get("agent_id") and item.get("user_id"):
+            return f"{item['agent_id']}:{item['user_id']}"
+        return f"linha:{item['linha']}"
+    
+    @staticmethod
+    def _itens_pendentes(itens: Iterable[Any], diario: JobJournal, chave: Callable[[Any], str],
+                         contagem: Dict[str, int]) -> Iterator[Any]:
+        """Descarta os itens já concluídos em uma execução anterior do job"""
+        for item in itens:
+            if diario.concluido(chave(item)):
+                contagem["pulados"] += 1
+                continue
+            yield item
     
+    @staticmethod
+    def _com_diario(diario: JobJournal, chave: Callable[[Any], str], funcao: Callable[[Any], Any],
+                    corrotina: Callable[[AsyncApiClient, Any], Any]) -> Tuple[Callable, Callable]:
+        """Envolve as funções do lote para gravar cada resultado no diário assim que o item termina"""
+        def executar(item: Any) -> Dict[str, Any]:
+            resultado = funcao(item)
+            diario.registrar(chave(item), resultado)
+            return resultado
+        
+        async def executar_async(client: AsyncApiClient, item: Any) -> Dict[str, Any]:
+            resultado = await corrotina(client, item)
+            diario.registrar(chave(item), resultado)
+            return resultado
+        return executar, executar_async
+    
+    def _resumo_diario(self, diario: Optional[JobJournal], pulados: int, pendente: bool):
+        """Informa o que foi pulado e, se sobrou trabalho, como retomar o job"""
+        if diario is None:
+            return
+        if pulados:
+            print(f"⏭️  {pulados} item(ns) já concluído(s) em execução anterior do job")
+        if pendente:
+            print(f"💡 Para repetir só o que falhou: {os.path.basename(sys.argv[0])} job resume {diario.id}")
+    
+    def _preparar_criacao(self, item: Tuple[int, Dict[str, Any]]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """Valida um registro do lote e devolve (resultado, dados do POST users/ ou None se inválido)"""
+        linha, registro = item
+        email = sanitize_input(str(registro.get("email") or ""))
+        resultado = {"linha": linha, "email": email, "status": "erro", "id": None, "erro": None}
+
+        if registro.get("_erro"):
+            resultado["erro"] = registro["_erro"]
+            return resultado, None
+        if registro.get("_ignorado"):
+            resultado["status"] = "ignorado"
+            resultado["erro"] = registro["_ignorado"]
+            return resultado, None
+
+        name = sanitize_input(str(registro.get("name") or registro.get("nome") or ""))
+        password = registro.get("password") or registro.get("senha") or ""
+        company_id = registro.get("company_id") or (self.user_info.get("company_id") if self.user_info else None)
+
+        erro = BatchValidator.verificar(email, registro)
+        if erro:
+            resultado["erro"] = erro
+            return resultado, None
+        if not name:
+            resultado["erro"] = "Nome não pode ser vazio"
+            return resultado, None
+        if not company_id:
+            resultado["erro"] = "Company ID não pode ser vazio"
+            return resultado, None
+
+        # Mesma regra do modo interativo: senha gerada => email enviado sempre
+        send_email = True if not password else parse_bool(
+            registro.get("send_email", registro.get("enviar_email")), default=True)
+
+        data = {
+            "email": email,
+            "name": name,
+            "company_id": company_id,
+            "send_email": send_email
+        }
+        if password:
+            data["password"] = password
+
+        logger.info("Creating user (batch line %s): %s - %s", linha, email, name)
+        return resultado, data
+
+    def _concluir_criacao(self, resultado: Dict[str, Any], response: Optional[Dict]) -> Dict[str, Any]:
+        """Preenche o resultado de uma linha do lote a partir da resposta de POST users/"""
+        linha, email = resultado["linha"], resultado["email"]
+        if response:
+            resultado["status"] = "criado"
+            resultado["id"] = response.get("id")
+            logger.info("User created successfully: %s (ID: %s)", email, response.get('id'))
+            self._auditar("criar_usuario", "criado", email=email, user_id=response.get("id"))
+        else:
+            resultado["erro"] = self.last_error or "Erro desconhecido"
+            logger.error("Failed to create user (batch line %s): %s - %s", linha, email, resultado['erro'])
+            self._auditar("criar_usuario", "erro", email=email, erro=resultado["erro"])
+        return resultado
+
+    @staticmethod
+    def _chave_criacao_nova() -> Optional[str]:
+        """Idempotency-Key de uma criação fora de job: só quando a API a respeita (QUBE_CLI_IDEMPOTENCY_KEYS)"""
+        return str(uuid.uuid4()) if IDEMPOTENCY_KEYS else None
+    
+    def _criacao_repetida_ja_feita(self) -> bool:
+        """
+        POST users/ repetido que recebeu "já cadastrado": a tentativa anterior
+        criou o usuário e só a resposta se perdeu (timeout de leitura, 5xx no proxy).
+        """
+        if not self.last_retries:
+            return False
+        return self.last_status_code == 409 or any(
+            texto in (self.last_error or "").lower() for texto in ("already registered", "already exists", "já cadastrado"))
+    
+    def _usuario_criado(self, email: str) -> Optional[Dict[str, Any]]:
+        """Usuário recém-criado buscado pelo email, no lugar da resposta perdida da criação"""
+        erro = self.last_error
+        for usuario in self.iter_usuarios(search=email, quiet=True):
+            if str(usuario.get("email", "")).lower() == email.lower():
+                logger.info("Create of %s was retried and got '%s'; user exists (ID: %s)",
+                            email, erro, usuario.get("id"))
+                return {"id": usuario.get("id"), "name": usuario.get("name"), "email": usuario.get("email")}
+        self._local.error = erro
+        return None
+
+    def _criar_usuario_registro(self, item: Tuple[int, Dict[str, Any]]) -> Dict[str, Any]:
+        """Cria um usuário a partir de um registro do arquivo de lote (executa em thread)"""
+        resultado, data = self._preparar_criacao(item)
+        if data is None:
+            return resultado
+        response = self._make_request("POST", "users/", data, quiet=True,
+                                      idempotency_key=item[1].get("_idempotency_key") or self._chave_criacao_nova())
+        if response is None and self._criacao_repetida_ja_feita():
+            response = self._usuario_criado(data["email"])
+        return self._concluir_criacao(resultado, response)
+
+    async def _criar_usuario_registro_async(self, client: AsyncApiClient,
+                                            item: Tuple[int, Dict[str, Any]]) -> Dict[str, Any]:
+        """Versão asyncio de _criar_usuario_registro"""
+        resultado, data = self._preparar_criacao(item)
+        if data is None:
+            return resultado
+        response = await self._make_request_async(client, "POST", "users/", data,
+                                                  idempotency_key=item[1].get("_idempotency_key")
+                                                  or self._chave_criacao_nova())
+        if response is None and self._criacao_repetida_ja_feita():
+            # A busca roda em outra thread; o erro original volta para esta antes de concluir
+            erro = self.last_error
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(None, self._usuario_criado, data["email"])
+            self._local.error = erro
+        return self._concluir_criacao(resultado, response)
+
+    def criar_usuarios_lote(self, arquivo: str, saida: Optional[str] = None,
+                            concorrencia: int = DEFAULT_CONCURRENCY,
+                            diario: Optional[JobJournal] = None) -> Dict[str, int]:
+        """
+        Cria usuários em lote a partir de um arquivo CSV ou JSONL.
+
+        Colunas/chaves aceitas: email, name (ou nome), password (ou senha),
+        send_email (ou enviar_email) e company_id (padrão: empresa do admin logado).
+        O resultado de cada linha é gravado em `saida` (CSV ou JSONL). Com
+        `arquivo` igual a "-" os registros vêm da entrada padrão e o resultado
+        sai em JSONL na saída padrão.
+        
+        Antes de qualquer requisição, o BatchValidator reprova localmente emails
+        inválidos, senhas curtas, emails repetidos no arquivo e os já cadastrados.
+        Lotes lidos de arquivo ganham um JobJournal; com `diario` (job retomado),
+        os emails já criados são pulados e cada linha reenvia a mesma Idempotency-Key.
+        Na retomada, um email já cadastrado sai como "ignorado" (concluído no
+        diário): a execução interrompida pode tê-lo criado sem registrar.
+        """
+        if not saida:
+            base, _ = os.path.splitext(arquivo)
+            saida = "-" if arquivo == "-" else f"{base}_resultado.csv"
+        retomada = diario is not None
+        if diario is None and arquivo != "-":
+            diario = self._novo_diario("criar_usuarios", arquivo=os.path.abspath(arquivo),
+                                       saida=saida if saida == "-" else os.path.abspath(saida),
+                                       concorrencia=concorrencia)
+
+        validador = BatchValidator(self._emails_existentes() if CHECK_EXISTING else (), retomada)
+        logger.info("Batch user creation: %s -> %s (concurrency: %s)", arquivo, saida, concorrencia)
+        print(f"\n⏳ Criando usuários de '{arquivo}' ({self._descrever_paralelismo(concorrencia)})...")
+
+        totais = {"criado": 0, "ignorado": 0, "erro": 0}
+        contagem: Dict[str, int] = collections.Counter()
+        inicio = datetime.now()
+        with ResultadoWriter(saida, stream=self.saida_dados) as writer, (diario or contextlib.nullcontext()):
+            itens = enumerate(ler_registros(arquivo), 1)
+            funcao, corrotina = self._criar_usuario_registro, self._criar_usuario_registro_async
+            if diario:
+                itens = self._itens_pendentes(itens, diario, self._chave_criacao, contagem)
+            itens = validador.filtrar(itens)
+            if diario:
+                itens = ((linha, dict(registro, _idempotency_key=diario.chave_idempotencia(
+                             self._chave_criacao((linha, registro)))))
+                         for linha, registro in itens)
+                funcao, corrotina = self._com_diario(diario, self._chave_criacao, funcao, corrotina)
+            try:
+                for _, resultado in self._executar_lote(itens, funcao, corrotina, concorrencia):
+                    writer.write(resultado)
+                    totais[resultado["status"]] += 1
+                    if resultado["status"] == "criado":
+                        print(f"   ✅ [{resultado['linha']}] {resultado['email']} (ID: {resultado['id']})")
+                    elif resultado["status"] == "ignorado":
+                        print(f"   ⏭️  [{resultado['linha']}] {resultado['email']}: {resultado['erro']}")
+                    else:
+                        print(f"   ❌ [{resultado['linha']}] {resultado['email'] or '-'}: {resultado['erro']}")
+            except KeyboardInterrupt:
+                logger.warning("Batch user creation interrupted: %s", arquivo)
+                print("\n\n⚠️  Lote interrompido pelo usuário (linhas já processadas foram gravadas)")
+                contagem["interrompido"] = 1
+
+        if totais["criado"]:
+            self.invalidar_cache()
+        
+        duracao = (datetime.now() - inicio).total_seconds()
+        logger.info("Batch user creation finished: %s in %.1fs", totais, duracao)
+        print(f"\n📊 Resumo: {totais['criado']} criado(s), {totais['erro']} erro(s) em {duracao:.1f}s")
+        if validador.reprovados:
+            reprovados = validador.reprovados
+            logger.info("Batch validation rejected rows locally: %s", dict(reprovados))
+            print(f"🔎 Reprovadas sem chamar a API: {reprovados['invalido']} inválida(s), "
+                  f"{reprovados['repetido']} repetida(s) no arquivo, {reprovados['existente']} já cadastrada(s)")
+        if validador.ja_cadastrados:
+            logger.info("Resumed job: %s rows already registered, marked as done", validador.ja_cadastrados)
+            print(f"⏭️  {validador.ja_cadastrados} email(s) já cadastrado(s) contado(s) como concluído(s) na retomada")
+        self._resumo_diario(diario, contagem["pulados"], bool(totais["erro"] or contagem["interrompido"]))
+        if saida != "-":
+            print(f"📄 Resultado por linha: {saida}")
+        return totais
+
+    def criar_usuarios_lote_interativo(self):
+        """Solicita o arquivo e os parâmetros do lote e executa a criação"""
+        print("\n" + "="*60)
+        print("📦 CRIAR USUÁRIOS EM LOTE (CSV/JSONL)")
+        print("="*60)
+        print("Colunas: email, name, password (opcional), send_email (opcional), company_id (opcional)")
+
+        try:
+            arquivo = os.path.expanduser(sanitize_input(input("📄 Arquivo de entrada: ")))
+            if not arquivo or not os.path.isfile(arquivo):
+                print("❌ Arquivo não encontrado")
+                return
+
+            base, _ = os.path.splitext(arquivo)
+            saida_padrao = f"{base}_resultado.csv"
+            saida = os.path.expanduser(sanitize_input(input(f"📝 Arquivo de resultado [{saida_padrao}]: "))) or saida_padrao
+
+            concorrencia = self._perguntar_concorrencia()
+            if concorrencia < 1:
+                print("❌ A concorrência deve ser maior que zero")
+                return
+        except ValueError:
+            print("❌ Entrada inválida! Digite apenas números")
+            return
+        except (EOFError, KeyboardInterrupt):
+            print("\n\n⚠️  Operação cancelada")
+            return
+
+        self.criar_usuarios_lote(arquivo, saida, concorrencia)
+
     def alterar_senha(self):
         """Altera a senha do usuário logado"""
         print("\n" + "="*60)
@@ -351,7 +3548,7 @@ class QubeAdminCLI:
                 print("❌ Senha atual não pode ser vazia")
                 return
             
-            new_password = getpass("🔑 Nova senha (mínimo 8 caracteres): ")
+            new_password = getpass(f"🔑 Nova senha (mínimo {MIN_PASSWORD_LENGTH} caracteres): ")
             if not new_password:
                 print("❌ Nova senha não pode ser vazia")
                 return
@@ -366,122 +3563,432 @@ class QubeAdminCLI:
             print("❌ As senhas não coincidem!")
             return
         
-        if len(new_password) < 8:
-            print("❌ A senha deve ter no mínimo 8 caracteres!")
+        self.trocar_senha(current_password, new_password)
+    
+    def trocar_senha(self, current_password: str, new_password: str) -> bool:
+        """Valida a nova senha e envia a alteração para `auth/change-password`"""
+        if len(new_password) < MIN_PASSWORD_LENGTH:
+            print(f"❌ A senha deve ter no mínimo {MIN_PASSWORD_LENGTH} caracteres!")
+            return False
+        
+        data = {
+            "current_password": current_password,
+            "new_password": new_password
+        }
+        
+        print("\n⏳ Alterando senha...")
+        response = self._make_request("POST", "auth/change-password", data)
+        
+        email = (self.user_info or {}).get("email")
+        if response:
+            logger.info("Password changed for user: %s", email)
+            self._auditar("trocar_senha", "alterada", email=email, user_id=(self.user_info or {}).get("id"))
+            print("\n✅ Senha alterada com sucesso!")
+            return True
+        self._auditar("trocar_senha", "erro", email=email, user_id=(self.user_info or {}).get("id"),
+                      erro=self.last_error)
+        print("\n❌ Falha ao alterar senha")
+        return False
+    
+    def _params_empresa(self) -> Dict[str, Any]:
+        """Parâmetros de filtro pela company_id do usuário logado"""
+        params = {}
+        if self.user_info and self.user_info.get("company_id"):
+            params["company_id"] = self.user_info.get("company_id")
+        return params
+    
+    def _buscar_pagina_usuarios(self, pagina: int, tamanho: int, search: Optional[str] = None,
+                                cursor: Optional[str] = None, quiet: bool = False,
+                                headers: Optional[Dict[str, str]] = None, stream: bool = False,
+                                sondar: bool = False) -> Optional[Any]:
+        """
+        Busca uma página de `admin/users`.
+        
+        Envia page/skip/limit (ou cursor, quando a API já retornou um) e devolve
+        (usuarios, tem_mais, proximo_cursor). Retorna None em caso de erro e
+        NOT_MODIFIED quando `headers` condicionais recebem 304. Com `stream=True`
+        devolve o RespostaStream da página; a continuação sai de _paginacao
+        (`sondar` conforme _paginacao).
+        """
+        params = self._params_empresa()
+        params["limit"] = tamanho
+        if cursor:
+            params["cursor"] = cursor
+        else:
+            params["page"] = pagina
+            params["skip"] = (pagina - 1) * tamanho
+        if search:
+            params["search"] = search
+        
+        logger.info("Listando usuários com params: %s", params)
+        response = self._make_request("GET", "admin/users", params=params, quiet=quiet, headers=headers,
+                                      stream=stream)
+        
+        if response is None or response is NOT_MODIFIED:
+            return response
+        if stream:
+            return response if isinstance(response, RespostaStream) else None
+        
+        # Verificar diferentes estruturas possíveis
+        if isinstance(response, list):
+            usuarios = response
+            meta: Dict[str, Any] = {}
+        elif isinstance(response, dict) and ("users" in response or "data" in response):
+            usuarios = response.get("users", response.get("data")) or []
+            meta = response
+        else:
+            logger.warning("Unexpected admin/users response format: %s", type(response))
+            if os.getenv("QUBE_CLI_DEBUG", "false").lower() == "true":
+                print(f"🔍 DEBUG - Resposta completa: {response}")
+            return None
+        
+        tem_mais, proximo_cursor = self._paginacao(meta, pagina, tamanho, len(usuarios), sondar)
+        return usuarios, tem_mais, proximo_cursor
+    
+    @staticmethod
+    def _paginacao(meta: Dict[str, Any], pagina: int, tamanho: int, quantidade: int,
+                   sondar: bool = False) -> Tuple[bool, Optional[str]]:
+        """
+        (tem_mais, proximo_cursor) a partir dos campos de paginação e do tamanho da página recebida.
+        
+        Sem has_more/next_cursor/total, uma primeira página menor que `tamanho`
+        pode ser o teto de página do servidor: com `sondar` ela não encerra a
+        listagem (quem percorre tudo pede a próxima página com o tamanho observado).
+        """
+        proximo_cursor = meta.get("next_cursor") or None
+        if "has_more" in meta:
+            tem_mais = bool(meta["has_more"])
+        elif proximo_cursor:
+            tem_mais = True
+        elif meta.get("total") is not None:
+            tem_mais = (pagina - 1) * tamanho + quantidade < int(meta["total"])
+        else:
+            tem_mais = quantidade == tamanho or (sondar and pagina == 1 and quantidade > 0)
+        
+        # API sem suporte a paginação devolve tudo de uma vez
+        if quantidade > tamanho:
+            tem_mais = False
+        return tem_mais, proximo_cursor
+    
+    def iter_paginas_usuarios(self, tamanho_pagina: int = FETCH_PAGE_SIZE, search: Optional[str] = None,
+                              quiet: bool = False, stream: bool = False) -> Iterator[Iterable[Dict[str, Any]]]:
+        """
+        Gera as páginas de usuários da empresa, uma requisição por página.
+        
+        Com `stream=True` cada página é um iterador que entrega os usuários conforme
+        o corpo da resposta chega; a página seguinte só é pedida depois que a atual
+        foi consumida (o restante é descartado se quem consome parar antes).
+        """
+        pagina = 1
+        cursor = None
+        primeiro_id_anterior = None
+        while True:
+            resultado = self._buscar_pagina_usuarios(pagina, tamanho_pagina, search, cursor, quiet=quiet,
+                                                     stream=stream, sondar=True)
+            if resultado is None:
+                return
+            if stream:
+                itens = iter(resultado)
+                primeiro = next(itens, None)
+                usuarios: Iterable[Dict[str, Any]] = itertools.chain([primeiro], itens)
+            else:
+                usuarios, tem_mais, cursor = resultado
+                primeiro = usuarios[0] if usuarios else None
+            if primeiro is None:
+                if stream and resultado.erro:
+                    self._local.error = resultado.erro
+                return
+            # Proteção contra APIs que ignoram page/skip e repetem a primeira página
+            primeiro_id = primeiro.get("id")
+            if pagina > 1 and primeiro_id is not None and primeiro_id == primeiro_id_anterior:
+                logger.warning("admin/users ignored pagination parameters; stopping")
+                return
+            primeiro_id_anterior = primeiro_id
+            yield usuarios
+            if stream:
+                for _ in itens:
+                    pass
+                if resultado.erro:
+                    self._local.error = resultado.erro
+                    return
+                tem_mais, cursor = self._paginacao(resultado.meta, pagina, tamanho_pagina, resultado.quantidade,
+                                                   sondar=True)
+            if not tem_mais:
+                return
+            # Servidor com teto de página abaixo do pedido: continua com o tamanho que ele devolve
+            quantidade = resultado.quantidade if stream else len(usuarios)
+            if pagina == 1 and quantidade < tamanho_pagina:
+                logger.info("admin/users returned %s of %s requested; using that page size", quantidade, tamanho_pagina)
+                tamanho_pagina = quantidade
+            pagina += 1
+    
+    def iter_usuarios(self, tamanho_pagina: int = FETCH_PAGE_SIZE, search: Optional[str] = None,
+                      quiet: bool = False, stream: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Gera os usuários da empresa página por página, sem manter a lista inteira em memória
+        (com `stream=True`, cada usuário assim que é lido da resposta)
+        """
+        for usuarios in self.iter_paginas_usuarios(tamanho_pagina, search, quiet, stream):
+            yield from usuarios
+    
+    def _gerar_usuarios(self, quiet: bool = False) -> Iterator[Any]:
+        """
+        Gera a lista completa de usuários (modelos User), usando o cache local quando válido.
+        
+        Entradas expiradas são revalidadas com ETag/Last-Modified quando a lista
+        veio de uma única resposta; caso contrário a lista é buscada novamente e
+        cada usuário é entregue assim que é lido da resposta. O cache só é gravado
+        quando a lista chega inteira; em caso de erro, `last_error` fica preenchido.
+        """
+        self._local.error = None
+        chave = self._chave_cache("users")
+        geracao = self._cache_geracao
+        entrada = self.cache.get(chave)
+        if self.cache.is_fresh(entrada):
+            logger.info("Users list served from cache (%s users)", len(entrada['items']))
+            yield from User.lista(entrada["items"])
             return
         
-        data = {
-            "current_password": current_password,
-            "new_password": new_password
-        }
+        headers = self.cache.revalidation_headers(entrada) if entrada and entrada.get("single_page") else None
+        if headers:
+            resultado = self._buscar_pagina_usuarios(1, FETCH_PAGE_SIZE, quiet=quiet, headers=headers)
+            if resultado is NOT_MODIFIED:
+                logger.info("Users list revalidated (304), cache renewed")
+                self.cache.touch(chave, entrada)
+                yield from User.lista(entrada["items"])
+                return
+            if resultado is not None and not resultado[1]:
+                usuarios = User.lista(resultado[0])
+                if geracao == self._cache_geracao:
+                    self.cache.put(chave, usuarios, single_page=True, **self._validadores_resposta())
+                yield from usuarios
+                return
+            # A lista passou a ter mais de uma página (ou houve erro): busca completa
         
-        print("\n⏳ Alterando senha...")
-        response = self._make_request("POST", "auth/change-password", data)
+        usuarios = []
+        validadores: Dict[str, Optional[str]] = {}
+        for numero, pagina in enumerate(self.iter_paginas_usuarios(quiet=quiet, stream=True), 1):
+            if numero == 1:
+                validadores = self._validadores_resposta()
+            else:
+                validadores = {}
+            for dados in pagina:
+                usuario = User.from_dict(dados)
+                usuarios.append(usuario)
+                yield usuario
         
-        if response:
-            print("\n✅ Senha alterada com sucesso!")
-        else:
-            print("\n❌ Falha ao alterar senha")
+        if not self.last_error and geracao == self._cache_geracao:
+            self.cache.put(chave, usuarios, single_page=any(validadores.values()), **validadores)
+    
+    def _carga_compartilhada(self, endpoint: str, buscar: Callable[[], Optional[list]]) -> Optional[list]:
+        """
+        Carga completa de uma lista pelo ReadCoalescer, como uma leitura só.
+        
+        As páginas em streaming e as revalidações condicionais ficam fora do
+        coalescer em _make_request; aqui a carga inteira é compartilhada entre
+        chamadas simultâneas (ex.: índice em segundo plano e menu) e memorizada.
+        """
+        if not self.leituras.ativo:
+            return buscar()
+        
+        def carregar() -> Tuple[Optional[list], Dict[str, Any]]:
+            resultado = buscar()
+            return resultado, {"error": self.last_error}
+        
+        resultado, estado = self.leituras.obter((endpoint, (("carga", "lista"),), self.token), carregar)
+        self._local.error = estado["error"]
+        return resultado
+    
+    def _carregar_usuarios(self, quiet: bool = False) -> Optional[list]:
+        """Retorna a lista completa de usuários (ver _gerar_usuarios), ou None em caso de erro"""
+        def buscar() -> Optional[list]:
+            usuarios = list(self._gerar_usuarios(quiet))
+            return None if self.last_error else usuarios
+        return self._carga_compartilhada("admin/users", buscar)
     
     def listar_usuarios(self) -> Optional[list]:
         """Lista usuários da empresa"""
         print("\n⏳ Buscando usuários...")
         
-        # Filtrar pela company_id do usuário logado
-        params = {}
-        if self.user_info and self.user_info.get("company_id"):
-            params["company_id"] = self.user_info.get("company_id")
-        
-        logger.info(f"Listando usuários com params: {params}")
-        response = self._make_request("GET", "admin/users", params=params)
+        usuarios = self._carregar_usuarios()
         
-        logger.debug(f"Response type: {type(response)}, content: {response}")
+        if usuarios is not None:
+            logger.debug("Usuários carregados: %s", len(usuarios))
+        return usuarios
+    
+    def listar_agents(self, quiet: bool = False) -> Optional[list]:
+        """Lista workers/agents disponíveis (cargas simultâneas compartilham a mesma requisição)"""
+        return self._carga_compartilhada("agents/", lambda: self._buscar_agents(quiet))
+    
+    def _buscar_agents(self, quiet: bool = False) -> Optional[list]:
+        """Lista de workers do cache local ou da API (revalidada com ETag)"""
+        chave = self._chave_cache("agents")
+        entrada = self.cache.get(chave)
+        if self.cache.is_fresh(entrada):
+            logger.info("Agents list served from cache (%s agents)", len(entrada['items']))
+            return Agent.lista(entrada["items"])
         
-        if response:
-            # Debug: mostrar estrutura da resposta
-            print(f"🔍 DEBUG - Tipo de resposta: {type(response)}")
-            print(f"🔍 DEBUG - Chaves da resposta: {response.keys() if isinstance(response, dict) else 'Não é dict'}")
-            
-            # Verificar diferentes estruturas possíveis
-            if isinstance(response, list):
-                return response
-            elif isinstance(response, dict):
-                if "users" in response:
-                    return response["users"]
-                elif "data" in response:
-                    return response["data"]
-                else:
-                    print(f"🔍 DEBUG - Resposta completa: {response}")
+        if not quiet:
+            print("\n⏳ Buscando workers...")
         
-        return None
-    
-    def listar_agents(self) -> Optional[list]:
-        """Lista workers/agents disponíveis"""
-        print("\n⏳ Buscando workers...")
+        response = self._make_request("GET", "agents/", headers=self.cache.revalidation_headers(entrada), quiet=quiet)
         
-        response = self._make_request("GET", "agents/")
+        if response is NOT_MODIFIED:
+            logger.info("Agents list revalidated (304), cache renewed")
+            self.cache.touch(chave, entrada)
+            return Agent.lista(entrada["items"])
         
+        agents = None
         if response and isinstance(response, list):
-            return response
+            agents = Agent.lista(response)
         elif response and "agents" in response:
-            return response["agents"]
+            agents = Agent.lista(response["agents"])
+        
+        if agents is not None:
+            self.cache.put(chave, agents, **self._validadores_resposta())
+        return agents
+    
+    def _indice_usuarios_pronto(self) -> Optional[SearchIndex]:
+        """
+        Retorna o índice de usuários da sessão se já estiver pronto.
+        
+        Na primeira chamada, inicia a carga da lista completa (cache ou API) em
+        segundo plano; até terminar, a seleção usa a paginação do servidor.
+        """
+        if self._indice_usuarios is not None:
+            return self._indice_usuarios
+        
+        entrada = self.cache.get(self._chave_cache("users"))
+        if self.cache.is_fresh(entrada):
+            self._indice_usuarios = SearchIndex(User.lista(entrada["items"]))
+            return self._indice_usuarios
+        
+        if self._carga_indice is None or not self._carga_indice.is_alive():
+            geracao = self._cache_geracao
+            
+            def carregar():
+                try:
+                    usuarios = self._carregar_usuarios(quiet=True)
+                    if usuarios is not None and geracao == self._cache_geracao:
+                        self._indice_usuarios = SearchIndex(usuarios)
+                        logger.info("Users index built: %s users", len(usuarios))
+                except Exception:
+                    logger.exception("Error building users index")
+            
+            self._carga_indice = threading.Thread(target=carregar, name="qube-indice-usuarios", daemon=True)
+            self._carga_indice.start()
         return None
     
+    def _obter_indice_agents(self) -> Optional[SearchIndex]:
+        """Retorna o índice de workers da sessão, carregando a lista se necessário"""
+        if self._indice_agents is None:
+            futuro, self._prefetch_agents = self._prefetch_agents, None
+            agents = futuro.result() if futuro is not None else None
+            if agents is None:
+                agents = self.listar_agents()
+            if agents:
+                self._indice_agents = SearchIndex(agents, ("name", "id", "status"))
+        return self._indice_agents
+    
+    def _selecionar_paginado(self, rotulo: str, prompt: str, formatar: Callable[[Dict[str, Any]], str],
+                             obter_indice: Callable[[], Optional[SearchIndex]],
+                             buscar_servidor: Optional[Callable[..., Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Exibe uma lista uma página por vez e permite buscar digitando parte do texto.
+        
+        Buscas e páginas são resolvidas no índice em memória quando ele está
+        disponível; caso contrário, em `buscar_servidor` (paginação da API).
+        """
+        pagina = 1
+        search: Optional[str] = None
+        # cursores[i] = cursor para buscar a página i + 1 (None = usar page/skip)
+        cursores: list = [None]
+        
+        while True:
+            titulo = f"\n📋 {rotulo} (página {pagina})"
+            if search:
+                titulo += f" - busca: '{search}'"
+            print(titulo + ":")
+            
+            indice = obter_indice()
+            if indice is not None:
+                resultado = indice.pagina(pagina, DEFAULT_PAGE_SIZE, search)
+            elif buscar_servidor is not None:
+                resultado = buscar_servidor(pagina, DEFAULT_PAGE_SIZE, search, cursores[pagina - 1])
+            else:
+                resultado = None
+            if resultado is None:
+                print("❌ Nenhum registro encontrado ou erro ao buscar")
+                return None
+            itens, tem_mais, proximo_cursor = resultado
+            if len(cursores) == pagina:
+                cursores.append(proximo_cursor)
+            
+            if not itens:
+                print("   Nenhum resultado encontrado")
+            # API sem paginação: numeração começa em 1 mesmo se a lista vier inteira
+            inicio = (pagina - 1) * DEFAULT_PAGE_SIZE if len(itens) <= DEFAULT_PAGE_SIZE else 0
+            for idx, item in enumerate(itens, inicio + 1):
+                print(f"{idx}. {formatar(item)}")
+            
+            opcoes = []
+            if tem_mais:
+                opcoes.append("[n] próxima")
+            if pagina > 1:
+                opcoes.append("[p] anterior")
+            if search:
+                opcoes.append("[*] limpar busca")
+            opcoes.append("texto para buscar")
+            print(f"\n💡 {', '.join(opcoes)}, [ENTER] cancelar")
+            
+            try:
+                escolha = sanitize_input(input(prompt))
+            except (EOFError, KeyboardInterrupt):
+                print("\n\n⚠️  Operação cancelada")
+                return None
+            
+            if not escolha:
+                print("❌ Operação cancelada")
+                return None
+            if escolha.lower() == "n" and tem_mais:
+                pagina += 1
+            elif escolha.lower() == "p" and pagina > 1:
+                pagina -= 1
+            elif escolha == "*":
+                search, pagina, cursores = None, 1, [None]
+            elif escolha.isdigit() and itens:
+                numero = int(escolha)
+                if numero < inicio + 1 or numero > inicio + len(itens):
+                    print("❌ Seleção inválida! Escolha um número da página exibida")
+                    continue
+                return itens[numero - inicio - 1]
+            else:
+                search, pagina, cursores = escolha, 1, [None]
+    
     def associar_usuario_worker(self):
         """Associa um worker a um usuário"""
         print("\n" + "="*60)
         print("🔗 ASSOCIAR USUÁRIO/WORKER")
         print("="*60)
         
-        # Listar usuários
-        print("\n📋 Usuários disponíveis:")
-        usuarios = self.listar_usuarios()
-        
-        if not usuarios:
-            print("❌ Nenhum usuário encontrado ou erro ao buscar")
-            return
-        
-        for idx, user in enumerate(usuarios, 1):
-            print(f"{idx}. {user.get('name', 'N/A')} - {user.get('email', 'N/A')} (ID: {user.get('id', 'N/A')})")
-        
-        # Selecionar usuário
-        try:
-            user_choice = int(sanitize_input(input("\n👤 Selecione o número do usuário: ")))
-            if user_choice < 1 or user_choice > len(usuarios):
-                print("❌ Seleção inválida!")
-                return
-            selected_user = usuarios[user_choice - 1]
-        except ValueError:
-            print("❌ Entrada inválida! Digite apenas números")
-            return
-        except (EOFError, KeyboardInterrupt):
-            print("\n\n⚠️  Operação cancelada")
-            return
-        
-        # Listar workers
-        print("\n📋 Workers disponíveis:")
-        agents = self.listar_agents()
+        # Workers são buscados em paralelo enquanto o usuário é selecionado
+        if self._indice_agents is None and self._prefetch_agents is None:
+            self._prefetch_agents = self._em_segundo_plano(self.listar_agents, True)
         
-        if not agents:
-            print("❌ Nenhum worker encontrado ou erro ao buscar")
+        # Selecionar usuário (busca no índice da sessão ou paginação do servidor)
+        selected_user = self._selecionar_paginado(
+            "Usuários disponíveis", "👤 Selecione o número do usuário: ",
+            lambda u: f"{u.get('name', 'N/A')} - {u.get('email', 'N/A')} (ID: {u.get('id', 'N/A')})",
+            self._indice_usuarios_pronto, self._buscar_pagina_usuarios)
+        if not selected_user:
             return
         
-        for idx, agent in enumerate(agents, 1):
-            status = agent.get('status', 'N/A')
-            print(f"{idx}. {agent.get('name', 'N/A')} - Status: {status} (ID: {agent.get('id', 'N/A')})")
-        
         # Selecionar worker
-        try:
-            agent_choice = int(sanitize_input(input("\n🤖 Selecione o número do worker: ")))
-            if agent_choice < 1 or agent_choice > len(agents):
-                print("❌ Seleção inválida!")
-                return
-            selected_agent = agents[agent_choice - 1]
-        except ValueError:
-            print("❌ Entrada inválida! Digite apenas números")
-            return
-        except (EOFError, KeyboardInterrupt):
-            print("\n\n⚠️  Operação cancelada")
+        selected_agent = self._selecionar_paginado(
+            "Workers disponíveis", "🤖 Selecione o número do worker: ",
+            lambda a: f"{a.get('name', 'N/A')} - Status: {a.get('status', 'N/A')} (ID: {a.get('id', 'N/A')})",
+            self._obter_indice_agents)
+        if not selected_agent:
             return
         
         # Confirmar associação
@@ -506,12 +4013,600 @@ class QubeAdminCLI:
         print("\n⏳ Associando...")
         response = self._make_request("POST", f"agents/{agent_id}/assign", data)
         
+        auditoria = {"email": selected_user.get('email'), "user_id": selected_user.get('id'),
+                     "agent_id": agent_id, "agent": selected_agent.get('name')}
         if response:
+            logger.info("User %s assigned to agent %s", selected_user.get('email'), agent_id)
+            self._auditar("associar", "associado", **auditoria)
+            self.invalidar_cache()
             print("\n✅ Associação realizada com sucesso!")
             print(f"   Usuário '{selected_user.get('name')}' agora tem acesso ao worker '{selected_agent.get('name')}'")
         else:
+            logger.error("Failed to assign %s to agent %s: %s", selected_user.get('email'), agent_id, self.last_error)
+            self._auditar("associar", "erro", erro=self.last_error, **auditoria)
             print("\n❌ Falha ao associar usuário ao worker")
     
+    def _resolver_associacoes(self, registros: Iterable[Dict[str, Any]], usuarios: list,
+                              agents: list) -> Iterator[Dict[str, Any]]:
+        """
+        Converte registros (email/user_id + agent_id/agent_name) em associações a executar.
+        
+        Pares já associados no servidor ou repetidos no arquivo saem com status
+        "ignorado" e não geram requisição.
+        """
+        usuarios_por_email = {str(u.get("email", "")).lower(): u for u in usuarios}
+        usuarios_por_id = {str(u.get("id")): u for u in usuarios}
+        agents_por_id = {str(a.get("id")): a for a in agents}
+        agents_por_nome = {str(a.get("name", "")).lower(): a for a in agents}
+        atribuidos = {str(a.get("id")): ids_usuarios_do_agent(a) for a in agents}
+        vistos = set()
+        
+        for linha, registro in enumerate(registros, 1):
+            email = sanitize_input(str(registro.get("user_email") or registro.get("email") or ""))
+            user_ref = sanitize_input(str(registro.get("user_id") or ""))
+            agent_ref = sanitize_input(str(registro.get("agent_id") or registro.get("agent_name")
+                                           or registro.get("agent") or registro.get("worker") or ""))
+            item = {"linha": linha, "email": email, "user_id": user_ref or None,
+                    "agent_id": None, "agent": agent_ref, "status": "erro", "erro": None}
+            
+            if registro.get("_erro"):
+                item["erro"] = registro["_erro"]
+                yield item
+                continue
+            
+            user = usuarios_por_id.get(user_ref) if user_ref else usuarios_por_email.get(email.lower())
+            agent = agents_por_id.get(agent_ref) or agents_por_nome.get(agent_ref.lower())
+            if not user:
+                item["erro"] = f"Usuário não encontrado: {user_ref or email or '-'}"
+            elif not agent:
+                item["erro"] = f"Worker não encontrado: {agent_ref or '-'}"
+            else:
+                item["user_id"] = str(user.get("id"))
+                item["email"] = user.get("email", email)
+                item["agent_id"] = str(agent.get("id"))
+                item["agent"] = agent.get("name", agent_ref)
+                par = (item["user_id"], item["agent_id"])
+                if par in vistos or item["user_id"] in atribuidos.get(item["agent_id"], set()):
+                    item["status"] = "ignorado"
+                    item["erro"] = "Já associado"
+                else:
+                    vistos.add(par)
+                    item["status"] = "pendente"
+            yield item
+    
+    def _concluir_associacao(self, item: Dict[str, Any], response: Optional[Dict]) -> Dict[str, Any]:
+        """Preenche o resultado de uma associação do lote a partir da resposta da API"""
+        resultado = dict(item)
+        auditoria = {"email": item["email"], "user_id": item["user_id"],
+                     "agent_id": item["agent_id"], "agent": item["agent"]}
+        if response:
+            resultado["status"] = "associado"
+            logger.info("User %s assigned to agent %s (batch line %s)", item['email'], item['agent_id'], item['linha'])
+            self._auditar("associar", "associado", **auditoria)
+        elif self.last_status_code == 409:
+            # Idempotência: a API informa que o par já existe
+            resultado["status"] = "ignorado"
+            resultado["erro"] = "Já associado"
+        else:
+            resultado["status"] = "erro"
+            resultado["erro"] = self.last_error or "Erro desconhecido"
+            logger.error("Failed to assign %s to agent %s: %s", item['email'], item['agent_id'], resultado['erro'])
+            self._auditar("associar", "erro", erro=resultado["erro"], **auditoria)
+        return resultado
+    
+    def _associar_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Executa uma associação do lote (executa em thread)"""
+        if item["status"] != "pendente":
+            return item
+        response = self._make_request("POST", f"agents/{item['agent_id']}/assign",
+                                      {"user_id": item["user_id"]}, quiet=True)
+        return self._concluir_associacao(item, response)
+    
+    async def _associar_item_async(self, client: AsyncApiClient, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Versão asyncio de _associar_item"""
+        if item["status"] != "pendente":
+            return item
+        response = await self._make_request_async(client, "POST", f"agents/{item['agent_id']}/assign",
+                                                  {"user_id": item["user_id"]})
+        return self._concluir_associacao(item, response)
+    
+    def associar_lote(self, arquivo: Optional[str] = None, filtro_email: Optional[str] = None,
+                      agent: Optional[str] = None, saida: Optional[str] = None,
+                      concorrencia: int = DEFAULT_CONCURRENCY,
+                      taxa: float = DEFAULT_RATE_LIMIT,
+                      registros: Optional[Iterable[Dict[str, Any]]] = None,
+                      diario: Optional[JobJournal] = None) -> Optional[Dict[str, int]]:
+        """
+        Associa usuários a workers em lote.
+        
+        Use `arquivo` (CSV/JSONL com email ou user_id e agent_id ou agent_name, "-"
+        para a entrada padrão), `registros` já lidos com as mesmas chaves, ou
+        `filtro_email` + `agent` (todos os usuários cujo email casa com o filtro,
+        aceitando curingas *, associados ao worker informado por ID ou nome).
+        Lotes de arquivo ou filtro ganham um JobJournal; com `diario` (job
+        retomado), os pares já associados nele são pulados.
+        """
+        if not arquivo and registros is None and not (filtro_email and agent):
+            print("❌ Informe um arquivo de mapeamento ou um filtro de email e um worker")
+            return None
+        
+        if not saida:
+            if arquivo == "-":
+                saida = "-"
+            elif arquivo:
+                base, _ = os.path.splitext(arquivo)
+                saida = f"{base}_resultado.csv"
+            else:
+                saida = f"associacoes_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        
+        # Usuários e workers são independentes: busca os dois ao mesmo tempo
+        print("\n⏳ Buscando usuários e workers...")
+        agents_futuro = self._em_segundo_plano(self.listar_agents, True)
+        usuarios = self._carregar_usuarios(quiet=True)
+        agents = agents_futuro.result()
+        if usuarios is None or agents is None:
+            print("❌ Erro ao buscar usuários ou workers")
+            return None
+        
+        if arquivo:
+            registros = ler_registros(arquivo)
+        elif registros is None:
+            padrao = filtro_email.lower()
+            if "*" not in padrao and "?" not in padrao:
+                padrao = f"*{padrao}*"
+            registros = ({"user_id": u.get("id"), "agent": agent} for u in usuarios
+                         if fnmatch.fnmatchcase(str(u.get("email", "")).lower(), padrao))
+        
+        logger.info("Batch assignment: %s -> %s (concurrency: %s, rate: %s/s)",
+                    arquivo or filtro_email, saida, concorrencia, taxa)
+        vazao = f"até {taxa:g} req/s" if taxa > 0 else "vazão ajustada automaticamente"
+        print(f"\n⏳ Associando ({self._descrever_paralelismo(concorrencia)}, {vazao})...")
+        
+        if diario is None and (arquivo or filtro_email) and arquivo != "-":
+            diario = self._novo_diario("associar", arquivo=arquivo and os.path.abspath(arquivo),
+                                       filtro_email=filtro_email, agent=agent,
+                                       saida=saida if saida == "-" else os.path.abspath(saida),
+                                       concorrencia=concorrencia, taxa=taxa)
+        
+        campos = ["linha", "email", "user_id", "agent_id", "agent", "status", "erro"]
+        totais = {"associado": 0, "ignorado": 0, "erro": 0}
+        contagem: Dict[str, int] = collections.Counter()
+        inicio = datetime.now()
+        with ResultadoWriter(saida, campos, stream=self.saida_dados) as writer, (diario or contextlib.nullcontext()), \
+                self.scheduler.teto_taxa("escrita", taxa):
+            itens = self._resolver_associacoes(registros, usuarios, agents)
+            funcao, corrotina = self._associar_item, self._associar_item_async
+            if diario:
+                itens = self._itens_pendentes(itens, diario, self._chave_associacao, contagem)
+                funcao, corrotina = self._com_diario(diario, self._chave_associacao, funcao, corrotina)
+            try:
+                lote = self._executar_lote(itens, funcao, corrotina, concorrencia)
+                for _, resultado in lote:
+                    writer.write(resultado)
+                    totais[resultado["status"]] += 1
+                    if resultado["status"] == "associado":
+                        print(f"   ✅ [{resultado['linha']}] {resultado['email']} → {resultado['agent']}")
+                    elif resultado["status"] == "erro":
+                        print(f"   ❌ [{resultado['linha']}] {resultado['email'] or '-'}: {resultado['erro']}")
+            except KeyboardInterrupt:
+                logger.warning("Batch assignment interrupted: %s", arquivo or filtro_email)
+                print("\n\n⚠️  Lote interrompido pelo usuário (linhas já processadas foram gravadas)")
+                contagem["interrompido"] = 1
+        
+        if totais["associado"]:
+            self.invalidar_cache()
+        
+        duracao = (datetime.now() - inicio).total_seconds()
+        logger.info("Batch assignment finished: %s in %.1fs", totais, duracao)
+        print(f"\n📊 Resumo: {totais['associado']} associado(s), {totais['ignorado']} já existente(s), "
+              f"{totais['erro']} erro(s) em {duracao:.1f}s")
+        self._resumo_diario(diario, contagem["pulados"], bool(totais["erro"] or contagem["interrompido"]))
+        if saida != "-":
+            print(f"📄 Resultado por linha: {saida}")
+        return totais
+    
+    def retomar_job(self, job_id: str, saida: Optional[str] = None, concorrencia: Optional[int] = None,
+                    taxa: Optional[float] = None) -> Optional[Dict[str, int]]:
+        """
+        Retoma um lote pelo diário: relê a entrada original, pula os itens já
+        concluídos e executa de novo os que falharam ou não chegaram a rodar.
+        
+        O resultado vai para `<saida original>_retomada` para não sobrescrever o
+        da execução anterior. Levanta ValueError se o job não existir.
+        """
+        diario = JobJournal.abrir(job_id)
+        parametros = diario.cabecalho.get("parametros") or {}
+        perfil = parametros.get("perfil")
+        if perfil != (self.perfil.nome if self.perfil else None):
+            diario.close()
+            raise ValueError(f"O job {diario.id} foi executado " +
+                             (f"no perfil '{perfil}': use --profile {perfil}" if perfil else "sem perfil: omita --profile"))
+        if not saida:
+            saida = parametros.get("saida") or "-"
+            if saida != "-":
+                base, ext = os.path.splitext(saida)
+                saida = f"{base}_retomada{ext}"
+        concorrencia = concorrencia or parametros.get("concorrencia") or DEFAULT_CONCURRENCY
+        logger.info("Resuming job %s (%s already done)", diario.id, diario.concluidos)
+        print(f"\n🔁 Retomando job {diario.id}: {diario.concluidos} item(ns) já concluído(s)")
+        
+        operacao = diario.cabecalho.get("operacao")
+        if operacao == "criar_usuarios":
+            return self.criar_usuarios_lote(parametros["arquivo"], saida, concorrencia, diario=diario)
+        if operacao == "associar":
+            taxa = parametros.get("taxa", DEFAULT_RATE_LIMIT) if taxa is None else taxa
+            return self.associar_lote(parametros.get("arquivo"), parametros.get("filtro_email"),
+                                      parametros.get("agent"), saida, concorrencia, taxa, diario=diario)
+        diario.close()
+        raise ValueError(f"Operação desconhecida no job {diario.id}: {operacao}")
+    
+    def associar_lote_interativo(self):
+        """Solicita a origem das associações e os parâmetros do lote e executa"""
+        print("\n" + "="*60)
+        print("🔗 ASSOCIAR USUÁRIOS/WORKER EM LOTE")
+        print("="*60)
+        print("1 - Arquivo de mapeamento (CSV/JSONL: email ou user_id, agent_id ou agent_name)")
+        print("2 - Filtro de email × worker (ex: *@bmg.com.br)")
+        
+        arquivo = filtro_email = agent = None
+        try:
+            modo = sanitize_input(input("\n➤ Escolha o modo: "))
+            if modo == "1":
+                arquivo = os.path.expanduser(sanitize_input(input("📄 Arquivo de mapeamento: ")))
+                if not arquivo or not os.path.isfile(arquivo):
+                    print("❌ Arquivo não encontrado")
+                    return
+            elif modo == "2":
+                filtro_email = sanitize_input(input("📧 Filtro de email: "))
+                if not filtro_email:
+                    print("❌ Filtro não pode ser vazio")
+                    return
+                agent = sanitize_input(input("🤖 ID ou nome do worker: "))
+                if not agent:
+                    print("❌ Worker não pode ser vazio")
+                    return
+            else:
+                print("❌ Modo inválido! Escolha 1 ou 2")
+                return
+            
+            saida = os.path.expanduser(sanitize_input(input("📝 Arquivo de resultado [automático]: "))) or None
+            
+            concorrencia = self._perguntar_concorrencia()
+            taxa_input = sanitize_input(input(f"⚙️  Máximo de requisições por segundo (0 = automático) [{DEFAULT_RATE_LIMIT:g}]: "))
+            taxa = float(taxa_input) if taxa_input else DEFAULT_RATE_LIMIT
+            if concorrencia < 1 or taxa < 0:
+                print("❌ Valores inválidos para concorrência ou taxa")
+                return
+        except ValueError:
+            print("❌ Entrada inválida! Digite apenas números")
+            return
+        except (EOFError, KeyboardInterrupt):
+            print("\n\n⚠️  Operação cancelada")
+            return
+        
+        self.associar_lote(arquivo, filtro_email, agent, saida, concorrencia, taxa)
+    
+    # ------------------------------------------------------------------
+    # Sincronização declarativa (arquivo de estado desejado x servidor)
+    # ------------------------------------------------------------------
+    
+    CAMPOS_SINCRONIZACAO = ["linha", "acao", "email", "user_id", "agent_id", "agent", "status", "erro"]
+    
+    def _ler_estado_desejado(self, arquivo: str) -> Tuple[Dict[str, Dict[str, Any]], list]:
+        """
+        Lê o estado desejado: um registro por usuário (ou por par usuário/worker).
+        
+        Colunas: as de `user create --file` mais `workers` (IDs ou nomes separados
+        por ";" ou "|", ou lista no JSONL); `worker`/`agent_id`/`agent_name` também
+        são aceitos. Linhas repetidas do mesmo email somam os workers.
+        """
+        desejado: Dict[str, Dict[str, Any]] = {}
+        erros = []
+        for linha, registro in enumerate(ler_registros(arquivo), 1):
+            email = sanitize_input(str(registro.get("email") or ""))
+            erro = registro.get("_erro") or BatchValidator.verificar(email, registro)
+            if erro:
+                erros.append({"linha": linha, "acao": "erro", "email": email, "status": "erro", "erro": erro})
+                continue
+            entrada = desejado.setdefault(email.lower(), {"linha": linha, "registro": registro, "workers": set()})
+            workers = (registro.get("workers") or registro.get("worker") or registro.get("agent")
+                       or registro.get("agent_id") or registro.get("agent_name") or [])
+            if isinstance(workers, str):
+                workers = re.split(r"[;|]", workers)
+            entrada["workers"].update(ref for ref in (sanitize_input(str(w)) for w in workers) if ref)
+        return desejado, erros
+    
+    def planejar_sincronizacao(self, arquivo: str,
+                               concorrencia: int = DEFAULT_CONCURRENCY) -> Optional[Dict[str, Any]]:
+        """
+        Compara o estado desejado com o servidor e devolve o plano mínimo.
+        
+        Usuários e workers são buscados uma vez, direto da API, e indexados por
+        email e por ID; a diferença é feita com conjuntos de pares (usuário, worker).
+        Nada é removido: usuários e associações que só existem no servidor são
+        apenas contados em "extras".
+        """
+        desejado, erros = self._ler_estado_desejado(arquivo)
+        
+        print("\n⏳ Buscando usuários e workers...")
+        agents_futuro = self._em_segundo_plano(self._agents_com_associacoes, concorrencia)
+        usuarios_atuais = {str(u.get("email", "")).lower(): str(u.get("id"))
+                           for u in self.iter_usuarios(quiet=True, stream=True)}
+        erro_usuarios = self.last_error
+        try:
+            agents = agents_futuro.result()
+        except RuntimeError as e:
+            print(f"❌ Erro ao buscar workers: {e}")
+            return None
+        if erro_usuarios:
+            print(f"❌ Erro ao buscar usuários: {erro_usuarios}")
+            return None
+        
+        agents_por_id = {str(a.get("id")): a for a in agents}
+        agents_por_nome = {str(a.get("name", "")).lower(): a for a in agents}
+        pares_atuais = {(user_id, str(a.get("id"))) for a in agents for user_id in ids_usuarios_do_agent(a)}
+        
+        criar, associar = [], []
+        pares_desejados = set()
+        for email, entrada in desejado.items():
+            user_id = usuarios_atuais.get(email)
+            email_original = sanitize_input(str(entrada["registro"].get("email")))
+            if user_id is None:
+                criar.append((entrada["linha"], entrada["registro"]))
+            for ref in sorted(entrada["workers"]):
+                agent = agents_por_id.get(ref) or agents_por_nome.get(ref.lower())
+                item = {"linha": entrada["linha"], "acao": "associar", "email": email_original,
+                        "user_id": user_id, "agent_id": None, "agent": ref, "status": "erro", "erro": None}
+                if not agent:
+                    item["erro"] = f"Worker não encontrado: {ref}"
+                    erros.append(item)
+                    continue
+                item["agent_id"] = str(agent.get("id"))
+                item["agent"] = agent.get("name", ref)
+                par = (user_id, item["agent_id"])
+                pares_desejados.add(par)
+                if user_id is None or par not in pares_atuais:
+                    item["status"] = "pendente"
+                    associar.append(item)
+        
+        extras = {"usuarios": len(usuarios_atuais.keys() - desejado.keys()),
+                  "associacoes": len(pares_atuais - pares_desejados)}
+        logger.info("Sync plan for %s: %s creates, %s assigns, %s errors, extras %s",
+                    arquivo, len(criar), len(associar), len(erros), extras)
+        return {"criar": criar, "associar": associar, "erros": erros, "extras": extras}
+    
+    def sincronizar(self, arquivo: str, saida: str = "-", apenas_plano: bool = False,
+                    concorrencia: int = DEFAULT_CONCURRENCY,
+                    taxa: float = DEFAULT_RATE_LIMIT) -> Optional[Dict[str, int]]:
+        """
+        Aplica o estado desejado: cria os usuários que faltam e depois faz as
+        associações que faltam, ambos em paralelo. Com `apenas_plano` só grava
+        o plano (status "planejado"), sem alterar nada no servidor.
+        """
+        plano = self.planejar_sincronizacao(arquivo, concorrencia)
+        if plano is None:
+            return None
+        criar, associar, erros = plano["criar"], plano["associar"], plano["erros"]
+        print(f"\n📋 Plano: {len(criar)} usuário(s) a criar, {len(associar)} associação(ões) a fazer, "
+              f"{len(erros)} erro(s)")
+        if any(plano["extras"].values()):
+            print(f"ℹ️  {plano['extras']['usuarios']} usuário(s) e {plano['extras']['associacoes']} associação(ões) "
+                  f"existem só no servidor (sync não remove)")
+        
+        totais = {"criado": 0, "associado": 0, "ignorado": 0, "erro": len(erros), "planejado": 0}
+        with ResultadoWriter(saida, self.CAMPOS_SINCRONIZACAO, stream=self.saida_dados) as writer:
+            for item in erros:
+                writer.write(item)
+                print(f"   ❌ [{item['linha']}] {item['email'] or '-'}: {item['erro']}")
+            
+            if apenas_plano:
+                for linha, registro in criar:
+                    writer.write({"linha": linha, "acao": "criar", "email": registro.get("email"), "status": "planejado"})
+                    print(f"   ➕ criar {registro.get('email')}")
+                for item in associar:
+                    writer.write(dict(item, status="planejado"))
+                    print(f"   🔗 associar {item['email']} → {item['agent']}")
+                totais["planejado"] = len(criar) + len(associar)
+                return totais
+            
+            inicio = datetime.now()
+            ids_criados: Dict[str, Optional[str]] = {}
+            try:
+                for _, resultado in self._executar_lote(criar, self._criar_usuario_registro,
+                                                        self._criar_usuario_registro_async, concorrencia):
+                    resultado["acao"] = "criar"
+                    resultado["user_id"] = resultado.pop("id")
+                    writer.write(resultado)
+                    totais[resultado["status"]] += 1
+                    if resultado["status"] == "criado":
+                        ids_criados[resultado["email"].lower()] = resultado["user_id"]
+                        print(f"   ✅ [{resultado['linha']}] {resultado['email']} (ID: {resultado['user_id']})")
+                    else:
+                        print(f"   ❌ [{resultado['linha']}] {resultado['email']}: {resultado['erro']}")
+                
+                pendentes = []
+                for item in associar:
+                    if item["user_id"] is None:
+                        item["user_id"] = ids_criados.get(item["email"].lower())
+                    if item["user_id"] is None:
+                        item.update(status="erro", erro="Usuário não foi criado")
+                        writer.write(item)
+                        totais["erro"] += 1
+                    else:
+                        pendentes.append(item)
+                
+                with self.scheduler.teto_taxa("escrita", taxa):
+                    lote = self._executar_lote(pendentes, self._associar_item, self._associar_item_async, concorrencia)
+                    for _, resultado in lote:
+                        writer.write(resultado)
+                        totais[resultado["status"]] += 1
+                        if resultado["status"] == "associado":
+                            print(f"   🔗 [{resultado['linha']}] {resultado['email']} → {resultado['agent']}")
+                        elif resultado["status"] == "erro":
+                            print(f"   ❌ [{resultado['linha']}] {resultado['email']}: {resultado['erro']}")
+            except KeyboardInterrupt:
+                logger.warning("Sync interrupted: %s", arquivo)
+                print("\n\n⚠️  Sincronização interrompida pelo usuário (ações já feitas foram gravadas)")
+        
+        if totais["criado"] or totais["associado"]:
+            self.invalidar_cache()
+        
+        duracao = (datetime.now() - inicio).total_seconds()
+        logger.info("Sync finished: %s in %.1fs", totais, duracao)
+        print(f"\n📊 Resumo: {totais['criado']} criado(s), {totais['associado']} associado(s), "
+              f"{totais['erro']} erro(s) em {duracao:.1f}s")
+        if saida != "-":
+            print(f"📄 Resultado por ação: {saida}")
+        return totais
+    
+    # ------------------------------------------------------------------
+    # Exportação (snapshots de auditoria em CSV/JSONL/Parquet)
+    # ------------------------------------------------------------------
+    
+    # Colunas de cada exportação
+    CAMPOS_EXPORTACAO = {
+        "users": ["id", "name", "email", "status", "role", "company_id", "created_at"],
+        "workers": ["id", "name", "status", "usuarios"],
+        "assignments": ["agent_id", "agent_name", "user_id", "email", "name"],
+    }
+    
+    def _usuarios_exportacao(self) -> Iterator[Dict[str, Any]]:
+        """Usuários de admin/users direto da API (sem cache), conforme chegam; um erro no meio interrompe a exportação"""
+        yield from self.iter_usuarios(quiet=True, stream=True)
+        if self.last_error:
+            raise RuntimeError(f"admin/users: {self.last_error}")
+    
+    def _detalhar_agent(self, agent: Dict[str, Any]) -> Tuple[Optional[Dict], Optional[str]]:
+        """Busca agents/{id} (com os usuários associados); executa em thread"""
+        response = self._make_request("GET", f"agents/{agent.get('id')}", quiet=True)
+        return response, self.last_error
+    
+    async def _detalhar_agent_async(self, client: AsyncApiClient,
+                                    agent: Dict[str, Any]) -> Tuple[Optional[Dict], Optional[str]]:
+        """Versão asyncio de _detalhar_agent"""
+        response = await self._make_request_async(client, "GET", f"agents/{agent.get('id')}")
+        return response, self.last_error
+    
+    def _agents_com_associacoes(self, concorrencia: int = DEFAULT_CONCURRENCY) -> list:
+        """
+        Workers com os usuários associados, direto da API (sem cache).
+        
+        Quando a listagem `agents/` não traz as associações, busca `agents/{id}`
+        de cada worker em paralelo.
+        """
+        response = self._make_request("GET", "agents/", quiet=True)
+        agents = response if isinstance(response, list) else (response or {}).get("agents")
+        if agents is None:
+            raise RuntimeError(f"agents/: {self.last_error or 'resposta inesperada'}")
+        
+        incompletos = [a for a in agents if not any(campo in a for campo in CAMPOS_ASSOCIACAO)]
+        if incompletos:
+            logger.info("Fetching details of %s agents (concurrency %s)", len(incompletos), concorrencia)
+            for agent, (detalhe, erro) in self._executar_lote(incompletos, self._detalhar_agent,
+                                                               self._detalhar_agent_async, concorrencia):
+                if not isinstance(detalhe, dict):
+                    raise RuntimeError(f"agents/{agent.get('id')}: {erro or 'resposta inesperada'}")
+                agent.update(detalhe)
+        return agents
+    
+    def _registros_exportacao(self, recurso: str, concorrencia: int) -> Iterator[Dict[str, Any]]:
+        """Linhas da exportação; usuários são gravados conforme são lidos das respostas de admin/users"""
+        if recurso == "users":
+            yield from self._usuarios_exportacao()
+            return
+        
+        agents = self._agents_com_associacoes(concorrencia)
+        if recurso == "workers":
+            for agent in agents:
+                yield dict(agent, usuarios=len(ids_usuarios_do_agent(agent)))
+            return
+        
+        # assignments: só o mapa usuário -> workers fica em memória; os usuários são percorridos em streaming
+        por_usuario: Dict[str, list] = {}
+        for agent in agents:
+            for user_id in ids_usuarios_do_agent(agent):
+                por_usuario.setdefault(user_id, []).append(agent)
+        for usuario in self._usuarios_exportacao():
+            for agent in por_usuario.pop(str(usuario.get("id")), ()):
+                yield {"agent_id": agent.get("id"), "agent_name": agent.get("name"),
+                       "user_id": usuario.get("id"), "email": usuario.get("email"),
+                       "name": usuario.get("name")}
+        # Associações de usuários que não aparecem em admin/users (ex.: removidos)
+        for user_id, lista in por_usuario.items():
+            for agent in lista:
+                yield {"agent_id": agent.get("id"), "agent_name": agent.get("name"), "user_id": user_id}
+    
+    def exportar(self, recurso: str, saida: str = "-", formato: Optional[str] = None,
+                 concorrencia: int = DEFAULT_CONCURRENCY) -> int:
+        """
+        Exporta users, workers ou assignments para CSV, JSONL ou Parquet e retorna
+        o número de linhas gravadas.
+        
+        As linhas são gravadas conforme chegam; em arquivo, a exportação é feita em
+        um temporário renomeado só ao final, para nunca deixar um snapshot pela metade.
+        """
+        campos = self.CAMPOS_EXPORTACAO[recurso]
+        # O temporário não tem a extensão do destino: o formato é decidido antes
+        formato = formato or formato_por_extensao(saida)
+        destino = saida if saida == "-" else f"{saida}.{os.getpid()}.tmp"
+        inicio = time.perf_counter()
+        total = 0
+        try:
+            with abrir_exportacao(destino, campos, formato, stream=self.saida_dados) as writer:
+                for registro in self._registros_exportacao(recurso, concorrencia):
+                    writer.write({campo: registro.get(campo) for campo in campos})
+                    total += 1
+            if destino != saida:
+                os.replace(destino, saida)
+        finally:
+            if destino != saida and os.path.exists(destino):
+                os.remove(destino)
+        logger.info("Export %s: %s rows to %s in %.2fs", recurso, total, saida, time.perf_counter() - inicio)
+        return total
+    
+    # Colunas do resumo de métricas em tabela
+    CAMPOS_METRICAS = ["method", "endpoint", "n", "erros", "erros_pct", "retentativas",
+                       "p50_ms", "p95_ms", "p99_ms", "max_ms", "connect_p50_ms", "ttfb_p50_ms"]
+    
+    def mostrar_metricas(self, formato: Optional[str] = "table", saida: Any = None):
+        """Resumo por endpoint (p50/p95/p99, erros, retentativas) ou exportação Prometheus/OpenMetrics"""
+        saida = saida or self.saida_dados
+        if formato in ("prometheus", "openmetrics"):
+            saida.write(self.metricas.prometheus(openmetrics=formato == "openmetrics"))
+            saida.flush()
+            return
+        resumo = self.metricas.resumo()
+        if formato == "table":
+            print("\n" + "="*60, file=saida)
+            print("📊 MÉTRICAS DA SESSÃO (latência em ms)", file=saida)
+            print("="*60, file=saida)
+            if not resumo:
+                print("Nenhuma requisição registrada nesta sessão", file=saida)
+                return
+        self._imprimir_registros(resumo, self.CAMPOS_METRICAS, formato, saida)
+        if formato == "table" and self.scheduler.ativo:
+            limites = [f"{nome}: {e['simultaneas']} simultâneas" + (f", {e['taxa']:g} req/s" if e["taxa"] else "")
+                       for nome, e in self.scheduler.estado().items()]
+            print(f"⚙️  Agendador: {'; '.join(limites)}", file=saida)
+        if formato == "table" and (self.leituras.acertos or self.leituras.compartilhadas):
+            print(f"♻️  Leituras evitadas: {self.leituras.acertos} da memória, "
+                  f"{self.leituras.compartilhadas} compartilhada(s) em andamento", file=saida)
+    
+    def encerrar_metricas(self, mostrar: bool = SHOW_METRICS, arquivo: Optional[str] = METRICS_FILE,
+                          saida: Any = None):
+        """Ao final da sessão: exibe o resumo e/ou grava o arquivo de métricas"""
+        if not len(self.metricas):
+            return
+        if mostrar:
+            self.mostrar_metricas("table", saida)
+        if arquivo:
+            try:
+                self.metricas.gravar(arquivo)
+                logger.info("Metrics written to %s", arquivo)
+            except OSError as e:
+                logger.warning("Could not write metrics file %s: %s", arquivo, e)
+                print(f"⚠️  Não foi possível gravar as métricas em {arquivo}: {e}", file=saida or sys.stdout)
+    
     def mostrar_menu(self):
         """Mostra o menu principal"""
         print("\n" + "="*60)
@@ -520,6 +4615,9 @@ class QubeAdminCLI:
         print("1 - Criar Usuário")
         print("2 - Alterar Senha")
         print("3 - Associar Usuário/Worker")
+        print("4 - Criar Usuários em Lote (CSV/JSONL)")
+        print("5 - Associar Usuários/Worker em Lote")
+        print("6 - Métricas da Sessão")
         print("0 - Sair")
         print("="*60)
     
@@ -532,7 +4630,7 @@ class QubeAdminCLI:
         print("║         Gerenciamento de Usuários e Workers               ║")
         print("║                                                            ║")
         print("╚════════════════════════════════════════════════════════════╝")
-        print(f"\n🌐 API: {API_BASE_URL}")
+        print(f"\n🌐 API: {self.base_url}")
         
         # Mostrar informações de log
         if not DISABLE_LOGS:
@@ -557,11 +4655,17 @@ class QubeAdminCLI:
                     self.alterar_senha()
                 elif opcao == "3":
                     self.associar_usuario_worker()
+                elif opcao == "4":
+                    self.criar_usuarios_lote_interativo()
+                elif opcao == "5":
+                    self.associar_lote_interativo()
+                elif opcao == "6":
+                    self.mostrar_metricas()
                 elif opcao == "0":
                     print("\n👋 Até logo!\n")
                     sys.exit(0)
                 else:
-                    print("\n❌ Opção inválida! Escolha 1, 2, 3 ou 0")
+                    print("\n❌ Opção inválida! Escolha de 0 a 6")
                 
                 # Pausa para continuar (com tratamento de erro)
                 try:
@@ -585,10 +4689,599 @@ class QubeAdminCLI:
                 except (EOFError, KeyboardInterrupt):
                     print("\n\n👋 Saindo...\n")
                     sys.exit(0)
+    
+    # ------------------------------------------------------------------
+    # Modo comando: subcomandos não interativos (cron, Ansible, CI)
+    # ------------------------------------------------------------------
+    
+    def executar_comando(self, args: argparse.Namespace) -> int:
+        """
+        Executa um subcomando (ou um arquivo de comandos com `batch`) e retorna o código de saída.
+        
+        Mensagens de progresso vão para stderr (ou são descartadas com --quiet);
+        a saída padrão recebe apenas os dados (listas e resultados em JSONL).
+        """
+        self.saida_dados = sys.stdout
+        destino = open(os.devnull, "w", encoding="utf-8") if args.quiet else contextlib.nullcontext(sys.stderr)
+        with destino as progresso, contextlib.redirect_stdout(progresso):
+            return self._executar_comando(args)
+    
+    def _executar_comando(self, args: argparse.Namespace) -> int:
+        """Login (se o subcomando exigir) e execução, com stdout e saida_dados já direcionados"""
+        if not getattr(args, "sem_login", False) and not self._login_nao_interativo(args.admin_email):
+            return EXIT_AUTENTICACAO
+        return getattr(self, args.handler)(args)
+    
+    @staticmethod
+    def _pode_perguntar() -> bool:
+        """Há um terminal para perguntar (e não é uma das threads de executar_em_perfis)"""
+        return sys.stdin.isatty() and threading.current_thread() is threading.main_thread()
+    
+    def _login_nao_interativo(self, email: Optional[str] = None) -> bool:
+        """Sessão salva, depois as credenciais do perfil ou QUBE_CLI_EMAIL/QUBE_CLI_PASSWORD; pergunta só se houver terminal"""
+        if self.token or self._restaurar_sessao():
+            return True
+        email = email or (self.perfil and self.perfil.email) or os.getenv("QUBE_CLI_EMAIL")
+        password = (self.perfil and self.perfil.password) or os.getenv("QUBE_CLI_PASSWORD")
+        try:
+            if not email and self._pode_perguntar():
+                email = sanitize_input(input("📧 Email: "))
+            if not password and self._pode_perguntar():
+                password = getpass("🔑 Senha: ")
+        except (EOFError, KeyboardInterrupt):
+            print("\n❌ Login cancelado")
+            return False
+        if not email or not password:
+            print("❌ Credenciais ausentes: defina QUBE_CLI_EMAIL e QUBE_CLI_PASSWORD "
+                  "(ou use QUBE_CLI_SESSION_CACHE=true com uma sessão salva)")
+            return False
+        return self.autenticar(email, password)
+    
+    def _imprimir_registros(self, registros: Iterable[Any], campos: list, formato: Optional[str],
+                            saida: Any = None):
+        """Escreve registros em table/json/jsonl/csv na saída de dados (jsonl e csv conforme são gerados)"""
+        saida = saida or self.saida_dados
+        if not formato:
+            formato = "table" if saida.isatty() else "jsonl"
+        if formato == "json":
+            json.dump(list(registros), saida, ensure_ascii=False, indent=2, default=_para_json)
+            saida.write("\n")
+        elif formato == "jsonl":
+            for registro in registros:
+                saida.write(json.dumps(registro, ensure_ascii=False, default=_para_json) + "\n")
+        elif formato == "csv":
+            writer = csv.DictWriter(saida, fieldnames=campos, extrasaction="ignore", lineterminator="\n")
+            writer.writeheader()
+            writer.writerows(registros)
+        else:
+            linhas = [[str(r.get(c, "") if r.get(c) is not None else "") for c in campos] for r in registros]
+            larguras = [max([len(c)] + [len(linha[i]) for linha in linhas]) for i, c in enumerate(campos)]
+            for linha in [[c.upper() for c in campos]] + linhas:
+                saida.write("  ".join(v.ljust(larguras[i]) for i, v in enumerate(linha)).rstrip() + "\n")
+        saida.flush()
+    
+    def _comando_criar_usuario(self, args: argparse.Namespace) -> int:
+        """user create: um usuário pelas opções ou vários de --file (CSV/JSONL, "-" = stdin)"""
+        if args.file:
+            totais = self.criar_usuarios_lote(args.file, args.output or "-", args.concurrency)
+            return EXIT_FALHA if totais["erro"] else EXIT_OK
+        if not args.email or not args.name:
+            print("❌ Informe --email e --name (ou --file)")
+            return EXIT_USO
+        
+        registro = {"email": args.email, "name": args.name, "password": args.password,
+                    "company_id": args.company_id, "send_email": not args.no_send_email}
+        resultado = self._criar_usuario_registro((1, registro))
+        with ResultadoWriter(args.output or "-", stream=self.saida_dados) as writer:
+            writer.write(resultado)
+        if resultado["status"] != "criado":
+            print(f"❌ Falha ao criar usuário {resultado['email']}: {resultado['erro']}")
+            return EXIT_FALHA
+        self.invalidar_cache()
+        print(f"✅ Usuário criado: {resultado['email']} (ID: {resultado['id']})")
+        return EXIT_OK
+    
+    def _comando_listar_usuarios(self, args: argparse.Namespace) -> int:
+        """
+        user list: usuários da empresa, opcionalmente filtrados por --search.
+        
+        Em jsonl/csv as linhas são escritas conforme os usuários chegam da API;
+        table e json esperam a lista inteira.
+        """
+        if args.search:
+            usuarios = self.iter_usuarios(search=args.search, quiet=True, stream=True)
+        else:
+            usuarios = self._gerar_usuarios(quiet=True)
+        formato = args.format or ("table" if self.saida_dados.isatty() else "jsonl")
+        if formato not in ("jsonl", "csv"):
+            usuarios = list(usuarios)
+            if self.last_error:
+                print(f"❌ Erro ao listar usuários: {self.last_error}")
+                return EXIT_FALHA
+        self._imprimir_registros(usuarios, ["id", "name", "email", "status"], formato)
+        if self.last_error:
+            print(f"❌ Erro ao listar usuários: {self.last_error}")
+            return EXIT_FALHA
+        return EXIT_OK
+    
+    def _comando_listar_workers(self, args: argparse.Namespace) -> int:
+        """worker list: workers/agents disponíveis"""
+        agents = self.listar_agents(quiet=True)
+        if agents is None:
+            print(f"❌ Erro ao listar workers: {self.last_error}")
+            return EXIT_FALHA
+        self._imprimir_registros(agents, ["id", "name", "status"], args.format)
+        return EXIT_OK
+    
+    def _comando_associar(self, args: argparse.Namespace) -> int:
+        """worker assign: --user + --worker, --file (CSV/JSONL, "-" = stdin) ou --filter-email + --worker"""
+        registros = None
+        if args.user:
+            if not args.worker:
+                print("❌ Informe --worker")
+                return EXIT_USO
+            chave = "email" if "@" in args.user else "user_id"
+            registros = [{chave: args.user, "agent": args.worker}]
+        elif not args.file and not (args.filter_email and args.worker):
+            print("❌ Informe --user e --worker, --file, ou --filter-email e --worker")
+            return EXIT_USO
+        
+        totais = self.associar_lote(args.file, args.filter_email, args.worker, args.output or "-",
+                                    args.concurrency, args.rate, registros=registros)
+        if totais is None or totais["erro"]:
+            return EXIT_FALHA
+        return EXIT_OK
+    
+    def _comando_alterar_senha(self, args: argparse.Namespace) -> int:
+        """password change: senha atual e nova por --password-stdin, variáveis de ambiente ou terminal"""
+        try:
+            if args.password_stdin:
+                linhas = sys.stdin.read().splitlines()
+                atual, nova = (linhas + ["", ""])[:2]
+            else:
+                atual = (self.perfil and self.perfil.password) or os.getenv("QUBE_CLI_PASSWORD") or ""
+                nova = os.getenv("QUBE_CLI_NEW_PASSWORD") or ""
+                if self._pode_perguntar():
+                    atual = atual or getpass("🔑 Senha atual: ")
+                    if not nova:
+                        nova = getpass(f"🔑 Nova senha (mínimo {MIN_PASSWORD_LENGTH} caracteres): ")
+                        if nova != getpass("🔑 Confirme a nova senha: "):
+                            print("❌ As senhas não coincidem!")
+                            return EXIT_USO
+        except (EOFError, KeyboardInterrupt):
+            print("\n⚠️  Operação cancelada")
+            return EXIT_FALHA
+        if not atual or not nova:
+            print("❌ Informe a senha atual e a nova (--password-stdin ou QUBE_CLI_PASSWORD/QUBE_CLI_NEW_PASSWORD)")
+            return EXIT_USO
+        return EXIT_OK if self.trocar_senha(atual, nova) else EXIT_FALHA
+    
+    def _comando_sincronizar(self, args: argparse.Namespace) -> int:
+        """sync: aplica (ou, com --plan, só mostra) as diferenças entre o arquivo e o servidor"""
+        totais = self.sincronizar(args.file, args.output or "-", args.plan, args.concurrency, args.rate)
+        if totais is None or totais["erro"]:
+            return EXIT_FALHA
+        return EXIT_OK
+    
+    def _comando_exportar(self, args: argparse.Namespace) -> int:
+        """export: snapshot de users, workers ou assignments em CSV/JSONL/Parquet"""
+        inicio = time.perf_counter()
+        try:
+            total = self.exportar(args.recurso, args.output or "-", args.format, args.concurrency)
+        except RuntimeError as e:
+            print(f"❌ Erro ao exportar {args.recurso}: {e}")
+            return EXIT_FALHA
+        destino = "saída padrão" if (args.output or "-") == "-" else args.output
+        print(f"✅ {total} linha(s) de {args.recurso} exportada(s) para {destino} "
+              f"em {time.perf_counter() - inicio:.1f}s")
+        return EXIT_OK
+    
+    def _comando_metricas(self, args: argparse.Namespace) -> int:
+        """metrics: métricas das requisições feitas até aqui nesta sessão (útil dentro de batch)"""
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                self.mostrar_metricas(args.format or "prometheus", f)
+            print(f"📄 Métricas gravadas em: {args.output}")
+        else:
+            self.mostrar_metricas(args.format)
+        return EXIT_OK
+    
+    def _comando_jobs_listar(self, args: argparse.Namespace) -> int:
+        """job list: lotes com diário em QUBE_CLI_JOBS_DIR (não exige login)"""
+        campos = ["id", "operacao", "criado_em", "atualizado_em", "concluidos", "erros", "entrada"]
+        self._imprimir_registros(JobJournal.listar(), campos, args.format)
+        return EXIT_OK
+    
+    def _comando_jobs_retomar(self, args: argparse.Namespace) -> int:
+        """job resume: reexecuta só o que falhou ou não rodou em um lote anterior"""
+        try:
+            totais = self.retomar_job(args.id, args.output, args.concurrency, args.rate)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return EXIT_USO
+        if totais is None or totais["erro"]:
+            return EXIT_FALHA
+        return EXIT_OK
+    
+    def _comando_auditoria_consultar(self, args: argparse.Namespace) -> int:
+        """audit query: eventos da trilha de auditoria local, mais recentes primeiro (não exige login)"""
+        try:
+            eventos = self.auditoria.consultar(args.user, args.worker, args.operator, args.operation,
+                                               args.since, args.until, args.limit)
+        except sqlite3.Error as e:
+            print(f"❌ Não foi possível ler a trilha de auditoria ({self.auditoria.path}): {e}")
+            return EXIT_FALHA
+        campos = AuditStore.CAMPOS if args.format == "csv" else [
+            "ts", "operacao", "status", "email", "agent", "operador", "perfil", "erro"]
+        self._imprimir_registros(eventos, campos, args.format)
+        return EXIT_OK
+    
+    def _comando_auditoria_importar(self, args: argparse.Namespace) -> int:
+        """
+        audit import: carrega na trilha os eventos dos arquivos de log.
+        
+        Sem arquivos, lê os de QUBE_CLI_LOG_DIR: o atual e os rotacionados
+        (`qube_cli.log*`) e os diários das versões anteriores (`qube_cli_AAAAMMDD.log`).
+        """
+        paths = args.files
+        if not paths:
+            padroes = (os.path.basename(LOG_FILE) + "*", "qube_cli_*.log")
+            nomes = os.listdir(LOG_DIR) if os.path.isdir(LOG_DIR) else []
+            paths = sorted((os.path.join(LOG_DIR, n) for n in nomes
+                            if any(fnmatch.fnmatch(n, padrao) for padrao in padroes)), key=os.path.getmtime)
+        if not paths:
+            print(f"❌ Nenhum arquivo de log encontrado em {LOG_DIR}")
+            return EXIT_USO
+        try:
+            totais = self.auditoria.importar_logs(paths)
+        except (OSError, sqlite3.Error) as e:
+            print(f"❌ Falha na importação: {e}")
+            return EXIT_FALHA
+        print(f"✅ {totais['importados']} evento(s) importado(s) de {totais['arquivos']} arquivo(s) "
+              f"para {self.auditoria.path}")
+        if totais["repetidos"]:
+            print(f"   {totais['repetidos']} já estavam na trilha")
+        return EXIT_OK
+    
+    def _comando_lote(self, args: argparse.Namespace) -> int:
+        """
+        batch: executa um comando por linha (mesma sintaxe da linha de comando) na mesma sessão.
+        
+        Linhas vazias e iniciadas por # são ignoradas. Para no primeiro erro, a
+        menos que --keep-going seja informado.
+        """
+        parser = criar_parser()
+        falhas = 0
+        fonte = contextlib.nullcontext(sys.stdin) if args.file == "-" else open(args.file, encoding="utf-8")
+        with fonte as linhas:
+            for numero, linha in enumerate(linhas, 1):
+                linha = linha.strip()
+                if not linha or linha.startswith("#"):
+                    continue
+                try:
+                    sub = parser.parse_args(shlex.split(linha))
+                    if sub.handler == "_comando_lote":
+                        raise ValueError("batch não pode ser aninhado")
+                    codigo = getattr(self, sub.handler)(sub)
+                except SystemExit as e:
+                    codigo = e.code if isinstance(e.code, int) else EXIT_USO
+                except ValueError as e:
+                    print(f"❌ Linha {numero}: {e}")
+                    codigo = EXIT_USO
+                logger.info("Batch command line %s: %s -> %s", numero, linha.split(' ', 2)[:2], codigo)
+                if codigo:
+                    falhas += 1
+                    print(f"❌ Linha {numero} falhou (código {codigo}): {linha}")
+                    if not args.keep_going:
+                        return codigo
+        return EXIT_FALHA if falhas else EXIT_OK
+
+
+def criar_parser() -> argparse.ArgumentParser:
+    """Parser dos subcomandos do modo não interativo"""
+    parser = argparse.ArgumentParser(
+        prog="qube_admin_cli.py",
+        description="Qube Admin CLI - sem argumentos abre o menu interativo",
+        epilog="Login: sessão salva (QUBE_CLI_SESSION_CACHE) ou QUBE_CLI_EMAIL/QUBE_CLI_PASSWORD. "
+               "Códigos de saída: 0 sucesso, 1 falha, 2 uso incorreto, 3 falha no login.")
+    parser.add_argument("--admin-email", help="Email do administrador (padrão: QUBE_CLI_EMAIL)")
+    parser.add_argument("--profile", action="append",
+                        help="Perfil de QUBE_CLI_PROFILES (padrão: QUBE_CLI_PROFILE); vários (repetidos, separados "
+                             "por vírgula ou 'all') executam o comando em paralelo em cada ambiente")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Não exibe mensagens de progresso (stderr)")
+    parser.add_argument("--metrics", action="store_true", default=SHOW_METRICS,
+                        help="Exibe o resumo das métricas de latência ao final (stderr)")
+    parser.add_argument("--metrics-file", default=METRICS_FILE,
+                        help="Grava as métricas ao final em formato Prometheus (.om: OpenMetrics)")
+    grupos = parser.add_subparsers(dest="grupo", metavar="{user,worker,password,sync,export,job,audit,metrics,batch}")
+    grupos.required = True
+    
+    def saida_lote(sub: argparse.ArgumentParser):
+        sub.add_argument("--output", help="Resultado por linha em CSV/JSONL (padrão: JSONL na saída padrão)")
+        sub.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                         help=f"Requisições em paralelo com QUBE_CLI_ADAPTIVE=false; com o agendador "
+                              f"adaptativo, o limite se ajusta até QUBE_CLI_INFLIGHT_MAX (padrão: {DEFAULT_CONCURRENCY})")
+    
+    def formato(sub: argparse.ArgumentParser):
+        sub.add_argument("--format", choices=("table", "json", "jsonl", "csv"),
+                         help="Formato da saída (padrão: table no terminal, jsonl em pipes)")
+    
+    user = grupos.add_parser("user", help="Usuários").add_subparsers(dest="acao", metavar="{create,list}")
+    user.required = True
+    create = user.add_parser("create", help="Cria um usuário ou um lote (--file)")
+    create.add_argument("--email", help="Email do usuário")
+    create.add_argument("--name", help="Nome completo")
+    create.add_argument("--password", help="Senha (omitida: gerada pela API e enviada por email)")
+    create.add_argument("--company-id", help="Empresa (padrão: a do administrador)")
+    create.add_argument("--no-send-email", action="store_true", help="Não envia email de boas-vindas")
+    create.add_argument("--file", help="CSV/JSONL com email, name, password, send_email, company_id ('-' = stdin)")
+    saida_lote(create)
+    create.set_defaults(handler="_comando_criar_usuario")
+    listar = user.add_parser("list", help="Lista os usuários da empresa")
+    listar.add_argument("--search", help="Filtra por nome ou email (no servidor)")
+    formato(listar)
+    listar.set_defaults(handler="_comando_listar_usuarios")
+    
+    worker = grupos.add_parser("worker", help="Workers").add_subparsers(dest="acao", metavar="{list,assign}")
+    worker.required = True
+    listar = worker.add_parser("list", help="Lista os workers")
+    formato(listar)
+    listar.set_defaults(handler="_comando_listar_workers")
+    assign = worker.add_parser("assign", help="Associa usuários a um worker")
+    assign.add_argument("--user", help="Email ou ID do usuário")
+    assign.add_argument("--worker", help="ID ou nome do worker")
+    assign.add_argument("--file", help="CSV/JSONL com email/user_id e agent_id/agent_name ('-' = stdin)")
+    assign.add_argument("--filter-email", help="Todos os usuários cujo email casa com o filtro (aceita *)")
+    assign.add_argument("--rate", type=float, default=DEFAULT_RATE_LIMIT,
+                        help=f"Teto de requisições por segundo, 0 = automático (padrão: {DEFAULT_RATE_LIMIT:g})")
+    saida_lote(assign)
+    assign.set_defaults(handler="_comando_associar")
+    
+    password = grupos.add_parser("password", help="Senha do administrador").add_subparsers(dest="acao", metavar="{change}")
+    password.required = True
+    change = password.add_parser("change", help="Altera a senha do usuário logado")
+    change.add_argument("--password-stdin", action="store_true",
+                        help="Lê a senha atual e a nova (uma por linha) da entrada padrão")
+    change.set_defaults(handler="_comando_alterar_senha")
+    
+    sync = grupos.add_parser("sync", help="Cria usuários e associações que faltam para chegar ao estado do arquivo")
+    sync.add_argument("file", help="CSV/JSONL com email, name, password, ... e workers (separados por ;) ('-' = stdin)")
+    sync.add_argument("--plan", action="store_true", help="Só mostra o plano, sem alterar nada")
+    sync.add_argument("--rate", type=float, default=DEFAULT_RATE_LIMIT,
+                      help=f"Teto de associações por segundo, 0 = automático (padrão: {DEFAULT_RATE_LIMIT:g})")
+    saida_lote(sync)
+    sync.set_defaults(handler="_comando_sincronizar")
+    
+    export = grupos.add_parser("export", help="Exporta usuários, workers ou associações (snapshot de auditoria)")
+    export.add_argument("recurso", choices=("users", "workers", "assignments"),
+                        help="users, workers ou assignments (usuário x worker)")
+    export.add_argument("--output", help="Arquivo .csv, .jsonl ou .parquet (padrão: JSONL na saída padrão)")
+    export.add_argument("--format", choices=("csv", "jsonl", "parquet"),
+                        help="Formato (padrão: pela extensão de --output); parquet requer pyarrow")
+    export.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"Workers detalhados em paralelo (padrão: {DEFAULT_CONCURRENCY})")
+    export.set_defaults(handler="_comando_exportar")
+    
+    job = grupos.add_parser("job", help="Lotes com diário: listar e retomar").add_subparsers(dest="acao", metavar="{list,resume}")
+    job.required = True
+    listar = job.add_parser("list", help=f"Lista os lotes registrados em {JOBS_DIR}")
+    formato(listar)
+    listar.set_defaults(handler="_comando_jobs_listar", sem_login=True)
+    resume = job.add_parser("resume", help="Retoma um lote: pula o que já foi concluído e repete o resto")
+    resume.add_argument("id", help="ID do job (veja `job list`)")
+    resume.add_argument("--output", help="Resultado por linha em CSV/JSONL (padrão: <saída original>_retomada)")
+    resume.add_argument("--concurrency", type=int, help="Requisições em paralelo (padrão: a do lote original)")
+    resume.add_argument("--rate", type=float, help="Teto de associações por segundo (padrão: o do lote original)")
+    resume.set_defaults(handler="_comando_jobs_retomar")
+    
+    audit = grupos.add_parser("audit", help="Trilha de auditoria local: consultar e importar logs").add_subparsers(
+        dest="acao", metavar="{query,import}")
+    audit.required = True
+    query = audit.add_parser("query", help=f"Consulta os eventos registrados em {AUDIT_DB}")
+    query.add_argument("--user", help="Email ou ID do usuário afetado")
+    query.add_argument("--worker", help="ID ou nome do worker")
+    query.add_argument("--operator", help="Email do administrador que executou a operação")
+    query.add_argument("--operation", choices=("criar_usuario", "trocar_senha", "associar"), help="Tipo de operação")
+    query.add_argument("--since", help="A partir de (AAAA-MM-DD ou AAAA-MM-DDTHH:MM:SS)")
+    query.add_argument("--until", help="Até (inclusive; uma data cobre o dia inteiro)")
+    query.add_argument("--limit", type=int, default=100, help="Máximo de eventos (padrão: 100)")
+    formato(query)
+    query.set_defaults(handler="_comando_auditoria_consultar", sem_login=True)
+    importar = audit.add_parser("import", help="Importa eventos dos arquivos de log (texto ou JSON)")
+    importar.add_argument("files", nargs="*",
+                          help=f"Arquivos de log (padrão: {LOG_FILE}* e qube_cli_AAAAMMDD.log em {LOG_DIR})")
+    importar.set_defaults(handler="_comando_auditoria_importar", sem_login=True)
+    
+    metrics = grupos.add_parser("metrics", help="Métricas de latência das requisições desta sessão (use em batch)")
+    metrics.add_argument("--format", choices=("table", "json", "jsonl", "csv", "prometheus", "openmetrics"),
+                         help="Formato (padrão: table no terminal, jsonl em pipes; prometheus com --output)")
+    metrics.add_argument("--output", help="Grava em arquivo em vez da saída padrão")
+    metrics.set_defaults(handler="_comando_metricas")
+    
+    batch = grupos.add_parser("batch", help="Executa um comando por linha na mesma sessão")
+    batch.add_argument("file", nargs="?", default="-", help="Arquivo de comandos (padrão: '-' = stdin)")
+    batch.add_argument("--keep-going", action="store_true", help="Continua após comandos com erro")
+    batch.set_defaults(handler="_comando_lote")
+    return parser
+
+
+class _ProgressoPorPerfil:
+    """
+    stdout das execuções em paralelo de executar_em_perfis: cada linha escrita
+    pela thread de um perfil ganha o prefixo "[perfil] "; outras threads
+    escrevem direto no destino.
+    """
+    
+    def __init__(self, destino: Any):
+        self.destino = destino
+        self._local = threading.local()
+        self._lock = threading.Lock()
+    
+    def prefixar(self, prefixo: str):
+        self._local.prefixo = prefixo
+        self._local.pendente = ""
+    
+    def write(self, texto: str) -> int:
+        prefixo = getattr(self._local, "prefixo", None)
+        if prefixo is None:
+            with self._lock:
+                return self.destino.write(texto)
+        *linhas, self._local.pendente = (self._local.pendente + texto).split("\n")
+        if linhas:
+            with self._lock:
+                self.destino.write("".join(f"{prefixo}{linha}\n" if linha else "\n" for linha in linhas))
+        return len(texto)
+    
+    def flush(self):
+        self.destino.flush()
+    
+    def isatty(self) -> bool:
+        return False
+
+
+class _DadosDoPerfil:
+    """
+    saida_dados de um perfil em executar_em_perfis: cada linha JSONL ganha o campo
+    "perfil" na frente e vai para a saída padrão assim que fica completa.
+    """
+    
+    def __init__(self, perfil: str, destino: Any, lock: threading.Lock):
+        self._campo = '{"perfil": %s' % json.dumps(perfil, ensure_ascii=False)
+        self._perfil = perfil
+        self.destino = destino
+        self._lock = lock
+        self._pendente = ""
+    
+    def write(self, texto: str) -> int:
+        *linhas, self._pendente = (self._pendente + texto).split("\n")
+        if linhas:
+            saida = []
+            for linha in linhas:
+                if linha.startswith("{"):
+                    resto = linha[1:].lstrip()
+                    saida.append(self._campo + ("" if resto.startswith("}") else ", ") + resto + "\n")
+                else:
+                    saida.append(f"{self._perfil}\t{linha}\n")
+            with self._lock:
+                self.destino.write("".join(saida))
+        return len(texto)
+    
+    def flush(self):
+        with self._lock:
+            self.destino.flush()
+    
+    def isatty(self) -> bool:
+        return False
 
 
-def main():
+def executar_em_perfis(args: argparse.Namespace, perfis: list) -> int:
+    """
+    Executa o mesmo subcomando em vários perfis ao mesmo tempo e retorna o pior código de saída.
+    
+    Cada perfil roda em sua thread com seu próprio QubeAdminCLI (login, pool de
+    conexões, agendador e métricas), então o tempo total é o do ambiente mais
+    lento. Os dados saem lado a lado em JSONL, com o campo "perfil"; o progresso
+    vai para stderr com o prefixo [perfil]. Arquivos de --output e
+    --metrics-file ganham o nome do perfil antes da extensão.
+    """
+    if getattr(args, "file", None) == "-" or getattr(args, "password_stdin", False):
+        print("❌ A entrada padrão não pode ser lida por vários perfis: informe um arquivo", file=sys.stderr)
+        return EXIT_USO
+    if getattr(args, "output", None) in (None, "-") and getattr(args, "format", "") in (None, "table", "json", "csv"):
+        args.format = "jsonl"
+    
+    destino = open(os.devnull, "w", encoding="utf-8") if args.quiet else contextlib.nullcontext(sys.stderr)
+    lock = threading.Lock()
+    codigos: Dict[str, int] = {}
+    duracoes: Dict[str, float] = {}
+    saida_fechada = threading.Event()
+    
+    dados = sys.stdout
+    with destino as stream:
+        progresso = _ProgressoPorPerfil(stream)
+        
+        def executar(perfil: Perfil):
+            progresso.prefixar(f"[{perfil.nome}] ")
+            sub = argparse.Namespace(**vars(args))
+            if getattr(sub, "output", None):
+                sub.output = perfil.arquivo(sub.output)
+            cli = QubeAdminCLI(perfil)
+            cli.saida_dados = _DadosDoPerfil(perfil.nome, dados, lock)
+            inicio = time.perf_counter()
+            try:
+                codigos[perfil.nome] = cli._executar_comando(sub)
+                cli.saida_dados.flush()
+            except BrokenPipeError:
+                # Saída fechada antes do fim (ex.: `| head`): os outros perfis descartam o restante
+                codigos[perfil.nome] = EXIT_OK
+                saida_fechada.set()
+            except (OSError, ValueError) as e:
+                print(f"❌ {type(e).__name__}: {e}")
+                codigos[perfil.nome] = EXIT_FALHA
+            except Exception as e:
+                logger.exception("Profile %s failed", perfil.nome)
+                print(f"💥 {type(e).__name__}: {e}")
+                codigos[perfil.nome] = EXIT_FALHA
+            finally:
+                duracoes[perfil.nome] = time.perf_counter() - inicio
+                cli.encerrar_metricas(args.metrics, perfil.arquivo(args.metrics_file), sys.stdout)
+        
+        logger.info("Running %s on profiles: %s", args.handler, [p.nome for p in perfis])
+        with contextlib.redirect_stdout(progresso):
+            threads = [threading.Thread(target=executar, args=(perfil,), name=f"qube-perfil-{perfil.nome}",
+                                        daemon=True) for perfil in perfis]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                # join com timeout para o Ctrl+C chegar à thread principal
+                while thread.is_alive():
+                    thread.join(0.2)
+        if saida_fechada.is_set():
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        
+        print(f"\n📊 {len(perfis)} perfil(is):", file=stream)
+        for perfil in perfis:
+            codigo = codigos.get(perfil.nome, EXIT_FALHA)
+            print(f"   {'✅' if codigo == EXIT_OK else '❌'} {perfil.nome:<12} {perfil.host}  "
+                  f"código {codigo} em {duracoes.get(perfil.nome, 0):.1f}s", file=stream)
+    return max(codigos.values(), default=EXIT_FALHA)
+
+
+def main(argv: Optional[list] = None):
     """Função principal com tratamento de erros global"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        args = criar_parser().parse_args(argv)
+        configurar_logs()
+        try:
+            perfis = Perfil.selecionar(args.profile or [os.getenv("QUBE_CLI_PROFILE") or ""])
+        except ValueError as e:
+            print(f"❌ {e}", file=sys.stderr)
+            sys.exit(EXIT_USO)
+        if len(perfis) > 1:
+            try:
+                sys.exit(executar_em_perfis(args, perfis))
+            except KeyboardInterrupt:
+                print("\n⚠️  Interrompido pelo usuário", file=sys.stderr)
+                sys.exit(130)
+        cli = QubeAdminCLI(perfis[0] if perfis else None)
+        try:
+            sys.exit(cli.executar_comando(args))
+        except KeyboardInterrupt:
+            print("\n⚠️  Interrompido pelo usuário", file=sys.stderr)
+            sys.exit(130)
+        except BrokenPipeError:
+            # Saída fechada antes do fim (ex.: `| head`): descarta o restante
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            sys.exit(EXIT_OK)
+        except (OSError, ValueError) as e:
+            print(f"❌ {type(e).__name__}: {e}", file=sys.stderr)
+            sys.exit(EXIT_FALHA)
+        finally:
+            cli.encerrar_metricas(args.metrics, args.metrics_file, sys.stderr)
+    
+    configurar_logs()
+    cli = None
     try:
         cli = QubeAdminCLI()
         cli.run()
@@ -603,6 +5296,9 @@ def main():
         print(f"❌ {type(e).__name__}: {e}")
         print(f"\n💡 Por favor, reporte este erro ao suporte com os detalhes acima")
         sys.exit(1)
+    finally:
+        if cli is not None:
+            cli.encerrar_metricas()
 
 
 if __name__ == "__main__":
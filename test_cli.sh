@@ -17,6 +17,7 @@ echo "🧪 TESTE 2: Verificar estrutura do código"
 echo "=========================================="
 echo ""
 python3 -m py_compile qube_admin_cli.py && echo "✅ Código Python válido (sem erros de sintaxe)" || echo "❌ Erro de sintaxe no código"
+python3 -m py_compile benchmark_cli.py && echo "✅ Benchmark válido (sem erros de sintaxe)" || echo "❌ Erro de sintaxe no benchmark"
 
 echo ""
 echo "=========================================="
@@ -72,6 +73,60 @@ for check, result in checks.items():
     print(f"{status} {check}")
 PYEOF
 
+echo ""
+echo "=========================================="
+echo "🧪 TESTE 5: Tempo de inicialização (-X importtime)"
+echo "=========================================="
+echo ""
+# Orçamento da importação do módulo em ms (QUBE_CLI_IMPORT_BUDGET_MS, padrão: 50)
+LOG_DIR_TESTE="$(mktemp -d)/logs"
+QUBE_CLI_LOG_DIR="$LOG_DIR_TESTE" python3 -X importtime -c "
+import sys
+import qube_admin_cli
+for modulo in ('requests', 'asyncio'):
+    status = '❌' if modulo in sys.modules else '✅'
+    print(f'{status} {modulo} não é importado junto com o módulo', file=sys.stderr)
+" 2> /tmp/qube_cli_importtime.txt
+grep -v "^import time:" /tmp/qube_cli_importtime.txt
+python3 - "$LOG_DIR_TESTE" << 'PYEOF'
+import os, sys
+orcamento = float(os.getenv("QUBE_CLI_IMPORT_BUDGET_MS", "50"))
+with open("/tmp/qube_cli_importtime.txt") as f:
+    linhas = [l.split("|") for l in f if l.startswith("import time:") and l.rstrip().endswith("| qube_admin_cli")]
+total_ms = int(linhas[-1][1]) / 1000 if linhas else 0.0
+status = "✅" if linhas and total_ms <= orcamento else "❌"
+print(f"{status} Importação do módulo: {total_ms:.1f}ms (orçamento: {orcamento:.0f}ms)")
+status = "❌" if os.path.exists(sys.argv[1]) else "✅"
+print(f"{status} Importação não cria o diretório de logs")
+PYEOF
+rm -f /tmp/qube_cli_importtime.txt
+
+echo ""
+echo "=========================================="
+echo "🧪 TESTE 6: Importação de logs para a trilha de auditoria"
+echo "=========================================="
+echo ""
+# Arquivo diário no formato das versões anteriores (qube_cli_AAAAMMDD.log), importado sem argumentos
+DIR_AUDITORIA="$(mktemp -d)"
+mkdir -p "$DIR_AUDITORIA/logs"
+cat > "$DIR_AUDITORIA/logs/qube_cli_20250101.log" << 'LOGEOF'
+2025-01-01 09:00:00,123 - QubeCLI - INFO - CLI iniciada. API: https://api.qube.aicube.ca
+2025-01-01 09:00:05,456 - QubeCLI - INFO - Login successful for user: admin@bmg.com.br
+2025-01-01 09:01:10,789 - QubeCLI - INFO - User created successfully: ana@bmg.com.br (ID: 42)
+LOGEOF
+export QUBE_CLI_LOG_DIR="$DIR_AUDITORIA/logs" QUBE_CLI_AUDIT_DB="$DIR_AUDITORIA/audit.db"
+python3 qube_admin_cli.py -q audit import
+python3 qube_admin_cli.py audit query --user ana@bmg.com.br --format jsonl | python3 -c "
+import json, sys
+eventos = [json.loads(linha) for linha in sys.stdin]
+esperado = {'ts': '2025-01-01T09:01:10.789', 'operacao': 'criar_usuario', 'status': 'criado', 'user_id': '42',
+            'operador': 'admin@bmg.com.br', 'host': 'https://api.qube.aicube.ca', 'origem': 'log:qube_cli_20250101.log'}
+ok = len(eventos) == 1 and all(eventos[0].get(c) == v for c, v in esperado.items())
+print(('✅' if ok else '❌') + ' Log diário antigo importado na trilha de auditoria')
+"
+unset QUBE_CLI_LOG_DIR QUBE_CLI_AUDIT_DB
+rm -rf "$DIR_AUDITORIA"
+
 echo ""
 echo "=========================================="
 echo "✅ TESTES CONCLUÍDOS"